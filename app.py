@@ -1,11 +1,11 @@
 import os
-import shutil
 import logging
 import sys
 from datetime import datetime
 
 from texts import APP_TEXTS, format_command_list, format_admin_features
-from config import DATA_FILE, DATA_PATH, BACKUP_PATH, ADMIN_ID
+from config import DATA_PATH, BACKUP_PATH, ADMIN_ID
+from storage import get_storage
 from database import check_data_integrity, repair_data_structure, cleanup_old_votes
 
 logging.basicConfig(level=logging.INFO)
@@ -33,12 +33,14 @@ def check_admin_config():
         logger.info(APP_TEXTS['admin_ok'].format(id=ADMIN_ID))
 
 def create_initial_backup() -> bool:
-    if not os.path.exists(DATA_FILE):
+    storage = get_storage()
+    if not storage.exists():
         return True
     try:
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        backup_file = os.path.join(BACKUP_PATH, f"initial_backup_{timestamp}.json")
-        shutil.copy2(DATA_FILE, backup_file)
+        backup_file = os.path.join(BACKUP_PATH, f"initial_backup_{timestamp}{storage.extension}")
+        storage.backup(backup_file)
+        storage.close()
         logger.info(APP_TEXTS['initial_backup'].format(file=backup_file))
         return True
     except Exception as e:
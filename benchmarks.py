@@ -0,0 +1,299 @@
+#!/usr/bin/env python3
+"""
+Замеры производительности горячих путей бота Мишок Лысый
+Работает на синтетических данных во временной папке, рабочие данные не трогает
+"""
+
+import os
+import sys
+import asyncio
+import copy
+import random
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+# Синтетические данные не должны попасть в рабочую папку data/
+os.environ["DATA_PATH"] = tempfile.mkdtemp(prefix="mishok_bench_")
+os.environ.setdefault("BOT_TOKEN", "benchmark")
+os.environ.setdefault("BACKUP_ENABLED", "false")
+
+import database
+
+def make_dataset(users: int, chats: int = 100) -> dict:
+    """Сгенерировать набор данных с заданным числом игроков"""
+    data = database.create_default_data()
+    now = time.time()
+    total = 0
+
+    for uid in range(1, users + 1):
+        shleps = random.randint(0, 5000)
+        total += shleps
+        data["users"][str(uid)] = {
+            "username": f"user_{uid}",
+            "total_shleps": shleps,
+            "max_damage": random.randint(10, 500),
+            "last_shlep": int(now) - random.randint(0, 30 * 86400),
+            "bonus_damage": 0
+        }
+
+        if not chats:
+            continue
+        chat = data["chats"].setdefault(str(-1000 - uid % chats), {"total_shleps": 0, "users": {}, "max_damage": 0, "max_damage_user": None})
+        chat["total_shleps"] += shleps
+        chat["users"][str(uid)] = {"username": f"user_{uid}", "total_shleps": shleps}
+
+    data["global_stats"]["total_shleps"] = total
+    data["global_stats"]["total_users"] = users
+    return data
+
+def install_dataset(data: dict) -> None:
+    """Подменить данные в памяти без записи на диск"""
+    with database._data_lock:
+        database._set_data_locked(data)
+
+def measure(func, repeat: int) -> float:
+    """Среднее время вызова в микросекундах"""
+    start = time.perf_counter()
+    for i in range(repeat):
+        func(i)
+    return (time.perf_counter() - start) / repeat * 1_000_000
+
+def print_result(title: str, before: float, after: float) -> None:
+    print(f"\n📊 {title}")
+    print(f"   до:    {before:12.1f} мкс")
+    print(f"   после: {after:12.1f} мкс")
+    if after > 0:
+        print(f"   ускорение: x{before / after:.1f}")
+
+# ==================== ГОЛОСОВАНИЯ ====================
+
+def bench_vote_click(users: int, repeat: int) -> None:
+    """Клик по кнопке голосования: глубокая копия всех данных против транзакции"""
+    install_dataset(make_dataset(users))
+    vote_id = database.create_vote(-1001, "Шлёпнуть Мишка?")
+
+    votes_yes = []
+
+    def legacy_click(i):
+        # Прежний путь: load_data() + правка списка голосов + copy.deepcopy() всего набора в save_data()
+        data = database.load_data()
+        user_id_str = str(i % users + 1)
+        if user_id_str in votes_yes:
+            votes_yes.remove(user_id_str)
+        votes_yes.append(user_id_str)
+        data["votes"] = dict(data["votes"], legacy={"votes_yes": votes_yes, "votes_no": []})
+        with database._data_lock:
+            copy.deepcopy(data)
+
+    def click(i):
+        database.add_user_vote(vote_id, i % users + 1, "yes")
+
+    before = measure(legacy_click, max(1, repeat // 10))
+    after = measure(click, repeat)
+    print_result(f"Клик голосования, {users:,} игроков", before, after)
+
+def bench_active_vote(votes: int, repeat: int) -> None:
+    """Активное голосование чата: обход всех голосований против индекса по чату"""
+    data = make_dataset(1000)
+    now = int(time.time())
+    for i in range(votes):
+        vote_id = f"{-2000 - i}_{now - i}"
+        data["votes"][vote_id] = {
+            "id": vote_id, "chat_id": -2000 - i, "question": "?",
+            "created_at": now - i, "ends_at": now - i + 300,
+            "ballots": {}, "yes_count": 0, "no_count": 0, "active": i % 10 == 0, "message_id": None
+        }
+    install_dataset(data)
+    snapshot_data = database.read_data()
+
+    def legacy_lookup(i):
+        # Прежний get_active_chat_vote: обход всех голосований
+        chat_id = -2000 - i % votes
+        for vote in snapshot_data["votes"].values():
+            if vote.get("chat_id") == chat_id and vote.get("active", False) and vote["ends_at"] > time.time():
+                return vote
+        return None
+
+    def indexed_lookup(i):
+        return database.get_active_chat_vote(-2000 - i % votes)
+
+    for i in range(0, votes, max(1, votes // 20)):
+        assert legacy_lookup(i) == indexed_lookup(i)
+
+    before = measure(legacy_lookup, max(1, repeat // 100))
+    after = measure(indexed_lookup, repeat)
+    print_result(f"Поиск активного голосования, {votes:,} голосований", before, after)
+
+# ==================== ШЛЁПКИ ====================
+
+def bench_shlep(users: int, repeat: int) -> None:
+    """Путь шлёпка: отдельные чтения + add_shlep против одной операции shlep()"""
+    install_dataset(make_dataset(users))
+
+    def legacy_shlep(i):
+        # Прежний путь perform_shlep_action: статистика, копия данных ради бонуса, запись
+        user_id = i % users + 1
+        _, cnt, _ = database.get_user_stats(user_id)
+        lvl = database.calc_level(cnt)
+        data = database.load_data()
+        bonus = data["users"].get(str(user_id), {}).get("bonus_damage", 0)
+        database.add_shlep(user_id, f"user_{user_id}", random.randint(lvl['min'], lvl['max']) + bonus, -1001)
+
+    def atomic_shlep(i):
+        user_id = i % users + 1
+        database.shlep(user_id, f"user_{user_id}", -1001)
+
+    before = measure(legacy_shlep, repeat)
+    after = measure(atomic_shlep, repeat)
+    print_result(f"Шлёпок, {users:,} игроков", before, after)
+    print(f"   шлёпков в секунду: {1_000_000 / before:,.0f} → {1_000_000 / after:,.0f}")
+
+    import db
+
+    async def burst():
+        # Одновременные клики: писатель применяет их пачками
+        await asyncio.gather(*(db.shlep(i % users + 1, f"user_{i}", -1001) for i in range(repeat)))
+
+    start = time.perf_counter()
+    asyncio.run(burst())
+    elapsed = time.perf_counter() - start
+    print(f"   через единственного писателя: {repeat / elapsed:,.0f} шлёпков в секунду")
+
+# ==================== РЕЙТИНГ ====================
+
+def bench_top_users(users: int, repeat: int) -> None:
+    """Топ игроков: сортировка всех игроков против поддерживаемого рейтинга"""
+    start = time.perf_counter()
+    install_dataset(make_dataset(users, chats=0))
+    print(f"\n⏳ Загрузка {users:,} игроков и построение рейтинга: {time.perf_counter() - start:.1f} с")
+    data = database.load_data()
+
+    def legacy_top(i):
+        users_list = [
+            (user_data.get("username", f"Игрок_{user_id}"), user_data.get("total_shleps", 0))
+            for user_id, user_data in data["users"].items()
+        ]
+        users_list.sort(key=lambda x: x[1], reverse=True)
+        return users_list[:10]
+
+    def indexed_top(i):
+        return database.get_top_users(10)
+
+    assert [total for _, total in legacy_top(0)] == [total for _, total in indexed_top(0)]
+
+    before = measure(legacy_top, max(1, repeat // 100))
+    after = measure(indexed_top, repeat)
+    print_result(f"Топ-10, {users:,} игроков", before, after)
+
+    board = database._leaderboard
+    update = measure(lambda i: board.update(str(i % users + 1), board.score(str(i % users + 1)) + 1), repeat)
+    print(f"   обновление рейтинга шлёпком: {update:.2f} мкс")
+
+def bench_comparison(users: int, repeat: int) -> None:
+    """Место и процентиль игрока: сортировка всех счётов против индекса счётов"""
+    install_dataset(make_dataset(users, chats=0))
+    data = database.load_data()
+
+    def legacy_comparison(i):
+        # Прежний get_comparison_stats: список счётов, сортировка и поиск места
+        user_data = data["users"].get(str(i % (users + 10) + 1))
+        user_shleps = user_data.get("total_shleps", 0) if user_data else 0
+        all_shleps = [udata["total_shleps"] for udata in data["users"].values() if "total_shleps" in udata]
+        total_users = len(all_shleps)
+        sorted_shleps = sorted(all_shleps, reverse=True)
+        try:
+            rank = sorted_shleps.index(user_shleps) + 1
+        except ValueError:
+            rank = total_users + 1
+        percentile = (total_users - rank) / (total_users - 1) * 100 if total_users > 1 else 100
+        return {
+            "total_users": total_users,
+            "avg_shleps": round(sum(all_shleps) / total_users, 1),
+            "rank": rank,
+            "percentile": round(percentile, 1)
+        }
+
+    def indexed_comparison(i):
+        return database.get_comparison_stats(i % (users + 10) + 1)
+
+    for i in random.sample(range(users + 10), 20):
+        assert legacy_comparison(i) == indexed_comparison(i)
+
+    before = measure(legacy_comparison, max(1, repeat // 100))
+    after = measure(indexed_comparison, repeat)
+    print_result(f"Сравнение игрока, {users:,} игроков", before, after)
+
+# ==================== МОДЕРАЦИЯ ====================
+
+def bench_banned_words(words: int, repeat: int) -> None:
+    """Проверка сообщения на банворды: цикл по словам против скомпилированного набора"""
+    from wordfilter import WordMatcher
+
+    alphabet = "абвгдежзийклмнопрстуфхцчшщыэюя"
+    rnd = random.Random(42)
+    banned = list({"".join(rnd.choice(alphabet) for _ in range(rnd.randint(5, 10))) for _ in range(words)})
+    vocabulary = ["мишок", "шлёп", "лысый", "привет", "как", "дела", "голосование", "чат", "сегодня", "топ"]
+    messages = []
+    for i in range(1000):
+        text = " ".join(rnd.choice(vocabulary) for _ in range(rnd.randint(5, 30)))
+        if i % 50 == 0:
+            text += " " + rnd.choice(banned)
+        messages.append(text)
+
+    start = time.perf_counter()
+    matcher = WordMatcher(banned)
+    print(f"\n⏳ Сборка набора из {len(banned):,} банвордов: {(time.perf_counter() - start) * 1000:.1f} мс")
+
+    def legacy_check(i):
+        # Прежний check_banned_messages: подстрока для каждого слова
+        message_text = messages[i % len(messages)].lower()
+        for word in banned:
+            if word.lower() in message_text:
+                return word
+        return None
+
+    def compiled_check(i):
+        return matcher.search(messages[i % len(messages)].lower())
+
+    for i in range(len(messages)):
+        assert (legacy_check(i) is None) == (compiled_check(i) is None)
+
+    before = measure(legacy_check, max(1, repeat // 10))
+    after = measure(compiled_check, repeat)
+    print_result(f"Проверка сообщения, {len(banned):,} банвордов", before, after)
+    print(f"   сообщений в секунду: {1_000_000 / before:,.0f} → {1_000_000 / after:,.0f}")
+
+# ==================== КОМАНДНАЯ СТРОКА ====================
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Замеры производительности бота Мишок Лысый")
+    parser.add_argument("--vote-click", action="store_true", help="Задержка клика голосования")
+    parser.add_argument("--vote-lookup", action="store_true", help="Поиск активного голосования чата")
+    parser.add_argument("--shlep", action="store_true", help="Пропускная способность шлёпков")
+    parser.add_argument("--top", action="store_true", help="Топ игроков на 1 000 000 игроков")
+    parser.add_argument("--rank", action="store_true", help="Место и процентиль игрока в /mystats")
+    parser.add_argument("--banned-words", action="store_true", help="Проверка сообщений на банворды")
+    parser.add_argument("--words", type=int, default=10_000, help="Количество банвордов в чате")
+    parser.add_argument("--users", type=int, default=100_000, help="Количество синтетических игроков")
+    parser.add_argument("--repeat", type=int, default=200, help="Количество повторов")
+
+    args = parser.parse_args()
+    run_all = not (args.vote_click or args.vote_lookup or args.shlep or args.top or args.rank
+                   or args.banned_words)
+
+    if args.vote_click or run_all:
+        bench_vote_click(args.users, args.repeat)
+    if args.vote_lookup or run_all:
+        bench_active_vote(args.users // 10, args.repeat * 10)
+    if args.shlep or run_all:
+        bench_shlep(args.users, args.repeat * 10)
+    if args.top or run_all:
+        bench_top_users(max(args.users, 1_000_000), args.repeat * 10)
+    if args.rank or run_all:
+        bench_comparison(args.users, args.repeat * 10)
+    if args.banned_words or run_all:
+        bench_banned_words(args.words, args.repeat * 10)
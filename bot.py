@@ -3,34 +3,28 @@ import random
 import sys
 import os
 import asyncio
-from datetime import datetime, timedelta
+import time
+from datetime import datetime
 from functools import wraps
 from collections import deque
 from typing import Dict, Deque, Optional
 
 from telegram import Update, User
-from telegram.ext import Application, CommandHandler, MessageHandler, CallbackQueryHandler, ContextTypes, filters
+from telegram.ext import Application, CommandHandler, MessageHandler, CallbackQueryHandler, ChatMemberHandler, ContextTypes, filters
 from telegram.constants import ParseMode
 from telegram.helpers import escape_markdown
 from telegram.error import RetryAfter
 
-from config import BOT_TOKEN, DATA_FILE, BACKUP_PATH, LOG_FILE, ADMIN_ID
-from database import (
-    add_shlep, get_stats, get_top_users, get_user_stats, get_chat_stats,
-    get_chat_top_users, backup_database, check_data_integrity,
-    repair_data_structure, create_safe_backup, get_backup_list,
-    get_database_size, create_vote, get_vote, get_active_chat_vote,
-    add_user_vote, finish_vote, update_vote_message_id,
-    ban_user, unban_user, get_banned_users, add_banned_word, get_banned_words,
-    add_auto_shlep_user, remove_auto_shlep_user, get_auto_shlep_users
-)
+from config import BOT_TOKEN, ADMIN_ID
+import db
+from database import calc_level
 
-from utils import cache, get_comparison_stats, format_file_size, format_number, create_progress_bar
+from utils import cache, vote_edits, bot_rights, message_deleter, format_file_size, format_number, create_progress_bar
 from keyboard import (
     get_shlep_session_keyboard, get_shlep_start_keyboard, 
     get_chat_vote_keyboard, get_main_reply_keyboard, 
     get_main_inline_keyboard, get_admin_keyboard, 
-    get_confirmation_keyboard, get_cleanup_keyboard
+    get_confirmation_keyboard, get_cleanup_keyboard, get_chat_top_keyboard
 )
 
 from texts import (
@@ -101,43 +95,6 @@ def handler(admin=False, chat_only=False):
     return decorator
 
 
-def calc_level(cnt):
-    if cnt is None or cnt < 0:
-        cnt = 0
-    
-    if cnt == 0:
-        return {
-            'level': 1,
-            'progress': 0,
-            'min': 10,
-            'max': 25,
-            'next': 10
-        }
-    
-    level = max(1, (cnt - 1) // 10 + 1)
-    
-    progress = (cnt % 10) * 10 if cnt % 10 != 0 else 0
-    
-    if level > 1000:
-        min_dmg = 10 + 1000 * 2 + (level - 1000) * 1
-        max_dmg = 15 + 1000 * 3 + (level - 1000) * 2
-    else:
-        min_dmg = int(10 * (1.02 ** min(level - 1, 100)))
-        max_dmg = int(20 * (1.08 ** min(level - 1, 100)))
-    
-    if max_dmg <= min_dmg:
-        max_dmg = min_dmg + 10
-    
-    next_shleps = 10 - (cnt % 10) if cnt % 10 != 0 else 10
-    
-    return {
-        'level': level,
-        'progress': progress,
-        'min': min_dmg,
-        'max': max_dmg,
-        'next': next_shleps
-    }
-
 def level_title(lvl):
     for threshold, (title, advice) in sorted(LEVEL_TITLES.items(), reverse=True):
         if lvl >= threshold:
@@ -147,32 +104,16 @@ def level_title(lvl):
 def get_reaction():
     return random.choice(MISHOK_REACTIONS)
 
-async def perform_shlep_action(user_id: int, username: str, chat_id: Optional[int]) -> tuple:
-    """Выполнить действие шлепка и вернуть результаты"""
-    _, cnt, _ = get_user_stats(user_id)
-    lvl = calc_level(cnt)
-
-    base_dmg = random.randint(lvl['min'], lvl['max'])
-
-    data = load_data()
-    user_data = data["users"].get(str(user_id), {})
-    bonus_damage = user_data.get("bonus_damage", 0)
-
-    total_damage = base_dmg + bonus_damage
-
-    try:
-        total, cnt, max_dmg = add_shlep(user_id, username, total_damage, chat_id)
-    except KeyError as e:
-        logger.error(f"Ошибка KeyError при добавлении шлёпка: {e}")
-        repair_data_structure()
-        total, cnt, max_dmg = add_shlep(user_id, username, total_damage, chat_id)
-
-    await cache.delete("global_stats")
-    await cache.delete(f"user_stats_{user_id}")
+async def perform_shlep_action(user_id: int, username: str, chat_id: Optional[int]) -> Optional[dict]:
+    """Выполнить шлёпок одной операцией хранилища и сбросить кэш статистики"""
+    result = await db.shlep(user_id, username, chat_id)
+    
+    keys = ["global_stats", f"user_stats_{user_id}"]
     if chat_id:
-        await cache.delete(f"chat_stats_{chat_id}")
-
-    return total_damage, cnt, max_dmg, lvl
+        keys.append(f"chat_stats_{chat_id}")
+    await cache.delete_many(*keys)
+    
+    return result
 
 async def send_progress(message, text, progress=0):
     bar = create_progress_bar(progress)
@@ -202,15 +143,16 @@ async def shlep_task(update: Update, context: ContextTypes.DEFAULT_TYPE, edit_me
         user_info = get_user_info(user)
 
         chat_id = chat.id if chat and chat.type != "private" else None
-        total_damage, cnt, max_dmg, lvl = await perform_shlep_action(
-            user.id, user_info['username'], chat_id
-        )
+        result = await perform_shlep_action(user.id, user_info['username'], chat_id)
+        if not result:
+            await msg.reply_text(ERROR_TEXTS['shlep'])
+            return
         
-        rec = "\n🏆 НОВЫЙ РЕКОРД!\n" if total_damage > max_dmg else ""
-        lvl = calc_level(cnt)
+        rec = "\n🏆 НОВЫЙ РЕКОРД!\n" if result['record'] else ""
+        lvl = result['level']
         title, _ = level_title(lvl['level'])
         
-        new_text = f"{get_reaction()}{rec}\n💥 Урон: {total_damage}\n👤 {user_info['name']}: {cnt} шлёпков\n🎯 Уровень {lvl['level']} ({title})"
+        new_text = f"{get_reaction()}{rec}\n💥 Урон: {result['damage']}\n👤 {user_info['name']}: {result['user_shleps']} шлёпков\n🎯 Уровень {lvl['level']} ({title})"
         
         kb = get_shlep_session_keyboard()
         
@@ -317,10 +259,10 @@ async def stats(update: Update, context: ContextTypes.DEFAULT_TYPE, msg):
     if cached:
         total, last, maxd, maxu, maxdt = cached
     else:
-        total, last, maxd, maxu, maxdt = get_stats()
+        total, last, maxd, maxu, maxdt = await db.get_stats()
         await cache.set("global_stats", (total, last, maxd, maxu, maxdt))
     
-    top = get_top_users(10)
+    top = await db.get_top_users(10)
     
     maxu_safe = escape_text(maxu or 'Нет')
     
@@ -348,7 +290,7 @@ async def level(update: Update, context: ContextTypes.DEFAULT_TYPE, msg):
         if cached:
             username, cnt, last_shlep = cached
         else:
-            username, cnt, last_shlep = get_user_stats(user.id)
+            username, cnt, last_shlep = await db.get_user_stats(user.id)
             await cache.set(f"user_stats_{user.id}", (username, cnt, last_shlep))
         
         if cnt is None:
@@ -358,16 +300,7 @@ async def level(update: Update, context: ContextTypes.DEFAULT_TYPE, msg):
         title, advice = level_title(lvl['level'])
         bar = create_progress_bar(lvl['progress'])
         
-        last_date_str = None
-        if last_shlep:
-            if isinstance(last_shlep, datetime):
-                last_date_str = last_shlep.strftime('%d.%m.%Y %H:%M')
-            elif isinstance(last_shlep, str):
-                try:
-                    dt_obj = datetime.fromisoformat(last_shlep.replace('Z', '+00:00'))
-                    last_date_str = dt_obj.strftime('%d.%m.%Y %H:%M')
-                except Exception:
-                    last_date_str = last_shlep
+        last_date_str = last_shlep.strftime('%d.%m.%Y %H:%M') if last_shlep else None
         
         text = format_level_text(
             user_info['name'], 
@@ -389,13 +322,31 @@ async def level(update: Update, context: ContextTypes.DEFAULT_TYPE, msg):
         logger.error(f"Ошибка в команде level: {e}", exc_info=True)
         await msg.reply_text("⚠️ Произошла ошибка при получении уровня. Попробуйте позже.")
 
+def format_favourite_hour(favourite) -> str:
+    if not favourite:
+        return ""
+    hour, count = favourite
+    return "\n" + COMMAND_TEXTS['my_stats']['favourite_hour'].format(start=hour, end=(hour + 1) % 24, count=count)
+
+def format_activity_chart(days) -> str:
+    """Шлёпки по дням столбиками относительно самого активного дня"""
+    peak = max((count for _, count in days), default=0)
+    if not peak:
+        return ""
+    text = f"\n\n{COMMAND_TEXTS['chat_stats']['activity_header']}"
+    for day, count in days:
+        text += "\n" + COMMAND_TEXTS['chat_stats']['activity_day'].format(
+            day=f"{day[8:10]}.{day[5:7]}", bar=create_progress_bar(count * 100 // peak), count=count
+        )
+    return text
+
 @handler()
 async def my_stats(update: Update, context: ContextTypes.DEFAULT_TYPE, msg):
     user = update.effective_user
     
-    username, cnt, last_shlep = get_user_stats(user.id)
+    username, cnt, last_shlep = await db.get_user_stats(user.id)
     lvl = calc_level(cnt)
-    compare_stats = get_comparison_stats(user.id)
+    compare_stats = await db.get_comparison_stats(user.id)
     
     text = f"{COMMAND_TEXTS['my_stats']['header']}\n"
     text += f"{COMMAND_TEXTS['my_stats']['player'].format(name=user.first_name)}\n"
@@ -415,6 +366,8 @@ async def my_stats(update: Update, context: ContextTypes.DEFAULT_TYPE, msg):
             date_str = str(last_shlep)
         text += f"\n{COMMAND_TEXTS['my_stats']['last_shlep'].format(date=date_str)}"
     
+    text += format_favourite_hour(await db.get_favourite_hour(user_id=user.id))
+    
     await msg.reply_text(text)
 
 @handler(chat_only=True)
@@ -425,7 +378,7 @@ async def chat_stats(update: Update, context: ContextTypes.DEFAULT_TYPE, msg):
     if cached:
         cs = cached
     else:
-        cs = get_chat_stats(chat.id)
+        cs = await db.get_chat_stats(chat.id)
         await cache.set(f"chat_stats_{chat.id}", cs)
     
     if not cs:
@@ -437,20 +390,42 @@ async def chat_stats(update: Update, context: ContextTypes.DEFAULT_TYPE, msg):
         text += f"{COMMAND_TEXTS['chat_stats']['shleps'].format(count=format_number(cs.get('total_shleps', 0)))}\n"
         text += f"{COMMAND_TEXTS['chat_stats']['record_damage'].format(damage=cs.get('max_damage', 0))}\n"
         text += f"{COMMAND_TEXTS['chat_stats']['record_user'].format(user=max_user_safe)}"
+        text += format_activity_chart(cs.get('activity', []))
     
     await msg.reply_text(text)
 
+def parse_chat_top_callback(data: str):
+    """chat_top:<страница>[:<счёт>:<позиция>] -> (страница, курсор)"""
+    parts = data.split(":")[1:]
+    try:
+        page = int(parts[0]) if parts else 1
+        cursor = (int(parts[1]), int(parts[2])) if len(parts) == 3 else None
+    except ValueError:
+        return 1, None
+    return page, cursor
+
 @handler(chat_only=True)
 async def chat_top(update: Update, context: ContextTypes.DEFAULT_TYPE, msg):
     chat = update.effective_chat
-    top = get_chat_top_users(chat.id, 10)
+    query = update.callback_query
+    
+    # Листание кнопками ◀▶ правит то же сообщение
+    paging = bool(query and query.data and query.data.startswith("chat_top:"))
+    if paging:
+        page, cursor = parse_chat_top_callback(query.data)
+    else:
+        page, cursor = 1, None
+        if context.args and context.args[0].isdigit():
+            page = int(context.args[0])
+    
+    result = await db.get_chat_top_page(chat.id, page=page, cursor=cursor)
     
-    if not top:
+    if not result['items']:
         await msg.reply_text(COMMAND_TEXTS['chat_top']['empty'])
         return
     
     text = COMMAND_TEXTS['chat_top']['header']
-    for i, (u, c) in enumerate(top, 1):
+    for i, u, c in result['items']:
         u_safe = escape_text(u)
         lvl = calc_level(c)
         medal = ["🥇", "🥈", "🥉"][i-1] if i <= 3 else ""
@@ -458,37 +433,91 @@ async def chat_top(update: Update, context: ContextTypes.DEFAULT_TYPE, msg):
         text += f"   📊 {format_number(c)} | Ур. {lvl['level']}\n"
         text += f"   ⚡ Урон: {lvl['min']}-{lvl['max']}\n\n"
     
-    await msg.reply_text(text)
+    if result['pages'] > 1:
+        text += COMMAND_TEXTS['chat_top']['page'].format(page=result['page'], pages=result['pages'])
+    
+    kb = get_chat_top_keyboard(result['page'], result['pages'], result['next'], result['prev'])
+    
+    if paging:
+        try:
+            await msg.edit_text(text, reply_markup=kb)
+        except Exception as e:
+            if "Message is not modified" not in str(e):
+                raise
+    else:
+        await msg.reply_text(text, reply_markup=kb)
+
+# ==================== ТАЙМЕРЫ ГОЛОСОВАНИЙ ====================
+# Сроки голосований ведёт JobQueue (один планировщик на все чаты),
+# после перезапуска таймеры восстанавливаются из данных
+
+def _vote_job_name(vote_id: str) -> str:
+    return f"vote_{vote_id}"
+
+def schedule_vote_expiry(job_queue, vote_data) -> None:
+    """Поставить завершение голосования на ends_at"""
+    job_queue.run_once(
+        vote_expired,
+        when=max(0, vote_data["ends_at"] - time.time()),
+        data=vote_data["id"],
+        name=_vote_job_name(vote_data["id"]),
+        chat_id=vote_data.get("chat_id")
+    )
 
-async def vote_timer(vote_id: str, chat_id: int, message_id: int, context: ContextTypes.DEFAULT_TYPE):
+def cancel_vote_expiry(job_queue, vote_id: str) -> None:
+    if job_queue is None:
+        return
+    for job in job_queue.get_jobs_by_name(_vote_job_name(vote_id)):
+        job.schedule_removal()
+
+async def vote_expired(context: ContextTypes.DEFAULT_TYPE):
+    vote_id = context.job.data
     try:
-        vote = get_vote(vote_id)
-        if not vote:
-            return
+        vote_data = await db.get_vote(vote_id)
+        if vote_data and vote_data.get("active", False):
+            await finish_vote_task(vote_id, vote_data.get("chat_id"), vote_data.get("message_id"), context)
+    except Exception as e:
+        logger.error(f"Ошибка в таймере голосования: {e}")
+
+async def recover_votes(application: Application):
+    """После перезапуска: завершить просроченные голосования одной пачкой, остальным поставить таймеры"""
+    try:
+        pending = await db.get_pending_votes()
+        now = time.time()
+        overdue = [vote_data["id"] for vote_data in pending if vote_data["ends_at"] <= now]
         
-        ends_at = datetime.fromisoformat(vote["ends_at"])
-        wait_time = (ends_at - datetime.now()).total_seconds()
+        for vote_data in pending:
+            if vote_data["ends_at"] > now:
+                schedule_vote_expiry(application.job_queue, vote_data)
         
-        if wait_time > 0:
-            await asyncio.sleep(wait_time)
+        for vote_data in await db.finish_votes(overdue):
+            await announce_vote_result(application.bot, vote_data)
         
-        vote = get_vote(vote_id)
-        if vote and vote.get("active", False):
-            await finish_vote_task(vote_id, chat_id, message_id, context)
-            
-    except asyncio.CancelledError:
-        logger.info(f"Таймер голосования {vote_id} отменён")
+        if pending:
+            logger.info(f"Голосования после перезапуска: {len(pending) - len(overdue)} с таймером, {len(overdue)} завершено")
     except Exception as e:
-        logger.error(f"Ошибка в таймере голосования: {e}")
+        logger.error(f"Ошибка восстановления голосований: {e}")
 
 async def finish_vote_task(vote_id: str, chat_id: int, message_id: int, context: ContextTypes.DEFAULT_TYPE):
+    cancel_vote_expiry(context.job_queue, vote_id)
     try:
-        vote = finish_vote(vote_id)
+        vote = await db.finish_vote(vote_id)
         if not vote:
             return
         
-        yes_count = len(vote.get("votes_yes", []))
-        no_count = len(vote.get("votes_no", []))
+        await announce_vote_result(context.bot, vote, chat_id, message_id)
+    except Exception as e:
+        logger.error(f"Ошибка завершения голосования: {e}")
+
+async def announce_vote_result(bot, vote, chat_id: Optional[int] = None, message_id: Optional[int] = None):
+    """Показать итог голосования в его сообщении (или новым сообщением)"""
+    vote_id = vote["id"]
+    chat_id = chat_id or vote.get("chat_id")
+    message_id = message_id or vote.get("message_id")
+    vote_edits.forget((chat_id, message_id))
+    try:
+        yes_count = vote.get("yes_count", 0)
+        no_count = vote.get("no_count", 0)
         total_votes = yes_count + no_count
         
         if total_votes == 0:
@@ -511,7 +540,7 @@ async def finish_vote_task(vote_id: str, chat_id: int, message_id: int, context:
         text = format_vote_results(vote['question'], yes_count, no_count, result_key, action_key)
         
         try:
-            await context.bot.edit_message_text(
+            await bot.edit_message_text(
                 chat_id=chat_id,
                 message_id=message_id,
                 text=text,
@@ -521,7 +550,7 @@ async def finish_vote_task(vote_id: str, chat_id: int, message_id: int, context:
         except Exception as e:
             if "Message to edit not found" not in str(e):
                 logger.error(f"Ошибка обновления сообщения голосования: {e}")
-                await context.bot.send_message(
+                await bot.send_message(
                     chat_id=chat_id,
                     text=text,
                     parse_mode=ParseMode.MARKDOWN
@@ -531,7 +560,7 @@ async def finish_vote_task(vote_id: str, chat_id: int, message_id: int, context:
             async def send_mishok_message():
                 await asyncio.sleep(1)
                 try:
-                    await context.bot.send_message(chat_id=chat_id, text=mishok_text)
+                    await bot.send_message(chat_id=chat_id, text=mishok_text)
                 except Exception as e:
                     logger.error(f"Ошибка отправки сообщения Мишка: {e}")
             
@@ -544,18 +573,17 @@ async def finish_vote_task(vote_id: str, chat_id: int, message_id: int, context:
 
 @handler(chat_only=True)
 async def vote(update: Update, context: ContextTypes.DEFAULT_TYPE, msg):
-    active_vote = get_active_chat_vote(msg.chat_id)
+    active_vote = await db.get_active_chat_vote(msg.chat_id)
     if active_vote:
-        ends_at = datetime.fromisoformat(active_vote["ends_at"])
-        time_left = int((ends_at - datetime.now()).total_seconds())
+        time_left = int(active_vote["ends_at"] - time.time())
         minutes = time_left // 60
         seconds = time_left % 60
         
         await msg.reply_text(
             VOTE_TEXTS['active_exists'].format(
                 question=active_vote['question'],
-                yes_count=len(active_vote.get('votes_yes', [])),
-                no_count=len(active_vote.get('votes_no', [])),
+                yes_count=active_vote.get('yes_count', 0),
+                no_count=active_vote.get('no_count', 0),
                 minutes=minutes,
                 seconds=seconds
             )
@@ -565,7 +593,7 @@ async def vote(update: Update, context: ContextTypes.DEFAULT_TYPE, msg):
     question = " ".join(context.args) if context.args else "Шлёпнуть Мишка?"
     question_safe = escape_text(question)
     
-    vote_id = create_vote(msg.chat_id, question, duration_minutes=5)
+    vote_id = await db.create_vote(msg.chat_id, question, duration_minutes=5)
     
     if not vote_id:
         await msg.reply_text(ERROR_TEXTS['vote'])
@@ -579,15 +607,17 @@ async def vote(update: Update, context: ContextTypes.DEFAULT_TYPE, msg):
         parse_mode=ParseMode.MARKDOWN
     )
     
-    update_vote_message_id(vote_id, sent_message.message_id)
+    await db.update_vote_message_id(vote_id, sent_message.message_id)
     
-    asyncio.create_task(vote_timer(vote_id, msg.chat_id, sent_message.message_id, context))
+    vote_data = await db.get_vote(vote_id)
+    if vote_data:
+        schedule_vote_expiry(context.job_queue, vote_data)
     
     logger.info(f"Создано голосование: {question} в чате {msg.chat_id}")
 
 @handler(chat_only=True)
 async def vote_end(update: Update, context: ContextTypes.DEFAULT_TYPE, msg):
-    active_vote = get_active_chat_vote(msg.chat_id)
+    active_vote = await db.get_active_chat_vote(msg.chat_id)
     
     if not active_vote:
         await msg.reply_text(ERROR_TEXTS['vote_not_found'])
@@ -607,15 +637,14 @@ async def vote_end(update: Update, context: ContextTypes.DEFAULT_TYPE, msg):
     await finish_vote_task(active_vote["id"], msg.chat_id, active_vote.get("message_id"), context)
 
 def get_vote_message_text(vote_data):
-    ends_at = datetime.fromisoformat(vote_data["ends_at"])
-    time_left = int((ends_at - datetime.now()).total_seconds())
+    time_left = int(vote_data["ends_at"] - time.time())
     minutes = time_left // 60
     seconds = time_left % 60
     
     return format_vote_text(
         vote_data['question'],
-        len(vote_data.get('votes_yes', [])),
-        len(vote_data.get('votes_no', [])),
+        vote_data.get('yes_count', 0),
+        vote_data.get('no_count', 0),
         action=f"Осталось: {minutes:02d}:{seconds:02d}"
     )
 
@@ -628,7 +657,7 @@ async def handle_vote(update: Update, context: ContextTypes.DEFAULT_TYPE, vote_t
         await query.answer()
         user = update.effective_user
         
-        active_vote = get_active_chat_vote(query.message.chat.id)
+        active_vote = await db.get_active_chat_vote(query.message.chat.id)
         if not active_vote:
             await query.answer(ERROR_TEXTS['vote_active'], show_alert=True)
             return
@@ -637,27 +666,39 @@ async def handle_vote(update: Update, context: ContextTypes.DEFAULT_TYPE, vote_t
             await query.answer(ERROR_TEXTS['vote_type'], show_alert=True)
             return
         
-        success = add_user_vote(active_vote["id"], user.id, vote_type)
+        success = await db.add_user_vote(active_vote["id"], user.id, vote_type)
         
         if not success:
             await query.answer(ERROR_TEXTS['vote_error'], show_alert=True)
             return
         
-        active_vote = get_vote(active_vote["id"])
+        vote_id = active_vote["id"]
+        active_vote = await db.get_vote(vote_id)
         if not active_vote:
             await query.answer(ERROR_TEXTS['vote_not_found_alert'], show_alert=True)
             return
         
-        vote_text = get_vote_message_text(active_vote)
+        message = query.message
+        
+        async def edit_vote_message(shown):
+            # Текст строится в момент правки: в него попадают все голоса, склеенные за окно
+            current = await db.get_vote(vote_id)
+            if not current or not current.get("active", False):
+                return shown
+            state = (current.get("yes_count", 0), current.get("no_count", 0))
+            if state != shown:
+                await message.edit_text(
+                    get_vote_message_text(current),
+                    reply_markup=get_chat_vote_keyboard(),
+                    parse_mode=ParseMode.MARKDOWN
+                )
+            return state
         
-        try:
-            await query.message.edit_text(
-                vote_text,
-                reply_markup=get_chat_vote_keyboard(),
-                parse_mode=ParseMode.MARKDOWN
-            )
-        except Exception as e:
-            logger.error(f"Ошибка обновления сообщения: {e}")
+        await vote_edits.submit(
+            (message.chat_id, message.message_id),
+            (active_vote.get("yes_count", 0), active_vote.get("no_count", 0)),
+            edit_vote_message
+        )
         
     except Exception as e:
         logger.error(f"Ошибка обработки голоса: {e}", exc_info=True)
@@ -685,13 +726,13 @@ async def backup_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE, msg):
     status_msg = await msg.reply_text(ADMIN_TEXTS['backup'])
     
     await send_progress(status_msg, "Создание безопасного бэкапа", 0.3)
-    success, backup_path = create_safe_backup("manual")
+    success, backup_path = await db.create_safe_backup("manual")
     
     if success:
         await send_progress(status_msg, "Бэкап создан", 0.7)
         
         size = os.path.getsize(backup_path)
-        backups = get_backup_list(5)
+        backups = await db.get_backup_list(5)
         
         text = ADMIN_TEXTS['backup_result']['success']
         text += ADMIN_TEXTS['backup_result']['file'].format(name=os.path.basename(backup_path))
@@ -709,7 +750,7 @@ async def backup_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE, msg):
 @handler()
 async def check_data(update: Update, context: ContextTypes.DEFAULT_TYPE, msg):
     try:
-        result = check_data_integrity()
+        result = await db.check_data_integrity()
         text = "🔍 ПРОВЕРКА ЦЕЛОСТНОСТИ ДАННЫХ\n\n"
         text += f"📊 Статистика:\n"
         text += f"👥 Пользователей: {result['stats']['users']}\n"
@@ -742,15 +783,14 @@ async def repair_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE, msg):
     status_msg = await msg.reply_text("🔄 Восстановление структуры данных...")
     
     await send_progress(status_msg, "Создание бэкапа перед восстановлением", 0.2)
-    create_safe_backup("before_repair")
+    await db.create_safe_backup("before_repair")
     
     await send_progress(status_msg, "Восстановление структуры", 0.5)
-    success = repair_data_structure()
+    success = await db.repair_data_structure()
     
     if success:
         await send_progress(status_msg, "Загрузка данных для проверки", 0.8)
-        from database import load_data
-        data = load_data()
+        data = await db.load_data()
         
         text = ADMIN_TEXTS['repair_result']['success'].format(
             users=len(data.get('users', {})),
@@ -795,7 +835,7 @@ async def handle_shlep_session(update: Update, context: ContextTypes.DEFAULT_TYP
         if cached:
             u, cnt, last = cached
         else:
-            u, cnt, last = get_user_stats(user.id)
+            u, cnt, last = await db.get_user_stats(user.id)
             await cache.set(f"user_stats_{user.id}", (u, cnt, last))
         
         lvl = calc_level(cnt)
@@ -815,7 +855,7 @@ async def handle_shlep_session(update: Update, context: ContextTypes.DEFAULT_TYP
         if cached:
             total, last, maxd, maxu, maxdt = cached
         else:
-            total, last, maxd, maxu, maxdt = get_stats()
+            total, last, maxd, maxu, maxdt = await db.get_stats()
             await cache.set("global_stats", (total, last, maxd, maxu, maxdt))
         
         maxu_safe = escape_text(maxu or 'Нет')
@@ -824,9 +864,9 @@ async def handle_shlep_session(update: Update, context: ContextTypes.DEFAULT_TYP
         await query.message.edit_text(text, reply_markup=get_shlep_session_keyboard())
     elif action == "shlep_my_stats":
         user = update.effective_user
-        _, cnt, last = get_user_stats(user.id)
+        _, cnt, last = await db.get_user_stats(user.id)
         lvl = calc_level(cnt)
-        compare_stats = get_comparison_stats(user.id)
+        compare_stats = await db.get_comparison_stats(user.id)
         
         text = f"{COMMAND_TEXTS['my_stats']['header']}\n"
         text += f"{COMMAND_TEXTS['my_stats']['player'].format(name=user.first_name)}\n"
@@ -842,6 +882,8 @@ async def handle_shlep_session(update: Update, context: ContextTypes.DEFAULT_TYP
         if last:
             text += f"\n{COMMAND_TEXTS['my_stats']['last_shlep'].format(date=last.strftime('%d.%m.%Y %H:%M'))}"
         
+        text += format_favourite_hour(await db.get_favourite_hour(user_id=user.id))
+        
         await query.message.edit_text(text, reply_markup=get_shlep_session_keyboard())
     elif action == "shlep_menu":
         user_info = get_user_info(update.effective_user)
@@ -864,10 +906,8 @@ async def admin_health(update: Update, context: ContextTypes.DEFAULT_TYPE, msg):
         
         status_msg = msg
         
-        from database import get_database_size, check_data_integrity
-        
-        db_stats = get_database_size()
-        integrity = check_data_integrity()
+        db_stats = await db.get_database_size()
+        integrity = await db.check_data_integrity()
         
         try:
             import shutil
@@ -893,6 +933,21 @@ async def admin_health(update: Update, context: ContextTypes.DEFAULT_TYPE, msg):
             errors=len(integrity['errors']), 
             warnings=len(integrity['warnings'])
         ) + "\n"
+        report += ADMIN_TEXTS['health_report']['vote_edits'].format(
+            sent=vote_edits.stats['sent'],
+            suppressed=vote_edits.suppressed,
+            retries=vote_edits.stats['retry_after']
+        ) + "\n"
+        report += ADMIN_TEXTS['health_report']['bot_rights'].format(
+            hits=bot_rights.stats['hits'],
+            misses=bot_rights.stats['misses'],
+            updates=bot_rights.stats['updates']
+        ) + "\n"
+        report += ADMIN_TEXTS['health_report']['deletions'].format(
+            requested=message_deleter.stats['requested'],
+            calls=message_deleter.api_calls,
+            errors=message_deleter.stats['errors']
+        ) + "\n"
         
         all_good = (not integrity['errors'] and db_stats.get("exists", False))
         
@@ -910,72 +965,59 @@ async def admin_health(update: Update, context: ContextTypes.DEFAULT_TYPE, msg):
 async def admin_stats(update: Update, context: ContextTypes.DEFAULT_TYPE, msg):
     await safe_edit_or_reply(msg, ADMIN_TEXTS['user_stats'])
     
-    from database import load_data
+    summary = await db.get_activity_summary()
+    total_users = summary.get('total_users', 0)
     
-    data = load_data()
-    users = data.get('users', {})
-    
-    if not users:
+    if not total_users:
         await msg.edit_text("📭 Нет данных о пользователях", reply_markup=get_admin_keyboard())
         return
     
-    now = datetime.now()
-    
-    active_today = 0
-    active_week = 0
-    total_shleps = 0
-    max_shleps = 0
-    max_user = None
-    
-    for user_id, user_data in users.items():
-        shleps = user_data.get('total_shleps', 0)
-        total_shleps += shleps
-        
-        if shleps > max_shleps:
-            max_shleps = shleps
-            max_user = user_data.get('username', f'ID: {user_id}')[:20]
-        
-        last_shlep = user_data.get('last_shlep')
-        if last_shlep:
-            try:
-                last_date = datetime.fromisoformat(last_shlep)
-                days_diff = (now - last_date).days
-                
-                if days_diff == 0:
-                    active_today += 1
-                if days_diff <= 7:
-                    active_week += 1
-            except:
-                pass
-    
-    avg_shleps = total_shleps / len(users) if users else 0
-    
     report = ADMIN_TEXTS['user_stats_report']['header']
     
-    report += ADMIN_TEXTS['user_stats_report']['total_users'].format(count=len(users)) + "\n"
-    report += ADMIN_TEXTS['user_stats_report']['active_today'].format(count=active_today) + "\n"
-    report += ADMIN_TEXTS['user_stats_report']['active_week'].format(count=active_week) + "\n"
-    report += ADMIN_TEXTS['user_stats_report']['total_shleps'].format(count=total_shleps) + "\n"
-    report += ADMIN_TEXTS['user_stats_report']['avg_shleps'].format(avg=avg_shleps) + "\n"
-    report += ADMIN_TEXTS['user_stats_report']['record_user'].format(user=max_user, count=max_shleps) + "\n\n"
-    
-    level_distribution = {}
-    for user_data in users.values():
-        shleps = user_data.get("total_shleps", 0)
-        level = (shleps // 10) + 1
-        level_key = f"{min(level, 100)}+" if level > 100 else str(level)
-        level_distribution[level_key] = level_distribution.get(level_key, 0) + 1
+    report += ADMIN_TEXTS['user_stats_report']['total_users'].format(count=total_users) + "\n"
+    report += ADMIN_TEXTS['user_stats_report']['active_today'].format(count=summary['active_today']) + "\n"
+    report += ADMIN_TEXTS['user_stats_report']['active_week'].format(count=summary['active_week']) + "\n"
+    report += ADMIN_TEXTS['user_stats_report']['total_shleps'].format(count=summary['total_shleps']) + "\n"
+    report += ADMIN_TEXTS['user_stats_report']['avg_shleps'].format(avg=summary['avg_shleps']) + "\n"
+    report += ADMIN_TEXTS['user_stats_report']['record_user'].format(user=summary['max_user'], count=summary['max_shleps']) + "\n\n"
     
     report += ADMIN_TEXTS['user_stats_report']['levels_header'] + "\n"
-    for level, count in sorted(level_distribution.items(), key=lambda x: int(x[0].replace('+', ''))):
-        percentage = (count / len(users)) * 100
+    for level, count in summary['levels']:
+        level_key = f"{level - 1}+" if level > 100 else str(level)
+        percentage = (count / total_users) * 100
         bar = create_progress_bar(percentage)
         report += ADMIN_TEXTS['user_stats_report']['level_item'].format(
-            level=level, bar=bar, percent=percentage, count=count
+            level=level_key, bar=bar, percent=percentage, count=count
         ) + "\n"
     
     await safe_edit_or_reply(msg, report, reply_markup=get_admin_keyboard())
 
+@handler(admin=True)
+async def admin_activity(update: Update, context: ContextTypes.DEFAULT_TYPE, msg):
+    chat = update.effective_chat
+    chat_id = chat.id if chat and chat.type != "private" else None
+    activity = await db.get_activity_sketches(chat_id)
+    texts = ADMIN_TEXTS['activity_report']
+    
+    report = texts['header'] + texts['active'].format(
+        dau=activity['dau'], wau=activity['wau'], mau=activity['mau']
+    )
+    
+    sections = [('top_header', activity['top'])]
+    if chat_id:
+        sections.append(('chat_top_header', activity['chat_top']))
+    for header, leaders in sections:
+        report += texts[header] + "\n"
+        if not leaders:
+            report += texts['top_empty']
+        report += "\n".join(
+            texts['top_item'].format(place=place, user=username, count=count)
+            for place, (username, count) in enumerate(leaders, 1)
+        )
+    report += texts['note']
+    
+    await safe_edit_or_reply(msg, report, reply_markup=get_admin_keyboard())
+
 @handler(admin=True)
 async def admin_cleanup(update: Update, context: ContextTypes.DEFAULT_TYPE, msg):
     await safe_edit_or_reply(msg, ADMIN_TEXTS['cleanup'], reply_markup=get_cleanup_keyboard())
@@ -1012,8 +1054,7 @@ async def perform_cleanup(message, cleanup_type):
                 pass
     
     elif cleanup_type == "backups":
-        from database import get_backup_list
-        backups = get_backup_list()
+        backups = await db.get_backup_list()
         
         if len(backups) > 10:
             backups_to_delete = backups[10:]
@@ -1064,11 +1105,11 @@ async def admin_backup_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def backup_cmd_internal(message):
     await message.edit_text(ADMIN_TEXTS['backup'])
     
-    success, backup_path = create_safe_backup("admin_panel")
+    success, backup_path = await db.create_safe_backup("admin_panel")
     
     if success:
         size = os.path.getsize(backup_path)
-        backups = get_backup_list(3)
+        backups = await db.get_backup_list(3)
         
         text = ADMIN_TEXTS['backup_result']['success']
         text += ADMIN_TEXTS['backup_result']['file'].format(name=os.path.basename(backup_path))
@@ -1094,9 +1135,7 @@ async def admin_storage_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     await query.answer()
     
-    from database import get_database_size
-    
-    db_stats = get_database_size()
+    db_stats = await db.get_database_size()
     
     if "error" in db_stats:
         text = ADMIN_TEXTS['storage_stats']['error'].format(error=db_stats['error'])
@@ -1121,6 +1160,24 @@ async def admin_storage_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
             text += ADMIN_TEXTS['storage_stats']['disk'].format(gb=free_gb)
         except:
             text += ADMIN_TEXTS['storage_stats']['disk_error']
+        
+        metrics = await db.get_persistence_metrics()
+        text += ADMIN_TEXTS['storage_stats']['persistence'].format(
+            engine=metrics['engine'],
+            status=ADMIN_TEXTS['storage_stats']['persistence_running' if metrics['running'] else 'persistence_stopped'],
+            interval=metrics['interval'],
+            rate=metrics['write_rate'],
+            pending=metrics['pending_events'],
+            duration=metrics['last_duration'] * 1000,
+            kb=metrics['last_bytes'] / 1024,
+            total_kb=metrics['total_bytes'] / 1024,
+            flushes=metrics['flushes']
+        )
+        if metrics['snapshot_mode'] == 'fork':
+            text += ADMIN_TEXTS['storage_stats']['persistence_fork'].format(
+                pause=metrics['last_pause'] * 1000,
+                running=ADMIN_TEXTS['storage_stats']['persistence_fork_running'] if metrics['snapshot_running'] else ""
+            )
     
     await query.message.edit_text(text, reply_markup=get_admin_keyboard())
 
@@ -1138,9 +1195,7 @@ async def perform_repair(message):
     except:
         pass
     
-    from database import repair_data_structure, create_safe_backup
-    
-    success_backup, backup_path = create_safe_backup("before_repair")
+    success_backup, backup_path = await db.create_safe_backup("before_repair")
     
     if not success_backup:
         try:
@@ -1149,11 +1204,10 @@ async def perform_repair(message):
             pass
         return
     
-    success = repair_data_structure()
+    success = await db.repair_data_structure()
     
     if success:
-        from database import load_data
-        data = load_data()
+        data = await db.load_data()
         
         text = ADMIN_TEXTS['repair_result']['success'].format(
             users=len(data.get('users', {})),
@@ -1172,7 +1226,7 @@ async def perform_repair(message):
 async def admin_bans(update: Update, context: ContextTypes.DEFAULT_TYPE, msg):
     # Показать список забаненных в текущем чате
     chat_id = update.effective_chat.id
-    banned = get_banned_users(chat_id)
+    banned = await db.get_banned_users(chat_id)
 
     if not banned:
         text = "🚫 В этом чате нет забаненных пользователей."
@@ -1187,7 +1241,7 @@ async def admin_bans(update: Update, context: ContextTypes.DEFAULT_TYPE, msg):
 async def admin_banned_words(update: Update, context: ContextTypes.DEFAULT_TYPE, msg):
     # Показать список банвордов в текущем чате
     chat_id = update.effective_chat.id
-    banned_words = get_banned_words(chat_id)
+    banned_words = await db.get_banned_words(chat_id)
 
     if not banned_words:
         text = "🚫 В этом чате нет запрещенных слов."
@@ -1204,7 +1258,7 @@ async def admin_banned_words(update: Update, context: ContextTypes.DEFAULT_TYPE,
 async def debug_user(update: Update, context: ContextTypes.DEFAULT_TYPE, msg):
     user = update.effective_user
 
-    data = load_data()
+    data = await db.load_data()
     user_data = data["users"].get(str(user.id), {})
 
     text = f"🔍 ДЕБАГ ДАННЫХ ДЛЯ user_id={user.id}\n\n"
@@ -1214,7 +1268,7 @@ async def debug_user(update: Update, context: ContextTypes.DEFAULT_TYPE, msg):
         text += f"  {key}: {value} (тип: {type(value).__name__})\n"
 
     text += f"\n🧪 Результат get_user_stats:\n"
-    username, cnt, last_shlep = get_user_stats(user.id)
+    username, cnt, last_shlep = await db.get_user_stats(user.id)
     text += f"  username: {username}\n"
     text += f"  cnt: {cnt} (тип: {type(cnt).__name__})\n"
     text += f"  last_shlep: {last_shlep} (тип: {type(last_shlep).__name__})\n"
@@ -1257,7 +1311,7 @@ async def mishok_ban(update: Update, context: ContextTypes.DEFAULT_TYPE, msg):
         await msg.reply_text("❌ Укажите пользователя для бана с помощью @username или ответьте на его сообщение")
         return
 
-    if ban_user(chat_id, mentioned_user_id):
+    if await db.ban_user(chat_id, mentioned_user_id):
         await msg.reply_text(f"✅ Пользователь забанен. Все его сообщения будут автоматически удаляться.")
     else:
         await msg.reply_text("❌ Не удалось забанить пользователя или он уже забанен.")
@@ -1271,7 +1325,7 @@ async def mishok_unban(update: Update, context: ContextTypes.DEFAULT_TYPE, msg):
         await msg.reply_text("❌ Укажите пользователя для разбана с помощью @username или ответьте на его сообщение")
         return
 
-    if unban_user(chat_id, mentioned_user_id):
+    if await db.unban_user(chat_id, mentioned_user_id):
         await msg.reply_text(f"✅ Пользователь разбанен.")
     else:
         await msg.reply_text("❌ Не удалось разбанить пользователя или он не был забанен.")
@@ -1292,7 +1346,7 @@ async def mishok_banword(update: Update, context: ContextTypes.DEFAULT_TYPE, msg
         await msg.reply_text("❌ Слово не может быть пустым.")
         return
 
-    if add_banned_word(chat_id, word):
+    if await db.add_banned_word(chat_id, word):
         await msg.reply_text(f"✅ Слово '{word}' добавлено в банворды.")
     else:
         await msg.reply_text(f"❌ Слово '{word}' уже в банвордах.")
@@ -1306,12 +1360,12 @@ async def mishok_shlep(update: Update, context: ContextTypes.DEFAULT_TYPE, msg):
         await msg.reply_text("❌ Укажите пользователя для авто-шлёпа с помощью @username или ответьте на его сообщение")
         return
 
-    auto_users = get_auto_shlep_users(chat_id)
+    auto_users = await db.get_auto_shlep_users(chat_id)
     if mentioned_user_id in auto_users:
         await msg.reply_text(ERROR_TEXTS['auto_shlep_already'])
         return
 
-    if add_auto_shlep_user(chat_id, mentioned_user_id):
+    if await db.add_auto_shlep_user(chat_id, mentioned_user_id):
         await msg.reply_text(ERROR_TEXTS['auto_shlep_added'])
     else:
         await msg.reply_text("❌ Не удалось добавить пользователя в авто-шлёп.")
@@ -1325,12 +1379,12 @@ async def mishok_unshlep(update: Update, context: ContextTypes.DEFAULT_TYPE, msg
         await msg.reply_text("❌ Укажите пользователя для удаления из авто-шлёпа с помощью @username или ответьте на его сообщение")
         return
 
-    auto_users = get_auto_shlep_users(chat_id)
+    auto_users = await db.get_auto_shlep_users(chat_id)
     if mentioned_user_id not in auto_users:
         await msg.reply_text(ERROR_TEXTS['auto_shlep_not_found'])
         return
 
-    if remove_auto_shlep_user(chat_id, mentioned_user_id):
+    if await db.remove_auto_shlep_user(chat_id, mentioned_user_id):
         await msg.reply_text(ERROR_TEXTS['auto_shlep_removed'])
     else:
         await msg.reply_text("❌ Не удалось убрать пользователя из авто-шлёпа.")
@@ -1339,7 +1393,7 @@ async def mishok_unshlep(update: Update, context: ContextTypes.DEFAULT_TYPE, msg
 async def mishok_shlep_list(update: Update, context: ContextTypes.DEFAULT_TYPE, msg):
     """Показать список авто-шлёпаемых в чате (доступно всем)"""
     chat_id = update.effective_chat.id
-    auto_users = get_auto_shlep_users(chat_id)
+    auto_users = await db.get_auto_shlep_users(chat_id)
 
     if not auto_users:
         await msg.reply_text(ERROR_TEXTS['auto_shlep_empty'])
@@ -1347,7 +1401,7 @@ async def mishok_shlep_list(update: Update, context: ContextTypes.DEFAULT_TYPE,
 
     text = ERROR_TEXTS['auto_shlep_list']
     for uid in auto_users:
-        user_info = get_user_stats(uid)
+        user_info = await db.get_user_stats(uid)
         name = user_info[0] if user_info[0] else f"ID: {uid}"
         text += f"• {escape_text(name)} (ID: {uid})\n"
 
@@ -1372,7 +1426,7 @@ async def inline_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await stats(update, context)
     elif data == "level_inline":
         await level(update, context)
-    elif data == "chat_top":
+    elif data == "chat_top" or data.startswith("chat_top:"):
         await chat_top(update, context)
     elif data == "my_stats":
         await my_stats(update, context)
@@ -1398,6 +1452,8 @@ async def inline_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await admin_health(update, context)
     elif data == "admin_stats":
         await admin_stats(update, context)
+    elif data == "admin_activity":
+        await admin_activity(update, context)
     elif data == "admin_backup":
         await admin_backup_cmd(update, context)
     elif data == "admin_repair":
@@ -1480,47 +1536,56 @@ async def check_banned_messages(update: Update, context: ContextTypes.DEFAULT_TY
     user_id = update.effective_user.id
     chat_id = update.effective_chat.id
 
-    banned_users = get_banned_users(chat_id)
-    banned_words = get_banned_words(chat_id)
-    logger.debug(f"Проверка пользователя {user_id} в чате {chat_id}, забанено: {len(banned_users)} пользователей, {len(banned_words)} слов")
+    # Профиль модерации чата: готовые множества и скомпилированные банворды
+    profile = await db.get_moderation_profile(chat_id)
+    if profile is not None:
+        if await moderate_message(update, context, profile):
+            return
+
+    # Проверка на фиксацию обращений
+    if update.message.text and "наталья зафиксируйте" in update.message.text.lower():
+        if update.message.reply_to_message:
+            await update.message.reply_text("🔏 Обращение зафиксировано и заверено у Нотариуса!")
+            logger.info(f"Зафиксировано обращение от {user_id} в чате {chat_id}")
+
+async def moderate_message(update: Update, context: ContextTypes.DEFAULT_TYPE, profile) -> bool:
+    """Банворды, бан и авто-шлёп по профилю чата; True — сообщение с банвордом обработано"""
+    user_id = update.effective_user.id
+    chat_id = update.effective_chat.id
+    logger.debug(f"Проверка пользователя {user_id} в чате {chat_id}, забанено: {len(profile.banned_users)} пользователей, {len(profile.words or ())} слов")
 
     message_text = update.message.text.lower() if update.message.text else ""
 
-    # Проверка на банворды
-    logger.debug(f"Проверка банвордов: текст='{message_text}', банворды={banned_words}")
-    for word in banned_words:
-        word_lower = word.lower()
-        if word_lower in message_text:
-            logger.info(f"Найден банворд '{word}' в сообщении от пользователя {user_id} в чате {chat_id}")
-            try:
-                # Проверяем права бота
-                bot_member = await context.bot.get_chat_member(chat_id, context.bot.id)
-                if not bot_member.can_delete_messages:
-                    logger.warning(f"Бот не имеет прав на удаление сообщений в чате {chat_id}")
-                    return
+    # Проверка на банворды: один проход по тексту скомпилированным набором слов чата
+    word = profile.words.search(message_text) if profile.words else None
+    if word is not None:
+        logger.info(f"Найден банворд '{word}' в сообщении от пользователя {user_id} в чате {chat_id}")
+        try:
+            # Проверяем права бота
+            if not await bot_rights.can_delete(context.bot, chat_id):
+                logger.warning(f"Бот не имеет прав на удаление сообщений в чате {chat_id}")
+                return True
 
-                await update.message.delete()
-                logger.info(f"Удалено сообщение с банвордом '{word}' от {user_id} в чате {chat_id}")
-            except Exception as e:
-                logger.error(f"Не удалось удалить сообщение от {user_id}: {e}")
-            return
+            await message_deleter.submit(context.bot, chat_id, update.message.message_id)
+            logger.info(f"Сообщение с банвордом '{word}' от {user_id} в чате {chat_id} поставлено на удаление")
+        except Exception as e:
+            logger.error(f"Не удалось удалить сообщение от {user_id}: {e}")
+        return True
 
-    if user_id in banned_users:
+    if user_id in profile.banned_users:
         logger.info(f"Попытка удалить сообщение от забаненного пользователя {user_id} в чате {chat_id}")
         try:
-            bot_member = await context.bot.get_chat_member(chat_id, context.bot.id)
-            if not bot_member.can_delete_messages:
+            if not await bot_rights.can_delete(context.bot, chat_id):
                 logger.warning(f"Бот не имеет прав на удаление сообщений в чате {chat_id}")
-                return
+                return True
 
-            await update.message.delete()
-            logger.info(f"Удалено сообщение от забаненного пользователя {user_id} в чате {chat_id}")
+            await message_deleter.submit(context.bot, chat_id, update.message.message_id)
+            logger.info(f"Сообщение забаненного пользователя {user_id} в чате {chat_id} поставлено на удаление")
         except Exception as e:
             logger.error(f"Не удалось удалить сообщение от {user_id}: {e}")
 
     # Проверка авто-шлёпа
-    auto_shlep_users = get_auto_shlep_users(chat_id)
-    if user_id in auto_shlep_users:
+    if user_id in profile.auto_shlep_users:
         try:
             shlep_text = random.choice(AUTO_SHLEP_TEXTS)
             await update.message.reply_text(shlep_text)
@@ -1528,11 +1593,13 @@ async def check_banned_messages(update: Update, context: ContextTypes.DEFAULT_TY
         except Exception as e:
             logger.error(f"Ошибка отправки авто-шлёпа: {e}")
 
-    # Проверка на фиксацию обращений
-    if update.message.text and "наталья зафиксируйте" in update.message.text.lower():
-        if update.message.reply_to_message:
-            await update.message.reply_text("🔏 Обращение зафиксировано и заверено у Нотариуса!")
-            logger.info(f"Зафиксировано обращение от {user_id} в чате {chat_id}")
+    return False
+
+async def track_bot_rights(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Права бота в чате изменились: обновить кэш прав"""
+    change = update.my_chat_member
+    bot_rights.update(change.chat.id, change.new_chat_member)
+    logger.info(f"Права бота в чате {change.chat.id}: {change.new_chat_member.status}")
 
 async def group_welcome(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if update.message and update.message.new_chat_members:
@@ -1555,15 +1622,14 @@ def main():
     import signal
     def shutdown_signal_handler(signum, frame):
         logger.info("Получен сигнал завершения, сохраняю данные...")
-        from database import save_data_to_disk, _in_memory_data
-        if _in_memory_data is not None:
-            save_data_to_disk(_in_memory_data)
+        from database import stop_flusher
+        stop_flusher(timeout=5)
         sys.exit(0)
     
     signal.signal(signal.SIGINT, shutdown_signal_handler)
     signal.signal(signal.SIGTERM, shutdown_signal_handler)
 
-    app = Application.builder().token(BOT_TOKEN).build()
+    app = Application.builder().token(BOT_TOKEN).post_init(recover_votes).build()
     
     commands = [
         ("start", start),
@@ -1598,6 +1664,7 @@ def main():
     app.add_handler(MessageHandler(filters.ChatType.GROUPS & ~filters.COMMAND, check_banned_messages))
     app.add_handler(MessageHandler(filters.ChatType.PRIVATE & filters.TEXT & ~filters.COMMAND, button_handler))
     app.add_handler(MessageHandler(filters.StatusUpdate.NEW_CHAT_MEMBERS, group_welcome))
+    app.add_handler(ChatMemberHandler(track_bot_rights, ChatMemberHandler.MY_CHAT_MEMBER))
     app.add_error_handler(error_handler)
     
     logger.info("=" * 50)
@@ -1613,6 +1680,9 @@ def main():
     print(f"• Бот готов к работе!")
     print("=" * 50)
     
+    from database import start_flusher, stop_flusher
+    start_flusher()
+    
     try:
         app.run_polling(
             drop_pending_updates=True,
@@ -1621,6 +1691,9 @@ def main():
     except Exception as e:
         logger.error(ERROR_TEXTS['bot'].format(error=e))
         sys.exit(1)
+    finally:
+        db.shutdown()
+        stop_flusher(timeout=5)
 
 if __name__ == "__main__":
     main()
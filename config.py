@@ -15,6 +15,13 @@ DATA_PATH = os.getenv("DATA_PATH", "data/mishok_bot")
 DATA_FILE = os.path.join(BASE_DIR, DATA_PATH, "mishok_data.json")
 BACKUP_PATH = os.path.join(BASE_DIR, DATA_PATH, "backups")
 LOG_FILE = os.path.join(BASE_DIR, DATA_PATH, "bot.log")
+SQLITE_FILE = os.path.join(BASE_DIR, DATA_PATH, "mishok_data.sqlite3")
+
+# Версия структуры данных (3.1 — моменты секундами эпохи, 3.2 — голоса словарём)
+DATA_VERSION = "3.3"
+
+# Движок хранения: "json" (один файл) или "sqlite" (построчная запись, WAL)
+STORAGE_ENGINE = os.getenv("STORAGE_ENGINE", "json").lower()
 
 CACHE_ENABLED = os.getenv("CACHE_ENABLED", "true").lower() == "true"
 CACHE_TTL_SECONDS = int(os.getenv("CACHE_TTL_SECONDS", "300"))
@@ -22,6 +29,12 @@ MAX_CACHE_SIZE = int(os.getenv("MAX_CACHE_SIZE", "1000"))
 LOG_CACHE_STATS = os.getenv("LOG_CACHE_STATS", "false").lower() == "true"
 
 CHAT_VOTE_DURATION = int(os.getenv("CHAT_VOTE_DURATION", "300"))
+# Правки сообщения голосования склеиваются: не чаще одной за столько секунд
+VOTE_EDIT_WINDOW = float(os.getenv("VOTE_EDIT_WINDOW", "1.5"))
+# Права бота в чате перепроверяются не чаще раза за столько секунд
+BOT_RIGHTS_TTL = float(os.getenv("BOT_RIGHTS_TTL", "600"))
+# Сообщения на удаление копятся столько секунд и удаляются одной пачкой
+DELETE_BATCH_WINDOW = float(os.getenv("DELETE_BATCH_WINDOW", "1.0"))
 CHAT_NOTIFICATIONS_ENABLED = os.getenv("CHAT_NOTIFICATIONS_ENABLED", "true").lower() == "true"
 
 BACKUP_ENABLED = os.getenv("BACKUP_ENABLED", "true").lower() == "true"
@@ -30,6 +43,30 @@ BACKUP_RETENTION_DAYS = int(os.getenv("BACKUP_RETENTION_DAYS", "7"))
 LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
 AUTOSAVE_INTERVAL = int(os.getenv("AUTOSAVE_INTERVAL", "30"))
 
+# Фоновое сохранение: при редких изменениях пишем почти сразу,
+# под нагрузкой интервал растёт до AUTOSAVE_INTERVAL и изменения копятся пачкой
+FLUSH_MIN_INTERVAL = float(os.getenv("FLUSH_MIN_INTERVAL", "1"))
+FLUSH_HIGH_RATE = float(os.getenv("FLUSH_HIGH_RATE", "50"))
+
+# Снимок движка json: inline — запись под блокировкой,
+# fork — запись копии памяти в дочернем процессе (Linux/macOS)
+SNAPSHOT_MODE = os.getenv("SNAPSHOT_MODE", "inline").lower()
+
+# Потоки для записи и дисковых операций из асинхронных обработчиков
+DB_WORKERS = int(os.getenv("DB_WORKERS", "4"))
+
+# Счётчики активности по дням (DAU/WAU/MAU и лидеры дня): сколько дней хранить
+# и сколько лидеров дня помнить для бота и для каждого чата
+SKETCH_DAYS = int(os.getenv("SKETCH_DAYS", "31"))
+SKETCH_TOP_K = int(os.getenv("SKETCH_TOP_K", "20"))
+
+# Журнал событий для движка json: каждое событие дописывается в конец,
+# снимок mishok_data.json пересобирается в фоне
+JOURNAL_ENABLED = os.getenv("JOURNAL_ENABLED", "true").lower() == "true"
+JOURNAL_FILE = os.path.join(BASE_DIR, DATA_PATH, "mishok_data.journal")
+JOURNAL_COMPACT_EVENTS = int(os.getenv("JOURNAL_COMPACT_EVENTS", "5000"))
+JOURNAL_COMPACT_INTERVAL = int(os.getenv("JOURNAL_COMPACT_INTERVAL", "300"))
+
 for directory in [os.path.dirname(DATA_FILE), BACKUP_PATH]:
     if directory and not os.path.exists(directory):
         try:
@@ -13,7 +13,9 @@ from datetime import datetime
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 from texts import DATA_TOOLS_TEXTS, STATUS_TEXTS
-from config import DATA_FILE, BACKUP_PATH
+from config import DATA_FILE, BACKUP_PATH, DATA_VERSION
+import database
+import timeseries
 
 OLD_DATA_PATHS = [
     "mishok_data.json",
@@ -23,8 +25,7 @@ OLD_DATA_PATHS = [
     "app/mishok_data.json"
 ]
 
-if __name__ == "__main__":
-    # ==================== ОБЩИЕ УТИЛИТЫ ====================
+# ==================== ОБЩИЕ УТИЛИТЫ ====================
 
 def create_backup(description: str = "") -> tuple:
     """Создать резервную копию данных"""
@@ -135,7 +136,7 @@ def fix_data_structure():
         print(DATA_TOOLS_TEXTS['create_new'])
         
         new_data = {
-            "version": "3.0",
+            "version": DATA_VERSION,
             "created_at": datetime.now().isoformat(),
             "updated_at": datetime.now().isoformat(),
             "users": {},
@@ -148,7 +149,7 @@ def fix_data_structure():
                 "max_damage_date": None,
                 "total_users": 0
             },
-            "timestamps": {},
+            "activity": timeseries.new_series(),
             "records": [],
             "votes": {}
         }
@@ -200,7 +201,7 @@ def fix_data_structure():
     print(DATA_TOOLS_TEXTS['optimization'])
     
     fixed_data = {
-        "version": "3.0",
+        "version": DATA_VERSION,
         "created_at": original_data.get("created_at", datetime.now().isoformat()),
         "updated_at": datetime.now().isoformat(),
         "users": {},
@@ -213,7 +214,8 @@ def fix_data_structure():
             "max_damage_date": None,
             "total_users": 0
         }),
-        "timestamps": {},
+        "activity": original_data.get("activity") or timeseries.new_series(),
+        "sketches": original_data.get("sketches", {}),
         "records": [],
         "votes": original_data.get("votes", {})
     }
@@ -227,19 +229,35 @@ def fix_data_structure():
             "last_shlep": user_data.get("last_shlep"),
             "bonus_damage": user_data.get("bonus_damage", 0)
         }
+        if timeseries.is_series(user_data.get("activity")):
+            fixed_data["users"][user_id]["activity"] = user_data["activity"]
     
     print(DATA_TOOLS_TEXTS['optimizing_timestamps'])
     if "timestamps" in original_data:
+        counts = {}
         for key, value in original_data["timestamps"].items():
             if isinstance(value, dict) and "count" in value:
-                fixed_data["timestamps"][key] = value["count"]
+                counts[key] = value["count"]
             else:
-                fixed_data["timestamps"][key] = value
+                counts[key] = value
+        old_series = timeseries.from_days(counts)
+        for level in ("d", "m"):
+            for key, count in old_series[level].items():
+                fixed_data["activity"][level][key] = fixed_data["activity"][level].get(key, 0) + count
     
     print(DATA_TOOLS_TEXTS['limiting_records'])
     if "records" in original_data:
         fixed_data["records"] = original_data["records"][-5:] if len(original_data["records"]) > 5 else original_data["records"]
     
+    print(DATA_TOOLS_TEXTS['converting_dates'])
+    database.migrate_epoch_timestamps(fixed_data)
+    
+    print(DATA_TOOLS_TEXTS['converting_ballots'])
+    database.migrate_vote_ballots(fixed_data)
+    
+    print(DATA_TOOLS_TEXTS['splitting_sketches'])
+    database.migrate_sketch_rows(fixed_data)
+    
     print(DATA_TOOLS_TEXTS['updating_counter'])
     fixed_data["global_stats"]["total_users"] = len(fixed_data["users"])
     
@@ -280,7 +298,7 @@ def verify_fixed_data():
         version = data.get("version", "1.0")
         print(DATA_TOOLS_TEXTS['data_version'].format(version=version))
         
-        required_keys = ["users", "chats", "global_stats", "timestamps", "records", "votes"]
+        required_keys = ["users", "chats", "global_stats", "activity", "records", "votes"]
         all_keys_present = all(key in data for key in required_keys)
         
         if all_keys_present:
@@ -337,6 +355,30 @@ def fix_and_verify():
         print(DATA_TOOLS_TEXTS['error'])
         return False
 
+# ==================== ПЕРЕНОС В SQLITE ====================
+
+def import_to_sqlite(json_path: str = DATA_FILE) -> bool:
+    """Однократно перенести данные из JSON-файла в SQLite"""
+    print("\n" + DATA_TOOLS_TEXTS['sqlite_title'])
+    
+    if not os.path.exists(json_path):
+        print(DATA_TOOLS_TEXTS['file_not_found'].format(file=json_path))
+        return False
+    
+    try:
+        from storage import import_json, SqliteStorage
+        
+        target = SqliteStorage()
+        result = import_json(json_path, target)
+        target.close()
+        
+        print(DATA_TOOLS_TEXTS['sqlite_imported'].format(file=target.path, **result))
+        print(DATA_TOOLS_TEXTS['sqlite_hint'])
+        return True
+    except Exception as e:
+        print(DATA_TOOLS_TEXTS['save_error'].format(error=e))
+        return False
+
 # ==================== КОМАНДНАЯ СТРОКА ====================
 
 if __name__ == "__main__":
@@ -355,6 +397,7 @@ if __name__ == "__main__":
     parser.add_argument("--fix", action="store_true", help="Исправить структуру данных")
     parser.add_argument("--check", action="store_true", help="Проверить текущие данные")
     parser.add_argument("--backup", action="store_true", help="Создать резервную копию")
+    parser.add_argument("--import-sqlite", action="store_true", help="Перенести данные из JSON в SQLite")
     
     args = parser.parse_args()
     
@@ -382,6 +425,9 @@ if __name__ == "__main__":
         else:
             print(DATA_TOOLS_TEXTS['backup_failed'].format(error=path))
     
+    elif args.import_sqlite:
+        import_to_sqlite()
+    
     else:
         print(DATA_TOOLS_TEXTS['usage'])
     
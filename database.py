@@ -1,26 +1,123 @@
-import json
 import os
-from datetime import datetime, timedelta
+import heapq
+import random
+from datetime import date, datetime, timedelta
 import logging
-from typing import Optional, Tuple, List, Any, Dict
-import shutil
+from typing import Optional, Tuple, List, Any, Dict, FrozenSet, NamedTuple
 import threading
 import time
-import copy
+from contextlib import contextmanager
 
 logger = logging.getLogger(__name__)
 
-from config import DATA_FILE, BACKUP_PATH, BACKUP_ENABLED, AUTOSAVE_INTERVAL
+from config import (
+    DATA_FILE, BACKUP_PATH, BACKUP_ENABLED, AUTOSAVE_INTERVAL,
+    FLUSH_MIN_INTERVAL, FLUSH_HIGH_RATE, SNAPSHOT_MODE,
+    JOURNAL_ENABLED, JOURNAL_FILE, JOURNAL_COMPACT_EVENTS, JOURNAL_COMPACT_INTERVAL,
+    SKETCH_DAYS, SKETCH_TOP_K, DATA_VERSION
+)
 from texts import DATABASE_TEXTS
+from storage import get_storage, import_json, JsonStorage
+from journal import Journal
+import snapshot
+import sketches
+import timeseries
+from leaderboard import Leaderboard, ScoreRanks
+from utils import to_epoch
+from wordfilter import WordMatcher
 
+BACKUP_EXTENSIONS = ('.json', '.sqlite3')
+
+_storage = get_storage()
 _in_memory_data = None
-_data_lock = threading.Lock()
+# Блокировка писателя: читатели её не берут, им достаётся опубликованный снимок
+_data_lock = threading.RLock()
 _last_save_time = time.time()
 _data_modified = False
+# Изменённые строки (секция, ключ) с последнего сохранения
+_dirty = set()
+_dirty_all = False
+
+# Снимок для читателей и строки, изменённые с его публикации
+_snapshot = None
+_touched = []
+_touched_all = False
+_batch_depth = 0
+
+# Рейтинг игроков: обновляется шлёпком, перестраивается при загрузке.
+# Лучшие TOP_SIZE игроков публикуются вместе со снимком.
+TOP_SIZE = 100
+_leaderboard = Leaderboard()
+# Топ пересобирается, только если шлёпок мог его изменить:
+# игрок уже в топе или догнал последнего в нём
+_top_stale = True
+_top_floor = 0
+_top_members = frozenset()
+# Рейтинги чатов: чат -> рейтинг участников по шлёпкам в этом чате
+_chat_leaderboards: Dict[str, Leaderboard] = {}
+# Чаты, чьи рейтинги изменились после публикации снимка
+_boards_changed = set()
+# Место и среднее для /mystats: счёты игроков с полем total_shleps
+_ranks = ScoreRanks()
+# Игроки без поля total_shleps в сравнении не участвуют
+_unranked_users = 0
+
+# Сводка для админки: игроки по дню последнего шлёпка и по уровням
+_ACTIVE_WEEK_DAYS = 8
+_LEVEL_CAP = 100
+_activity_days: Dict[str, int] = {}
+_level_histogram: Dict[int, int] = {}
+# Дни и уровни, изменённые после публикации снимка
+_days_changed = set()
+_levels_changed = set()
+
+# Голосования: chat_id -> id активного голосования и куча (ends_at, id) всех голосований,
+# чтобы поиск по клику был O(1), а очистка трогала только истёкшие
+_VOTE_KEEP_SECONDS = 86400
+_active_votes: Dict[int, str] = {}
+_vote_expiry: List[Tuple[int, str]] = []
+
+# Модерация чатов для каждого сообщения группы: chat_id -> готовый профиль.
+# Чатов без банов, банвордов и авто-шлёпа в словаре нет
+class ModerationProfile(NamedTuple):
+    banned_users: FrozenSet[int]
+    auto_shlep_users: FrozenSet[int]
+    words: Optional[WordMatcher]
+    version: int
+
+_moderation_profiles: Dict[str, ModerationProfile] = {}
+_moderation_version = 0
+
+# Журнал нужен только движку без построчной записи (json)
+_journal = Journal(JOURNAL_FILE) if JOURNAL_ENABLED and not _storage.write_through else None
+
+# Фоновое сохранение
+_flusher_thread = None
+_flusher_wakeup = threading.Event()
+_flusher_stop = threading.Event()
+# Изменения с последнего сохранения и всего с запуска (для оценки темпа записи)
+_pending_events = 0
+_events_total = 0
+_flush_metrics = {
+    "flushes": 0,
+    "errors": 0,
+    "last_duration": 0.0,
+    "last_pause": 0.0,
+    "last_bytes": 0,
+    "total_bytes": 0,
+    "last_flush_at": None,
+    "interval": FLUSH_MIN_INTERVAL,
+    "write_rate": 0.0
+}
+
+# Снимок в дочернем процессе (SNAPSHOT_MODE=fork)
+_bgsave_pid = None
+_bgsave_started = 0.0
+_bgsave_lock = threading.Lock()
 
 def create_default_data():
     return {
-        "version": "3.0",
+        "version": DATA_VERSION,
         "created_at": datetime.now().isoformat(),
         "updated_at": datetime.now().isoformat(),
         "users": {},
@@ -33,7 +130,8 @@ def create_default_data():
             "max_damage_date": None,
             "total_users": 0
         },
-        "timestamps": {},
+        "activity": timeseries.new_series(),
+        "sketches": {},
         "records": [],
         "votes": {}
     }
@@ -42,13 +140,25 @@ def ensure_data_file():
     try:
         os.makedirs(os.path.dirname(DATA_FILE), exist_ok=True)
         
-        if not os.path.exists(DATA_FILE):
+        logger.info(DATABASE_TEXTS['storage_engine'].format(engine=_storage.name, file=_storage.path))
+        
+        if not _storage.exists():
+            if _storage.name != JsonStorage.name and os.path.exists(DATA_FILE):
+                try:
+                    import_json(DATA_FILE, _storage)
+                    return load_data_from_disk()
+                except Exception as e:
+                    logger.error(DATABASE_TEXTS['sqlite_import_error'].format(error=e))
+            
             default_data = create_default_data()
             save_data_to_disk(default_data)
-            logger.info(DATABASE_TEXTS['file_created'].format(file=DATA_FILE))
+            logger.info(DATABASE_TEXTS['file_created'].format(file=_storage.path))
+            replay_journal(default_data)
             return default_data
         
-        return load_data_from_disk()
+        data = load_data_from_disk()
+        replay_journal(data)
+        return data
         
     except Exception as e:
         logger.error(f"Ошибка загрузки файла данных: {e}")
@@ -72,24 +182,144 @@ def convert_old_structure(data):
     if "records" in data and len(data["records"]) > 5:
         data["records"] = data["records"][-5:]
     
-    data["version"] = "3.0"
+    # 3.1: моменты вместо ISO-строк
+    migrate_epoch_timestamps(data)
+    # 3.2: голоса словарём и счётчики
+    migrate_vote_ballots(data)
+    # 3.3: регистры HyperLogLog отдельно от лидеров дня
+    migrate_sketch_rows(data)
+    
+    data["version"] = DATA_VERSION
     data["updated_at"] = datetime.now().isoformat()
     
     return data
 
+_VOTE_MOMENTS = ("created_at", "ends_at", "finished_at")
+
+def _epoch_fields(row: Dict[str, Any], fields) -> int:
+    """Перевести ISO-строки полей строки в секунды эпохи, вернуть число полей"""
+    converted = 0
+    for field in fields:
+        value = row.get(field)
+        if isinstance(value, str):
+            row[field] = to_epoch(value) or None
+            converted += 1
+    return converted
+
+def migrate_epoch_timestamps(data) -> int:
+    """
+    Версия 3.1: последний шлёпок, дата рекорда, моменты рекордов и голосований
+    хранятся целыми секундами эпохи. Возвращает число переведённых полей.
+    """
+    converted = _epoch_fields(data.get("global_stats", {}), ("last_shlep", "max_damage_date"))
+    for user_data in data.get("users", {}).values():
+        converted += _epoch_fields(user_data, ("last_shlep",))
+    for record in data.get("records", []):
+        converted += _epoch_fields(record, ("timestamp",))
+    for vote in data.get("votes", {}).values():
+        converted += _epoch_fields(vote, _VOTE_MOMENTS)
+    
+    if converted:
+        logger.info(DATABASE_TEXTS['epoch_migrated'].format(count=converted))
+    return converted
+
+def _ballots_from_lists(vote: Dict[str, Any]) -> bool:
+    """Списки votes_yes/votes_no до версии 3.2 -> голоса {игрок: выбор} и счётчики"""
+    if "votes_yes" not in vote and "votes_no" not in vote:
+        return False
+    ballots = vote.setdefault("ballots", {})
+    for choice in ("yes", "no"):
+        for user_id_str in vote.pop(f"votes_{choice}", None) or []:
+            ballots[str(user_id_str)] = choice
+    vote["yes_count"] = sum(1 for choice in ballots.values() if choice == "yes")
+    vote["no_count"] = len(ballots) - vote["yes_count"]
+    return True
+
+def migrate_vote_ballots(data) -> int:
+    """Версия 3.2: голоса словарём {игрок: "yes"/"no"} и счётчики вместо списков"""
+    converted = sum(_ballots_from_lists(vote) for vote in data.get("votes", {}).values())
+    if converted:
+        logger.info(DATABASE_TEXTS['ballots_migrated'].format(count=converted))
+    return converted
+
+def migrate_sketch_rows(data) -> int:
+    """
+    Версия 3.3: регистры HyperLogLog дня — отдельная строка "день:users",
+    чтобы шлёпок, не изменивший оценку, не переписывал их вместе с лидерами
+    """
+    rows = data.get("sketches", {})
+    converted = 0
+    for key, row in list(rows.items()):
+        if key == _sketch_key(key[:10]) and isinstance(row, dict) and "users" in row:
+            rows[_hll_key(key)] = {"users": row.pop("users")}
+            converted += 1
+    if converted:
+        logger.info(DATABASE_TEXTS['sketches_migrated'].format(count=converted))
+    return converted
+
+def backfill_chat_records(data) -> int:
+    """
+    Заполнить рекорд урона чатов, созданных до его учёта в шлёпке:
+    лучший личный рекорд среди участников чата. Возвращает число чатов.
+    """
+    chats = [chat for chat in data.get("chats", {}).values() if "max_damage" not in chat]
+    if not chats:
+        return 0
+    
+    users = data.get("users", {})
+    for chat in chats:
+        max_damage = 0
+        max_damage_user = None
+        for user_id in chat.get("users", {}):
+            user_data = users.get(user_id)
+            if user_data is None:
+                continue
+            user_damage = user_data.get("max_damage", 0)
+            if user_damage > max_damage:
+                max_damage = user_damage
+                max_damage_user = user_data.get("username")
+        chat["max_damage"] = max_damage
+        chat["max_damage_user"] = max_damage_user
+    
+    logger.info(DATABASE_TEXTS['chat_records_backfilled'].format(count=len(chats)))
+    return len(chats)
+
+def migrate_timestamps(data) -> bool:
+    """Перенести старый словарь timestamps {день: шлёпки} во временной ряд activity"""
+    if "timestamps" not in data:
+        return False
+    
+    counts = data.pop("timestamps")
+    series = timeseries.from_days(counts if isinstance(counts, dict) else {})
+    if isinstance(data.get("activity"), dict):
+        for day, count in series["d"].items():
+            data["activity"]["d"][day] = data["activity"]["d"].get(day, 0) + count
+        for month, count in series["m"].items():
+            data["activity"]["m"][month] = data["activity"]["m"].get(month, 0) + count
+    else:
+        data["activity"] = series
+    
+    logger.info(DATABASE_TEXTS['timestamps_migrated'].format(days=len(counts) if isinstance(counts, dict) else 0))
+    return True
+
 def load_data_from_disk():
     try:
-        with open(DATA_FILE, 'r', encoding='utf-8') as f:
-            data = json.load(f)
+        data = _storage.load()
+        if data is None:
+            return create_default_data()
         
         version = data.get("version", "1.0")
         
-        if version != "3.0":
-            logger.info(f"Конвертируем данные с версии {version} на 3.0")
+        if version != DATA_VERSION:
+            logger.info(f"Конвертируем данные с версии {version} на {DATA_VERSION}")
             data = convert_old_structure(data)
             save_data_to_disk(data)
         
-        logger.info(DATABASE_TEXTS['file_loaded'].format(file=DATA_FILE))
+        migrated = migrate_timestamps(data)
+        if backfill_chat_records(data) or migrated:
+            save_data_to_disk(data)
+        
+        logger.info(DATABASE_TEXTS['file_loaded'].format(file=_storage.path))
         logger.info(DATABASE_TEXTS['users_count'].format(count=len(data.get('users', {}))))
         logger.info(DATABASE_TEXTS['shleps_count'].format(count=data.get('global_stats', {}).get('total_shleps', 0)))
         
@@ -99,6 +329,137 @@ def load_data_from_disk():
         logger.error(f"Ошибка загрузки файла данных: {e}")
         return create_default_data()
 
+def replay_journal(data) -> int:
+    """Повторить события журнала, которых ещё нет в снимке"""
+    if _journal is None:
+        return 0
+    
+    replayed = 0
+    for event, args in _journal.replay(data.get("journal_seq", 0)):
+        try:
+            _EVENT_APPLIERS[event](data, **args)
+            replayed += 1
+        except Exception as e:
+            logger.error(DATABASE_TEXTS['journal_replay_error'].format(event=event, error=e))
+    
+    if replayed:
+        logger.info(DATABASE_TEXTS['journal_replayed'].format(count=replayed))
+        data["journal_seq"] = _journal.seq
+        if save_data_to_disk(data):
+            _journal.truncate()
+    
+    return replayed
+
+def _log_event(event, **args):
+    """Записать событие в журнал (вызывать под _data_lock)"""
+    if _journal is not None:
+        _journal.append(event, **args)
+        if _journal.pending >= JOURNAL_COMPACT_EVENTS:
+            _flusher_wakeup.set()
+
+def _flush_bounds() -> Tuple[float, float]:
+    """Границы интервала фонового сохранения"""
+    # С журналом каждое событие уже на диске, снимок можно пересобирать реже
+    if _journal is not None:
+        return AUTOSAVE_INTERVAL, JOURNAL_COMPACT_INTERVAL
+    return FLUSH_MIN_INTERVAL, AUTOSAVE_INTERVAL
+
+def _adaptive_interval(rate: float) -> float:
+    """Редкие изменения пишем сразу, под нагрузкой копим их в пачку"""
+    low, high = _flush_bounds()
+    load = min(1.0, rate / FLUSH_HIGH_RATE) if FLUSH_HIGH_RATE > 0 else 1.0
+    return low + (high - low) * load
+
+def _background_flush() -> bool:
+    """Записать накопленные изменения из фонового потока"""
+    with _data_lock:
+        if not _data_modified:
+            return False
+        
+        events = _pending_events
+        if not _flush_locked(background=True):
+            return False
+        forked = _bgsave_pid is not None
+    
+    # Итог снимка в дочернем процессе пишет wait_for_snapshot()
+    if not forked:
+        logger.debug(DATABASE_TEXTS['background_flush'].format(
+            count=events, seconds=_flush_metrics["last_duration"], bytes=_flush_metrics["last_bytes"]
+        ))
+    return True
+
+def _flusher_loop():
+    last_total = _events_total
+    last_tick = time.monotonic()
+    last_seen_save = _last_save_time
+    
+    while not _flusher_stop.is_set():
+        _flusher_wakeup.wait(FLUSH_MIN_INTERVAL)
+        _flusher_wakeup.clear()
+        
+        try:
+            wait_for_snapshot(0)
+            
+            now = time.monotonic()
+            elapsed = max(now - last_tick, 1e-3)
+            total = _events_total
+            new_events = total - last_total
+            rate = 0.3 * new_events / elapsed + 0.7 * _flush_metrics["write_rate"]
+            last_total, last_tick = total, now
+            
+            # Поток изменений затих — не ждём, пока оценка темпа остынет
+            interval = _adaptive_interval(rate) if new_events else _flush_bounds()[0]
+            _flush_metrics["write_rate"] = rate
+            _flush_metrics["interval"] = interval
+            
+            journal_full = _journal is not None and _journal.pending >= JOURNAL_COMPACT_EVENTS
+            if _data_modified and (journal_full or time.time() - _last_save_time >= interval):
+                _background_flush()
+            
+            # Сохранение могло пройти и вне потока (построчная запись sqlite)
+            if _last_save_time != last_seen_save:
+                last_seen_save = _last_save_time
+                if BACKUP_ENABLED and should_create_backup():
+                    create_daily_backup()
+        except Exception as e:
+            logger.error(DATABASE_TEXTS['background_flush_error'].format(error=e))
+
+def start_flusher():
+    """Запустить фоновое сохранение данных"""
+    global _flusher_thread
+    if _flusher_thread is not None and _flusher_thread.is_alive():
+        return
+    _flusher_stop.clear()
+    _flusher_thread = threading.Thread(target=_flusher_loop, name="data-flusher", daemon=True)
+    _flusher_thread.start()
+    logger.info(DATABASE_TEXTS['flusher_started'].format(
+        low=_flush_bounds()[0], high=_flush_bounds()[1]
+    ))
+
+def stop_flusher(timeout: float = 5) -> bool:
+    """Остановить фоновое сохранение и записать остаток изменений"""
+    global _flusher_thread
+    if _flusher_thread is not None:
+        _flusher_stop.set()
+        _flusher_wakeup.set()
+        _flusher_thread.join(timeout)
+        _flusher_thread = None
+    wait_for_snapshot(timeout)
+    return flush_data(timeout=timeout)
+
+def get_persistence_metrics() -> Dict[str, Any]:
+    """Показатели фонового сохранения"""
+    metrics = dict(_flush_metrics)
+    metrics.update({
+        "running": _flusher_thread is not None and _flusher_thread.is_alive(),
+        "engine": _storage.name,
+        "pending_events": _pending_events,
+        "snapshot_mode": "fork" if _fork_snapshots() else "inline",
+        "snapshot_running": _bgsave_pid is not None,
+        "journal_events": _journal.pending if _journal is not None else 0
+    })
+    return metrics
+
 def repair_data_structure():
     try:
         data = load_data()
@@ -113,7 +474,12 @@ def repair_data_structure():
             "max_damage_date": None,
             "total_users": 0
         })
-        data.setdefault("timestamps", {})
+        migrate_timestamps(data)
+        migrate_epoch_timestamps(data)
+        migrate_vote_ballots(data)
+        data.setdefault("sketches", {})
+        migrate_sketch_rows(data)
+        data.setdefault("activity", timeseries.new_series())
         data.setdefault("records", [])
         data.setdefault("votes", {})
         
@@ -140,9 +506,11 @@ def repair_data_structure():
                 user_data.setdefault("total_shleps", 0)
                 user_data.pop("max_damage", None)
         
+        backfill_chat_records(data)
         data["global_stats"]["total_users"] = len(data["users"])
         
         save_data(data)
+        flush_data()
         logger.info(DATABASE_TEXTS['structure_repaired'])
         return True
     except Exception as e:
@@ -150,47 +518,338 @@ def repair_data_structure():
         return False
 
 def load_data():
-    global _in_memory_data
-    
     with _data_lock:
         if _in_memory_data is None:
-            _in_memory_data = ensure_data_file()
+            _set_data_locked(ensure_data_file())
         return _in_memory_data.copy()
 
-def save_data_to_disk(data):
+def _read_snapshot() -> snapshot.Snapshot:
+    current = _snapshot
+    if current is None:
+        load_data()
+        current = _snapshot
+    return current
+
+def read_data():
+    """
+    Текущий снимок данных для чтения без блокировки.
+    Снимок неизменяемый и публикуется целиком после каждой пачки изменений.
+    """
+    return _read_snapshot().data
+
+def get_snapshot_version() -> int:
+    """Номер опубликованного снимка (растёт с каждой пачкой изменений)"""
+    return _snapshot.version if _snapshot is not None else 0
+
+def _set_data_locked(data):
+    """Заменить данные целиком и опубликовать полный снимок (вызывать под _data_lock)"""
+    global _in_memory_data, _touched_all, _leaderboard, _chat_leaderboards, _ranks, _unranked_users
+    global _moderation_profiles
+    _in_memory_data = data
+    _touched_all = True
+    users = data.get("users", {})
+    _leaderboard = Leaderboard.build(
+        (user_id, _shlep_count(user)) for user_id, user in users.items()
+    )
+    _ranks = ScoreRanks.build(_shlep_count(user) for user in users.values() if "total_shleps" in user)
+    _unranked_users = len(users) - _ranks.total
+    _activity_days.clear()
+    _level_histogram.clear()
+    for user in users.values():
+        _count_activity(_epoch_day(to_epoch(user.get("last_shlep"))), 1)
+        _count_level(_level_bucket(_shlep_count(user)), 1)
+    _index_votes(data.get("votes", {}))
+    # Индексы, которые читают без блокировки, собираются заново и подменяются целиком
+    profiles = {}
+    for chat_id, chat in data.get("chats", {}).items():
+        profile = _moderation_profile(chat)
+        if profile is not None:
+            profiles[chat_id] = profile
+    _moderation_profiles = profiles
+    _chat_leaderboards = {
+        chat_id: Leaderboard.build(
+            (user_id, _shlep_count(member)) for user_id, member in chat.get("users", {}).items()
+        )
+        for chat_id, chat in data.get("chats", {}).items()
+    }
+    if _batch_depth == 0:
+        _publish_locked()
+
+def _epoch_day(moment: int) -> Optional[str]:
+    return date.fromtimestamp(moment).isoformat() if moment else None
+
+def _level_bucket(cnt: int) -> int:
+    """Уровень для гистограммы: всё выше _LEVEL_CAP в одной корзине"""
+    return min(calc_level(cnt)['level'], _LEVEL_CAP + 1)
+
+def _count_activity(day: Optional[str], delta: int) -> None:
+    if day is None:
+        return
+    _days_changed.add(day)
+    count = _activity_days.get(day, 0) + delta
+    if count:
+        _activity_days[day] = count
+    else:
+        del _activity_days[day]
+
+def _count_level(level: int, delta: int) -> None:
+    _levels_changed.add(level)
+    count = _level_histogram.get(level, 0) + delta
+    if count:
+        _level_histogram[level] = count
+    else:
+        del _level_histogram[level]
+
+def _publish_locked():
+    """Опубликовать снимок для читателей (вызывать под _data_lock)"""
+    global _snapshot, _touched_all, _top_stale, _top_floor, _top_members
+    
+    if _in_memory_data is None:
+        return
+    
+    full = _snapshot is None or _touched_all
+    if full:
+        _snapshot = snapshot.build(_in_memory_data, get_snapshot_version() + 1)
+        _top_stale = True
+    elif _touched:
+        _snapshot = snapshot.publish(_snapshot, _in_memory_data, _touched)
+    
+    if _snapshot.ranks is not _ranks:
+        _snapshot = _snapshot._replace(ranks=_ranks, unranked=_unranked_users)
+    
+    if full:
+        boards = snapshot.FrozenSection.build(_chat_leaderboards, Leaderboard.freeze)
+        _snapshot = _snapshot._replace(
+            chat_boards=boards,
+            activity_days=snapshot.FrozenSection.build(_activity_days),
+            levels=snapshot.FrozenSection.build(_level_histogram)
+        )
+    else:
+        if _days_changed:
+            days = _snapshot.activity_days.updated({day: _activity_days.get(day, 0) for day in _days_changed})
+            _snapshot = _snapshot._replace(activity_days=days)
+        if _levels_changed:
+            levels = _snapshot.levels.updated({level: _level_histogram.get(level, 0) for level in _levels_changed})
+            _snapshot = _snapshot._replace(levels=levels)
+        if _boards_changed:
+            boards = _snapshot.chat_boards.updated({
+                chat_id: _chat_leaderboards[chat_id].freeze() for chat_id in _boards_changed
+            })
+            _snapshot = _snapshot._replace(chat_boards=boards)
+    _boards_changed.clear()
+    _days_changed.clear()
+    _levels_changed.clear()
+    
+    if _top_stale:
+        leaders = _leaderboard.top(TOP_SIZE)
+        _snapshot = _snapshot._replace(top=_named_top(leaders))
+        _top_members = frozenset(user_id for user_id, _ in leaders)
+        _top_floor = leaders[-1][1] if len(leaders) >= TOP_SIZE else 0
+        _top_stale = False
+    
+    _touched.clear()
+    _touched_all = False
+
+def _named_top(leaders: List[Tuple[str, int]]) -> tuple:
+    users = _in_memory_data.get("users", {})
+    return tuple(
+        (users[user_id].get("username", f"Игрок_{user_id}"), total)
+        for user_id, total in leaders
+    )
+
+def _top_users_locked(limit: int) -> tuple:
+    """Лучшие игроки по рейтингу (вызывать под _data_lock)"""
+    return _named_top(_leaderboard.top(limit))
+
+def _update_leaderboard(user_id_str: str, score: int) -> None:
+    global _top_stale
+    _leaderboard.update(user_id_str, score)
+    if score >= _top_floor or user_id_str in _top_members:
+        _top_stale = True
+
+def _commit_locked():
+    """Завершить пачку изменений: снимок читателям и построчная запись"""
+    _publish_locked()
+    if _data_modified and _storage.write_through:
+        _flush_locked()
+
+def save_data_to_disk(data, dirty=None):
     try:
         data["updated_at"] = datetime.now().isoformat()
         
-        os.makedirs(os.path.dirname(DATA_FILE), exist_ok=True)
+        if dirty is not None:
+            dirty = list(dirty) + [("updated_at", None)]
         
-        temp_file = DATA_FILE + ".tmp"
-        with open(temp_file, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, separators=(',', ':'))
+        started = time.perf_counter()
+        written = _storage.save(data, dirty)
         
-        os.replace(temp_file, DATA_FILE)
+        _flush_metrics["flushes"] += 1
+        _flush_metrics["last_duration"] = _flush_metrics["last_pause"] = time.perf_counter() - started
+        _flush_metrics["last_bytes"] = written
+        _flush_metrics["total_bytes"] += written
+        _flush_metrics["last_flush_at"] = datetime.now()
         
-        logger.debug(DATABASE_TEXTS['data_saved'].format(file=DATA_FILE))
+        logger.debug(DATABASE_TEXTS['data_saved'].format(file=_storage.path))
         return True
     except Exception as e:
+        _flush_metrics["errors"] += 1
         logger.error(DATABASE_TEXTS['save_error'].format(error=e))
         return False
 
-def schedule_save():
-    global _data_modified, _last_save_time
+def _mark_dirty(section, key=None, member=None):
+    """Отметить изменённую строку (вызывать под _data_lock)"""
+    global _data_modified
+    row = (section, key) if member is None else (section, key, member)
+    _dirty.add(row)
+    _touched.append(row)
+    _data_modified = True
+
+def _count_event():
+    """Учесть одно изменение данных (вызывать под _data_lock)"""
+    global _pending_events, _events_total
+    _pending_events += 1
+    _events_total += 1
+
+def _fork_snapshots() -> bool:
+    return SNAPSHOT_MODE == "fork" and not _storage.write_through and hasattr(os, "fork")
+
+def _start_bgsave_locked() -> bool:
+    """Записать снимок в дочернем процессе (вызывать под _data_lock)"""
+    global _bgsave_pid, _bgsave_started, _data_modified, _dirty_all, _pending_events
     
+    if not wait_for_snapshot(0):
+        return False
+    
+    _in_memory_data["updated_at"] = datetime.now().isoformat()
+    if _journal is not None:
+        _in_memory_data["journal_seq"] = _journal.seq
+        _journal.rotate()
+    
+    started = time.perf_counter()
+    pid = os.fork()
+    if pid == 0:
+        # Дочерний процесс видит память на момент fork(): только запись, без логов и блокировок
+        code = 1
+        try:
+            _storage.save(_in_memory_data)
+            code = 0
+        except BaseException:
+            pass
+        os._exit(code)
+    
+    _bgsave_pid = pid
+    _bgsave_started = started
+    _flush_metrics["last_pause"] = time.perf_counter() - started
+    
+    _dirty.clear()
+    _dirty_all = False
+    _data_modified = False
+    _pending_events = 0
+    return True
+
+def _finish_bgsave(ok: bool) -> None:
+    """Учесть завершение снимка (вызывать под _bgsave_lock)"""
+    global _data_modified, _dirty_all, _last_save_time
+    
+    duration = time.perf_counter() - _bgsave_started
+    if not ok:
+        # Отложенный журнал остаётся на диске, снимок повторится целиком
+        _flush_metrics["errors"] += 1
+        _dirty_all = True
+        _data_modified = True
+        logger.error(DATABASE_TEXTS['bgsave_failed'])
+        return
+    
+    if _journal is not None:
+        _journal.drop_rotated()
+    
+    written = _storage.size()
+    _flush_metrics["flushes"] += 1
+    _flush_metrics["last_duration"] = duration
+    _flush_metrics["last_bytes"] = written
+    _flush_metrics["total_bytes"] += written
+    _flush_metrics["last_flush_at"] = datetime.now()
+    _last_save_time = time.time()
+    logger.debug(DATABASE_TEXTS['bgsave_done'].format(
+        seconds=duration, pause=_flush_metrics["last_pause"] * 1000, bytes=written
+    ))
+
+def wait_for_snapshot(timeout: Optional[float] = None) -> bool:
+    """Дождаться снимка в дочернем процессе; True — незавершённых снимков нет"""
+    global _bgsave_pid
+    
+    deadline = None if timeout is None else time.monotonic() + timeout
+    with _bgsave_lock:
+        while _bgsave_pid is not None:
+            pid, status = os.waitpid(_bgsave_pid, os.WNOHANG)
+            if pid == 0:
+                if deadline is not None and time.monotonic() >= deadline:
+                    return False
+                time.sleep(0.01)
+                continue
+            
+            _bgsave_pid = None
+            _finish_bgsave(os.waitstatus_to_exitcode(status) == 0)
+    return True
+
+def _flush_locked(background: bool = False):
+    """
+    Записать накопленные изменения (вызывать под _data_lock).
+    background=True разрешает снимок в дочернем процессе.
+    """
+    global _data_modified, _dirty_all, _last_save_time, _pending_events
+    
+    if _in_memory_data is None:
+        return False
+    
+    if background and _fork_snapshots():
+        return _start_bgsave_locked()
+    
+    # Запись поверх ещё не дописанного снимка его бы затёрла
+    wait_for_snapshot()
+    
+    if _journal is not None:
+        _in_memory_data["journal_seq"] = _journal.seq
+    
+    if not save_data_to_disk(_in_memory_data, None if _dirty_all else _dirty):
+        return False
+    
+    if _journal is not None:
+        _journal.truncate()
+    
+    _dirty.clear()
+    _dirty_all = False
+    _data_modified = False
+    _pending_events = 0
+    _last_save_time = time.time()
+    return True
+
+def flush_data(timeout: float = -1) -> bool:
+    """Немедленно записать все несохранённые изменения"""
+    if not _data_lock.acquire(timeout=timeout):
+        logger.warning(DATABASE_TEXTS['flush_lock_timeout'])
+        return False
+    try:
+        return _flush_locked() if _data_modified else True
+    finally:
+        _data_lock.release()
+
+def schedule_save():
     with _data_lock:
         current_time = time.time()
+        elapsed = current_time - _last_save_time
         
-        if _data_modified and (current_time - _last_save_time) > AUTOSAVE_INTERVAL:
+        # С журналом каждое событие уже на диске, а при запущенном
+        # фоновом сохранении снимок пишет он
+        if _journal is not None or _flusher_thread is not None:
+            return False
+        
+        if _data_modified and (_storage.write_through or elapsed > AUTOSAVE_INTERVAL):
             
-            if _in_memory_data:
-                save_data_to_disk(_in_memory_data)
-                if BACKUP_ENABLED and should_create_backup():
-                    create_daily_backup()
+            if _flush_locked() and BACKUP_ENABLED and should_create_backup():
+                create_daily_backup()
             
-            _data_modified = False
-            _last_save_time = current_time
-            logger.debug(DATABASE_TEXTS['autosave'].format(seconds=current_time - _last_save_time))
+            logger.debug(DATABASE_TEXTS['autosave'].format(seconds=elapsed))
             return True
     
     return False
@@ -216,7 +875,7 @@ def should_create_backup():
 
 def create_daily_backup():
     try:
-        if not os.path.exists(DATA_FILE):
+        if not _storage.exists():
             return False
         
         os.makedirs(BACKUP_PATH, exist_ok=True)
@@ -236,9 +895,9 @@ def create_daily_backup():
             pass
         
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        backup_file = os.path.join(BACKUP_PATH, f"daily_{timestamp}.json")
+        backup_file = os.path.join(BACKUP_PATH, f"daily_{timestamp}{_storage.extension}")
         
-        shutil.copy2(DATA_FILE, backup_file)
+        _storage.backup(backup_file)
         
         with open(backup_marker, 'w') as f:
             f.write(today)
@@ -260,7 +919,7 @@ def cleanup_backups(max_backups=5):
         
         backups = []
         for filename in os.listdir(BACKUP_PATH):
-            if filename.endswith('.json') and filename.startswith('daily_'):
+            if filename.endswith(BACKUP_EXTENSIONS) and filename.startswith('daily_'):
                 filepath = os.path.join(BACKUP_PATH, filename)
                 mtime = os.path.getmtime(filepath)
                 backups.append((filepath, mtime, filename))
@@ -277,33 +936,119 @@ def cleanup_backups(max_backups=5):
     except Exception as e:
         logger.error(DATABASE_TEXTS['cleanup_error'].format(error=e))
 
-def save_data(data):
-    global _in_memory_data, _data_modified
+def save_data(data, dirty=None):
+    """
+    Заменить данные целиком (восстановление структуры, утилиты).
+    Точечные изменения делаются через transaction().
+    """
+    global _data_modified, _dirty_all
     
     with _data_lock:
-        _in_memory_data = copy.deepcopy(data)
+        # Вложенные словари у load_data() общие с памятью, копировать нечего
+        _set_data_locked(data)
+        if dirty is None:
+            _dirty_all = True
+        else:
+            _dirty.update(dirty)
         _data_modified = True
+        _count_event()
     
     schedule_save()
     
     return True
 
+class Transaction:
+    """Изменение данных на месте: затронутые строки и события журнала"""
+    
+    def __init__(self, data):
+        self.data = data
+        self.dirty = []
+        self.events = []
+    
+    def touch(self, section, key=None, member=None):
+        """Отметить изменённую строку для сохранения"""
+        self.dirty.append((section, key, member))
+    
+    def event(self, name, **args):
+        """Записать событие в журнал при фиксации"""
+        self.events.append((name, args))
+
+@contextmanager
+def transaction():
+    """
+    Изменить данные под блокировкой без копирования.
+    Сохраняются только строки, отмеченные через tx.touch().
+    Отката нет: при исключении внутри блока события не пишутся в журнал,
+    но уже сделанные изменения остаются в памяти и уйдут со следующей
+    записью. Поэтому операция сначала проверяет и досоздаёт всё нужное
+    и только потом меняет данные.
+    """
+    with _data_lock:
+        if _in_memory_data is None:
+            _set_data_locked(ensure_data_file())
+        
+        tx = Transaction(_in_memory_data)
+        yield tx
+        
+        for section, key, member in tx.dirty:
+            _mark_dirty(section, key, member)
+        for name, args in tx.events:
+            _log_event(name, **args)
+        if tx.dirty:
+            _count_event()
+            if _batch_depth == 0:
+                _commit_locked()
+    
+    if tx.dirty:
+        schedule_save()
+
+@contextmanager
+def batch():
+    """
+    Пачка транзакций единственного писателя: снимок для читателей
+    публикуется и построчная запись (sqlite) выполняется один раз в конце
+    """
+    global _batch_depth
+    
+    with _data_lock:
+        _batch_depth += 1
+        try:
+            yield
+        finally:
+            _batch_depth -= 1
+            if _batch_depth == 0:
+                _commit_locked()
+
+def apply_batch(commands: List[Tuple[Any, tuple, dict]]) -> List[Tuple[bool, Any]]:
+    """Выполнить команды писателя одной пачкой: (успех, результат или исключение) по каждой"""
+    results = []
+    with batch():
+        for func, args, kwargs in commands:
+            try:
+                results.append((True, func(*args, **kwargs)))
+            except Exception as e:
+                results.append((False, e))
+    return results
+
 def create_safe_backup(description: str = "") -> Tuple[bool, str]:
     try:
-        if not os.path.exists(DATA_FILE):
-            return False, DATABASE_TEXTS['file_not_found'].format(file=DATA_FILE)
+        if not _storage.exists():
+            return False, DATABASE_TEXTS['file_not_found'].format(file=_storage.path)
         
         os.makedirs(BACKUP_PATH, exist_ok=True)
         
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         desc_part = f"_{description}" if description else ""
-        backup_file = os.path.join(BACKUP_PATH, f"manual{desc_part}_{timestamp}.json")
+        backup_file = os.path.join(BACKUP_PATH, f"manual{desc_part}_{timestamp}{_storage.extension}")
         
+        # Снимок в дочернем процессе не держит блокировку: ждём его без неё
+        wait_for_snapshot()
         with _data_lock:
-            if _in_memory_data:
-                save_data_to_disk(_in_memory_data)
+            if _data_modified:
+                _flush_locked(background=True)
+        wait_for_snapshot()
         
-        shutil.copy2(DATA_FILE, backup_file)
+        _storage.backup(backup_file)
         
         cleanup_manual_backups(max_backups=3)
         
@@ -322,7 +1067,7 @@ def cleanup_manual_backups(max_backups=3):
         
         manual_backups = []
         for filename in os.listdir(BACKUP_PATH):
-            if filename.endswith('.json') and filename.startswith('manual'):
+            if filename.endswith(BACKUP_EXTENSIONS) and filename.startswith('manual'):
                 filepath = os.path.join(BACKUP_PATH, filename)
                 mtime = os.path.getmtime(filepath)
                 manual_backups.append((filepath, mtime, filename))
@@ -346,7 +1091,7 @@ def get_backup_list(limit: int = 10) -> List[Dict]:
         
         backups = []
         for filename in os.listdir(BACKUP_PATH):
-            if filename.endswith('.json'):
+            if filename.endswith(BACKUP_EXTENSIONS):
                 filepath = os.path.join(BACKUP_PATH, filename)
                 mtime = os.path.getmtime(filepath)
                 size = os.path.getsize(filepath)
@@ -367,130 +1112,330 @@ def get_backup_list(limit: int = 10) -> List[Dict]:
 
 def get_database_size() -> Dict[str, Any]:
     try:
-        if not os.path.exists(DATA_FILE):
+        if not _storage.exists():
             return {"exists": False, "size": 0, "users": 0, "chats": 0}
         
-        size = os.path.getsize(DATA_FILE)
-        
-        with open(DATA_FILE, 'r', encoding='utf-8') as f:
-            data = json.load(f)
+        summary = _storage.describe()
         
         return {
             "exists": True,
-            "size": size,
-            "users": len(data.get("users", {})),
-            "chats": len(data.get("chats", {})),
-            "total_shleps": data.get("global_stats", {}).get("total_shleps", 0),
-            "last_modified": datetime.fromtimestamp(os.path.getmtime(DATA_FILE))
+            "engine": _storage.name,
+            "size": _storage.size(),
+            "users": summary["users"],
+            "chats": summary["chats"],
+            "total_shleps": summary["total_shleps"],
+            "last_modified": datetime.fromtimestamp(os.path.getmtime(_storage.path))
         }
     except Exception as e:
         logger.error(DATABASE_TEXTS['db_size_error'].format(error=e))
         return {"exists": False, "size": 0, "error": str(e)}
 
+def _prepare_shlep_rows(data, user_id_str: str, username: str, chat_id: Optional[int], now: int):
+    """
+    Досоздать строки игрока и чата и недостающие поля (шлёпок считает их нулём).
+    Всё, что может не найтись, ищется здесь — до первого изменения счётчиков.
+    """
+    users = data["users"]
+    user = users.get(user_id_str)
+    if user is None:
+        user = users[user_id_str] = {
+            "username": username,
+            "total_shleps": 0,
+            "max_damage": 0,
+            "last_shlep": now,
+            "bonus_damage": 0
+        }
+        data["global_stats"]["total_users"] = len(users)
+    user.setdefault("total_shleps", 0)
+    user.setdefault("max_damage", 0)
+    user.setdefault("bonus_damage", 0)
+    if not timeseries.is_series(user.get("activity")):
+        user["activity"] = timeseries.new_series()
+    
+    if not chat_id:
+        return user, None, None
+    
+    chat = data["chats"].get(str(chat_id))
+    if chat is None:
+        chat = data["chats"][str(chat_id)] = {
+            "total_shleps": 0,
+            "users": {},
+            "max_damage": 0,
+            "max_damage_user": None
+        }
+    chat.setdefault("total_shleps", 0)
+    if not isinstance(chat.get("users"), dict):
+        chat["users"] = {}
+    if not timeseries.is_series(chat.get("activity")):
+        chat["activity"] = timeseries.new_series()
+    
+    chat_user = chat["users"].setdefault(user_id_str, {"username": username, "total_shleps": 0})
+    chat_user.setdefault("total_shleps", 0)
+    return user, chat, chat_user
+
+def _apply_shlep(data, user_id: int, username: str, damage: int, chat_id: Optional[int], now: int) -> Tuple[int, int, int]:
+    """Применить шлёпок к данным (используется и при повторе журнала)"""
+    if not isinstance(now, int):
+        # Событие журнала до версии 3.1: момент ISO-строкой
+        now = to_epoch(now)
+    user_id_str = str(user_id)
+    user, chat, chat_user = _prepare_shlep_rows(data, user_id_str, username, chat_id, now)
+    
+    old_max_damage = user["max_damage"]
+    user["username"] = username
+    user["total_shleps"] += 1
+    user["last_shlep"] = now
+    
+    if damage > user["max_damage"]:
+        user["max_damage"] = damage
+    
+    if chat is not None:
+        chat["total_shleps"] += 1
+        
+        if damage > chat.get("max_damage", 0):
+            chat["max_damage"] = damage
+            chat["max_damage_user"] = username
+        
+        chat_user["username"] = username
+        chat_user["total_shleps"] += 1
+    
+    data["global_stats"]["total_shleps"] += 1
+    data["global_stats"]["last_shlep"] = now
+    
+    if damage > data["global_stats"]["max_damage"]:
+        data["global_stats"]["max_damage"] = damage
+        data["global_stats"]["max_damage_user"] = username
+        data["global_stats"]["max_damage_date"] = now
+    
+    timeseries.add(data["activity"], now)
+    timeseries.add_row(user["activity"], now)
+    if chat is not None:
+        timeseries.add_row(chat["activity"], now)
+    _apply_sketches(data, user_id_str, chat_id, timeseries.day_key(now))
+    
+    if damage >= 50:
+        record = {
+            "user_id": user_id,
+            "username": username,
+            "damage": damage,
+            "timestamp": now,
+            "chat_id": chat_id
+        }
+        data["records"].append(record)
+        
+        if len(data["records"]) > 5:
+            data["records"] = data["records"][-5:]
+    
+    return (
+        data["global_stats"]["total_shleps"],
+        user["total_shleps"],
+        old_max_damage
+    )
+
+def _sketch_key(day: str, chat_id: Optional[int] = None) -> str:
+    """Строка лидеров дня: бот целиком или отдельный чат"""
+    return day if chat_id is None else f"{day}:{chat_id}"
+
+def _hll_key(day: str) -> str:
+    """Строка регистров HyperLogLog дня (разные игроки)"""
+    return f"{day}:users"
+
+def _apply_sketches(data, user_id_str: str, chat_id: Optional[int], day: str) -> None:
+    """Учесть шлёпок в счётчиках дня: разные игроки и лидеры"""
+    rows = data.setdefault("sketches", {})
+    hll_row = rows.get(_hll_key(day))
+    if hll_row is None:
+        hll_row = rows[_hll_key(day)] = {"users": sketches.hll_new()}
+    hll_row["users"] = sketches.hll_add(hll_row["users"], user_id_str)
+    
+    row = rows.setdefault(day, {"top": {}, "errors": {}})
+    sketches.topk_add(row["top"], row["errors"], user_id_str, SKETCH_TOP_K)
+    
+    if chat_id:
+        chat_row = rows.setdefault(_sketch_key(day, chat_id), {"top": {}, "errors": {}})
+        sketches.topk_add(chat_row["top"], chat_row["errors"], user_id_str, SKETCH_TOP_K)
+
+def _prune_sketches(tx, today: str) -> None:
+    """Удалить счётчики дней старше SKETCH_DAYS (раз в сутки, с первым шлёпком дня)"""
+    oldest = (date.fromisoformat(today) - timedelta(days=SKETCH_DAYS - 1)).isoformat()
+    rows = tx.data["sketches"]
+    for key in [key for key in rows if key[:10] < oldest]:
+        del rows[key]
+        tx.touch("sketches", key)
+
+def _ensure_shlep_structure(tx) -> None:
+    """Досоздать секции, без которых шлёпок падает с KeyError"""
+    data = tx.data
+    for section, factory in (("users", dict), ("chats", dict), ("sketches", dict), ("records", list)):
+        if not isinstance(data.get(section), factory):
+            data[section] = factory()
+            tx.touch(section)
+    
+    if not timeseries.is_series(data.get("activity")):
+        data["activity"] = timeseries.new_series()
+        tx.touch("activity")
+    
+    global_stats = data.setdefault("global_stats", {})
+    if "total_shleps" not in global_stats or "max_damage" not in global_stats:
+        global_stats.setdefault("total_shleps", 0)
+        global_stats.setdefault("max_damage", 0)
+        global_stats.setdefault("max_damage_user", None)
+        tx.touch("global_stats")
+
+def _commit_shlep(tx, user_id: int, username: str, damage: int, chat_id: Optional[int]) -> Tuple[int, int, int]:
+    """Применить шлёпок внутри транзакции, записать событие и отметить строки"""
+    global _ranks, _unranked_users
+    now = int(time.time())
+    user_id_str = str(user_id)
+    previous = tx.data["users"].get(user_id_str)
+    previous_day = _epoch_day(previous.get("last_shlep")) if previous else None
+    # Строка без total_shleps не входит в индекс счётов (см. _unranked_users)
+    ranked = previous is not None and "total_shleps" in previous
+    day = timeseries.day_key(now)
+    new_day = day not in tx.data["sketches"]
+    # Новый час сворачивает старые корзины ряда — тогда ряд пишется целиком
+    hour, hour_of_day = timeseries.hour_key(now)
+    new_hour = hour not in tx.data["activity"]["h"]
+    # Регистры HyperLogLog пишутся, только если шлёпок изменил оценку
+    hll_row = tx.data["sketches"].get(_hll_key(day))
+    registers = hll_row.get("users") if hll_row else None
+    
+    result = _apply_shlep(tx.data, user_id, username, damage, chat_id, now)
+    tx.event("shlep", user_id=user_id, username=username, damage=damage, chat_id=chat_id, now=now)
+    
+    if ranked:
+        _ranks = _ranks.move(result[1] - 1, result[1])
+    else:
+        _ranks = _ranks.add(result[1])
+        if previous is not None:
+            _unranked_users -= 1
+    if previous is not None:
+        _count_level(_level_bucket(result[1] - 1), -1)
+    _count_level(_level_bucket(result[1]), 1)
+    _count_activity(previous_day, -1)
+    _count_activity(day, 1)
+    _update_leaderboard(user_id_str, result[1])
+    if chat_id:
+        chat_id_str = str(chat_id)
+        member = tx.data["chats"][chat_id_str]["users"][user_id_str]
+        _chat_leaderboards.setdefault(chat_id_str, Leaderboard()).update(user_id_str, member["total_shleps"])
+        _boards_changed.add(chat_id_str)
+    tx.touch("users", user_id_str)
+    tx.touch("global_stats")
+    if new_hour:
+        tx.touch("activity")
+    else:
+        tx.touch("activity", "h", hour)
+        tx.touch("activity", "hod", hour_of_day)
+    tx.touch("sketches", day)
+    if tx.data["sketches"][_hll_key(day)]["users"] is not registers:
+        tx.touch("sketches", _hll_key(day))
+    if chat_id:
+        tx.touch("chats", str(chat_id))
+        tx.touch("chats", str(chat_id), user_id_str)
+        tx.touch("sketches", _sketch_key(day, chat_id))
+    if damage >= 50:
+        tx.touch("records")
+    if new_day:
+        _prune_sketches(tx, day)
+    return result
+
 def add_shlep(user_id: int, username: str, damage: int, chat_id: Optional[int] = None) -> Tuple[int, int, int]:
     try:
-        global _in_memory_data, _data_modified
+        with transaction() as tx:
+            _ensure_shlep_structure(tx)
+            return _commit_shlep(tx, user_id, username, damage, chat_id)
         
-        with _data_lock:
-            if _in_memory_data is None:
-                _in_memory_data = ensure_data_file()
-            
-            data = _in_memory_data
-            now = datetime.now().isoformat()
-            user_id_str = str(user_id)
-            
-            if user_id_str not in data["users"]:
-                data["users"][user_id_str] = {
-                    "username": username,
-                    "total_shleps": 0,
-                    "max_damage": 0,
-                    "last_shlep": now,
-                    "bonus_damage": 0
-                }
-                data["global_stats"]["total_users"] = len(data["users"])
-            
-            user = data["users"][user_id_str]
-            old_max_damage = user["max_damage"]
-            user["username"] = username
-            user["total_shleps"] += 1
-            user["last_shlep"] = now
-            
-            if damage > user["max_damage"]:
-                user["max_damage"] = damage
-            
-            if chat_id:
-                chat_id_str = str(chat_id)
-                
-                if chat_id_str not in data["chats"]:
-                    data["chats"][chat_id_str] = {
-                        "total_shleps": 0,
-                        "users": {}
-                    }
-                
-                chat = data["chats"][chat_id_str]
-                chat["total_shleps"] += 1
-                
-                if user_id_str not in chat["users"]:
-                    chat["users"][user_id_str] = {
-                        "username": username,
-                        "total_shleps": 0
-                    }
-                
-                chat_user = chat["users"][user_id_str]
-                chat_user["username"] = username
-                chat_user["total_shleps"] += 1
-            
-            data["global_stats"]["total_shleps"] += 1
-            data["global_stats"]["last_shlep"] = now
-            
-            if damage > data["global_stats"]["max_damage"]:
-                data["global_stats"]["max_damage"] = damage
-                data["global_stats"]["max_damage_user"] = username
-                data["global_stats"]["max_damage_date"] = now
-            
-            date_key = datetime.now().strftime("%Y-%m-%d")
-            if date_key not in data["timestamps"]:
-                data["timestamps"][date_key] = 0
-            data["timestamps"][date_key] += 1
-            
-            if damage >= 50:
-                record = {
-                    "user_id": user_id,
-                    "username": username,
-                    "damage": damage,
-                    "timestamp": now,
-                    "chat_id": chat_id
-                }
-                data["records"].append(record)
-                
-                if len(data["records"]) > 5:
-                    data["records"] = data["records"][-5:]
-            
-            _data_modified = True
+    except Exception as e:
+        logger.error(DATABASE_TEXTS['add_shlep_error'].format(error=e), exc_info=True)
+        return (0, 0, 0)
+
+def calc_level(cnt):
+    if cnt is None or cnt < 0:
+        cnt = 0
+    
+    if cnt == 0:
+        return {
+            'level': 1,
+            'progress': 0,
+            'min': 10,
+            'max': 25,
+            'next': 10
+        }
+    
+    level = max(1, (cnt - 1) // 10 + 1)
+    
+    progress = (cnt % 10) * 10 if cnt % 10 != 0 else 0
+    
+    if level > 1000:
+        min_dmg = 10 + 1000 * 2 + (level - 1000) * 1
+        max_dmg = 15 + 1000 * 3 + (level - 1000) * 2
+    else:
+        min_dmg = int(10 * (1.02 ** min(level - 1, 100)))
+        max_dmg = int(20 * (1.08 ** min(level - 1, 100)))
+    
+    if max_dmg <= min_dmg:
+        max_dmg = min_dmg + 10
+    
+    next_shleps = 10 - (cnt % 10) if cnt % 10 != 0 else 10
+    
+    return {
+        'level': level,
+        'progress': progress,
+        'min': min_dmg,
+        'max': max_dmg,
+        'next': next_shleps
+    }
+
+def _shlep_count(user: Optional[Dict[str, Any]]) -> int:
+    try:
+        return int((user or {}).get("total_shleps") or 0)
+    except (ValueError, TypeError):
+        return 0
+
+def shlep(user_id: int, username: str, chat_id: Optional[int] = None) -> Optional[Dict[str, Any]]:
+    """
+    Шлёпок целиком за один проход под блокировкой: уровень по текущему
+    счёту, бросок урона с бонусом, применение и итоговые цифры для ответа.
+    """
+    try:
+        with transaction() as tx:
+            _ensure_shlep_structure(tx)
             
-            return (
-                data["global_stats"]["total_shleps"],
-                user["total_shleps"],
-                old_max_damage
-            )
+            user = tx.data["users"].get(str(user_id))
+            level = calc_level(_shlep_count(user))
+            damage = random.randint(level['min'], level['max'])
+            if user:
+                damage += user.get("bonus_damage", 0)
             
+            total, user_total, previous_max = _commit_shlep(tx, user_id, username, damage, chat_id)
+        
+        return {
+            "damage": damage,
+            "total_shleps": total,
+            "user_shleps": user_total,
+            "previous_max_damage": previous_max,
+            "record": damage > previous_max,
+            "level": calc_level(user_total)
+        }
+        
     except Exception as e:
         logger.error(DATABASE_TEXTS['add_shlep_error'].format(error=e), exc_info=True)
-        return (0, 0, 0)
+        return None
 
 def get_stats() -> Tuple[int, Optional[datetime], int, Optional[str], Optional[datetime]]:
     try:
-        data = load_data()
+        data = read_data()
         
         last_shlep = data["global_stats"].get("last_shlep")
         max_damage_date = data["global_stats"].get("max_damage_date")
         
         return (
             data["global_stats"].get("total_shleps", 0),
-            datetime.fromisoformat(last_shlep) if last_shlep else None,
+            datetime.fromtimestamp(last_shlep) if last_shlep else None,
             data["global_stats"].get("max_damage", 0),
             data["global_stats"].get("max_damage_user"),
-            datetime.fromisoformat(max_damage_date) if max_damage_date else None
+            datetime.fromtimestamp(max_damage_date) if max_damage_date else None
         )
     except Exception as e:
         logger.error(DATABASE_TEXTS['get_stats_error'].format(error=e))
@@ -498,23 +1443,150 @@ def get_stats() -> Tuple[int, Optional[datetime], int, Optional[str], Optional[d
 
 def get_top_users(limit: int = 10) -> List[Tuple[str, int]]:
     try:
-        data = load_data()
+        current = _read_snapshot()
+        if limit <= TOP_SIZE:
+            return list(current.top[:limit])
         
-        users_list = []
-        for user_id, user_data in data["users"].items():
-            username = user_data.get("username", f"Игрок_{user_id}")
-            total = user_data.get("total_shleps", 0)
-            users_list.append((username, total))
-        
-        users_list.sort(key=lambda x: x[1], reverse=True)
-        return users_list[:limit]
+        with _data_lock:
+            return list(_top_users_locked(limit))
     except Exception as e:
         logger.error(DATABASE_TEXTS['top_users_error'].format(error=e))
         return []
 
+def get_comparison_stats(user_id: int) -> Dict[str, Any]:
+    """
+    Сравнение игрока с остальными по индексу счётов из снимка, без блокировки.
+    Место — 1 + число игроков с большим счётом; если такого счёта
+    ни у кого нет (игрок ещё не шлёпал), место после всех.
+    """
+    default = {"total_users": 0, "avg_shleps": 0, "rank": 1, "percentile": 100}
+    try:
+        current = _read_snapshot()
+        ranks = current.ranks
+        total_users = ranks.total
+        if not total_users:
+            return {**default, "total_users": current.unranked}
+        
+        user = current.data["users"].get(str(user_id))
+        user_shleps = _shlep_count(user)
+        if ranks.count(user_shleps):
+            rank = ranks.count_above(user_shleps) + 1
+        else:
+            rank = total_users + 1
+        avg_shleps = ranks.sum / total_users
+        
+        if total_users > 1:
+            percentile = (total_users - rank) / (total_users - 1) * 100
+        else:
+            percentile = 100
+        
+        return {
+            "total_users": total_users,
+            "avg_shleps": round(avg_shleps, 1),
+            "rank": rank,
+            "percentile": round(percentile, 1)
+        }
+    except Exception as e:
+        logger.error(DATABASE_TEXTS['comparison_stats_error'].format(error=e))
+        return default
+
+def get_activity_summary() -> Dict[str, Any]:
+    """
+    Сводка по игрокам для админки из поддерживаемых счётчиков:
+    активность по календарным дням, шлёпки, рекордсмен и уровни.
+    """
+    try:
+        current = _read_snapshot()
+        total_users = len(current.data.get("users", {}))
+        today = date.today()
+        week_days = [(today - timedelta(days=i)).isoformat() for i in range(_ACTIVE_WEEK_DAYS)]
+        if current.top:
+            max_user, max_shleps = current.top[0]
+            max_user = max_user[:20]
+        else:
+            max_user, max_shleps = None, 0
+        
+        return {
+            "total_users": total_users,
+            "active_today": current.activity_days.get(week_days[0], 0),
+            "active_week": sum(current.activity_days.get(day, 0) for day in week_days),
+            "total_shleps": current.ranks.sum,
+            "avg_shleps": current.ranks.sum / total_users if total_users else 0,
+            "max_user": max_user,
+            "max_shleps": max_shleps,
+            "levels": sorted((level, count) for level, count in current.levels.items() if count)
+        }
+    except Exception as e:
+        logger.error(DATABASE_TEXTS['activity_summary_error'].format(error=e))
+        return {}
+
+def _day_leaders(data, counters: Dict[str, int], limit: int) -> List[Tuple[str, int]]:
+    users = data["users"]
+    return [
+        (users.get(user_id, {}).get("username", f"Игрок_{user_id}"), count)
+        for user_id, count in sketches.topk_items(counters, limit)
+    ]
+
+def get_activity_sketches(chat_id: Optional[int] = None, limit: int = 5) -> Dict[str, Any]:
+    """
+    Оценки по счётчикам дней: разные игроки за день, 7 и 30 дней
+    и лидеры сегодняшнего дня (бота и, если указан, чата).
+    """
+    try:
+        data = read_data()
+        rows = data.get("sketches", {})
+        today = date.today()
+        days = [(today - timedelta(days=i)).isoformat() for i in range(30)]
+        
+        def distinct(period: int) -> int:
+            registers = [rows[_hll_key(day)]["users"] for day in days[:period] if _hll_key(day) in rows]
+            return sketches.hll_count(sketches.hll_merge(registers))
+        
+        today_row = rows.get(days[0], {})
+        result = {
+            "dau": distinct(1),
+            "wau": distinct(7),
+            "mau": distinct(30),
+            "top": _day_leaders(data, today_row.get("top", {}), limit),
+            "chat_top": []
+        }
+        if chat_id:
+            chat_row = rows.get(_sketch_key(days[0], chat_id), {})
+            result["chat_top"] = _day_leaders(data, chat_row.get("top", {}), limit)
+        return result
+    except Exception as e:
+        logger.error(DATABASE_TEXTS['activity_sketches_error'].format(error=e))
+        return {"dau": 0, "wau": 0, "mau": 0, "top": [], "chat_top": []}
+
+def _activity_series(data, chat_id: Optional[int] = None, user_id: Optional[int] = None):
+    if user_id is not None:
+        return data["users"].get(str(user_id), {}).get("activity")
+    if chat_id is not None:
+        return data["chats"].get(str(chat_id), {}).get("activity")
+    return data.get("activity")
+
+def get_activity_chart(chat_id: Optional[int] = None, user_id: Optional[int] = None, days: int = 7) -> List[Tuple[str, int]]:
+    """Шлёпки по дням за последние days дней: бота, чата или игрока"""
+    try:
+        series = _activity_series(read_data(), chat_id, user_id)
+        today = date.today()
+        dates = [(today - timedelta(days=i)).isoformat() for i in range(days - 1, -1, -1)]
+        return timeseries.daily_counts(series or {}, dates)
+    except Exception as e:
+        logger.error(DATABASE_TEXTS['activity_chart_error'].format(error=e))
+        return []
+
+def get_favourite_hour(chat_id: Optional[int] = None, user_id: Optional[int] = None) -> Optional[Tuple[int, int]]:
+    """Любимый час шлёпков: (час, шлёпки) или None, если шлёпков не было"""
+    try:
+        return timeseries.favourite_hour(_activity_series(read_data(), chat_id, user_id))
+    except Exception as e:
+        logger.error(DATABASE_TEXTS['activity_chart_error'].format(error=e))
+        return None
+
 def get_user_stats(user_id: int) -> Tuple[Optional[str], int, Optional[datetime]]:
     try:
-        data = load_data()
+        data = read_data()
         
         user_id_str = str(user_id)
         user_data = data["users"].get(user_id_str)
@@ -534,21 +1606,9 @@ def get_user_stats(user_id: int) -> Tuple[Optional[str], int, Optional[datetime]
         except (ValueError, TypeError):
             shlep_count = 0
         
-        # Получаем и преобразуем дату последнего шлёпка
-        last_shlep = None
-        last_shlep_str = user_data.get("last_shlep")
-        
-        if last_shlep_str:
-            try:
-                # Убираем возможный Z и приводим к ISO формату
-                if 'Z' in last_shlep_str:
-                    last_shlep_str = last_shlep_str.replace('Z', '+00:00')
-                
-                # Преобразуем строку в datetime
-                last_shlep = datetime.fromisoformat(last_shlep_str)
-            except Exception as e:
-                logger.warning(f"Не удалось преобразовать дату для user {user_id}: {last_shlep_str}, ошибка: {e}")
-                last_shlep = None
+        # Момент последнего шлёпка хранится секундами эпохи
+        moment = user_data.get("last_shlep")
+        last_shlep = datetime.fromtimestamp(moment) if moment else None
         
         return (
             user_data.get("username", f"User_{user_id}"),
@@ -561,27 +1621,21 @@ def get_user_stats(user_id: int) -> Tuple[Optional[str], int, Optional[datetime]
 
 def get_chat_stats(chat_id: int) -> Dict[str, Any]:
     try:
-        data = load_data()
+        data = read_data()
         
         chat_data = data["chats"].get(str(chat_id))
         if not chat_data:
             return {}
         
-        max_damage = 0
-        max_damage_user = None
-        
-        for user_id, user_data in data["users"].items():
-            if user_id in chat_data.get("users", {}):
-                user_damage = user_data.get("max_damage", 0)
-                if user_damage > max_damage:
-                    max_damage = user_damage
-                    max_damage_user = user_data.get("username")
+        today = date.today()
+        week = [(today - timedelta(days=i)).isoformat() for i in range(6, -1, -1)]
         
         return {
             "total_users": len(chat_data.get("users", {})),
             "total_shleps": chat_data.get("total_shleps", 0),
-            "max_damage": max_damage,
-            "max_damage_user": max_damage_user
+            "max_damage": chat_data.get("max_damage", 0),
+            "max_damage_user": chat_data.get("max_damage_user"),
+            "activity": timeseries.daily_counts(chat_data.get("activity") or {}, week)
         }
     except Exception as e:
         logger.error(DATABASE_TEXTS['chat_stats_error'].format(error=e))
@@ -589,30 +1643,55 @@ def get_chat_stats(chat_id: int) -> Dict[str, Any]:
 
 def get_chat_top_users(chat_id: int, limit: int = 10) -> List[Tuple[str, int]]:
     try:
-        data = load_data()
-        
-        chat_data = data["chats"].get(str(chat_id))
-        if not chat_data:
-            return []
-        
-        users_list = []
-        for user_id, user_data in chat_data.get("users", {}).items():
-            username = user_data.get("username", f"Игрок_{user_id}")
-            total = user_data.get("total_shleps", 0)
-            users_list.append((username, total))
-        
-        users_list.sort(key=lambda x: x[1], reverse=True)
-        return users_list[:limit]
+        page = get_chat_top_page(chat_id, page_size=limit)
+        return [(username, total) for _, username, total in page["items"]]
     except Exception as e:
         logger.error(DATABASE_TEXTS['chat_top_error'].format(error=e))
         return []
 
+def get_chat_top_page(chat_id: int, page: int = 1, cursor: Optional[Tuple[int, int]] = None,
+                      page_size: int = 10) -> Dict[str, Any]:
+    """
+    Страница топа чата по рейтингу участников.
+    cursor — начало страницы из кнопки ◀ или ▶ (O(размер страницы)),
+    без курсора страница ищется по номеру. Ответ несёт курсоры
+    предыдущей ("prev") и следующей ("next") страниц.
+    """
+    try:
+        chat_id_str = str(chat_id)
+        current = _read_snapshot()
+        board = current.chat_boards.get(chat_id_str)
+        total = len(board) if board else 0
+        pages = max(1, -(-total // page_size))
+        page = min(max(1, page), pages)
+        
+        if not total:
+            return {"items": [], "page": 1, "pages": 1, "total": 0, "prev": None, "next": None}
+        
+        if cursor is None:
+            cursor = board.seek((page - 1) * page_size)
+        members, next_cursor = board.page(cursor, page_size)
+        prev_cursor = board.before(cursor, page_size) if page > 1 else None
+        
+        chat_users = current.data["chats"][chat_id_str].get("users", {})
+        first_rank = (page - 1) * page_size + 1
+        items = [
+            (rank, chat_users[user_id].get("username", f"Игрок_{user_id}"), total_shleps)
+            for rank, (user_id, total_shleps) in enumerate(members, first_rank)
+        ]
+        
+        return {"items": items, "page": page, "pages": pages, "total": total, "prev": prev_cursor, "next": next_cursor}
+    except Exception as e:
+        logger.error(DATABASE_TEXTS['chat_top_error'].format(error=e))
+        return {"items": [], "page": 1, "pages": 1, "total": 0, "prev": None, "next": None}
+
 def backup_database():
     return create_safe_backup("command")
 
 def check_data_integrity():
     try:
-        data = load_data()
+        current = _read_snapshot()
+        data = current.data
         
         errors = []
         warnings = []
@@ -622,7 +1701,9 @@ def check_data_integrity():
             if key not in data:
                 errors.append(f"Отсутствует ключ: {key}")
         
-        total_from_users = sum(user.get("total_shleps", 0) for user in data.get("users", {}).values())
+        # Сумма счётов игроков ведётся индексом счётов (игроки без счёта дают ноль);
+        # индекс и глобальный счётчик берутся из одного снимка
+        total_from_users = current.ranks.sum
         total_in_global = data.get("global_stats", {}).get("total_shleps", 0)
         
         if total_from_users != total_in_global:
@@ -645,27 +1726,63 @@ def check_data_integrity():
             "stats": {}
         }
 
+def _index_votes(votes: Dict[str, Dict[str, Any]]) -> None:
+    """
+    Перестроить индекс активных голосований и кучу сроков (вызывать под _data_lock).
+    Индекс читают без блокировки, поэтому он собирается заново и подменяется целиком.
+    """
+    global _active_votes, _vote_expiry
+    expiry = [(vote["ends_at"], vote_id) for vote_id, vote in votes.items() if vote.get("ends_at")]
+    heapq.heapify(expiry)
+    
+    active = {}
+    for vote_id, vote in votes.items():
+        if vote.get("active", False):
+            current = votes.get(active.get(vote.get("chat_id")))
+            if current is None or (vote.get("ends_at") or 0) > (current.get("ends_at") or 0):
+                active[vote.get("chat_id")] = vote_id
+    _active_votes, _vote_expiry = active, expiry
+
+def _index_vote(vote: Dict[str, Any]) -> None:
+    """Учесть новое голосование в индексе и куче сроков (вызывать под _data_lock)"""
+    _active_votes[vote["chat_id"]] = vote["id"]
+    heapq.heappush(_vote_expiry, (vote["ends_at"], vote["id"]))
+
+def _unindex_vote(vote: Dict[str, Any]) -> None:
+    """Голосование больше не активно (запись в куче удалится при очистке)"""
+    if _active_votes.get(vote.get("chat_id")) == vote.get("id"):
+        del _active_votes[vote["chat_id"]]
+
+def _apply_vote_create(data, vote: Dict[str, Any]) -> bool:
+    # События журнала до версий 3.1 и 3.2
+    _epoch_fields(vote, _VOTE_MOMENTS)
+    _ballots_from_lists(vote)
+    data["votes"][vote["id"]] = vote
+    return True
+
 def create_vote(chat_id: int, question: str, duration_minutes: int = 5) -> str:
     try:
-        data = load_data()
-        
-        vote_id = f"{chat_id}_{int(datetime.now().timestamp())}"
-        ends_at = datetime.now() + timedelta(minutes=duration_minutes)
+        created_at = int(time.time())
+        vote_id = f"{chat_id}_{created_at}"
         
         vote_data = {
             "id": vote_id,
             "chat_id": chat_id,
             "question": question,
-            "created_at": datetime.now().isoformat(),
-            "ends_at": ends_at.isoformat(),
-            "votes_yes": [],
-            "votes_no": [],
+            "created_at": created_at,
+            "ends_at": created_at + duration_minutes * 60,
+            "ballots": {},
+            "yes_count": 0,
+            "no_count": 0,
             "active": True,
             "message_id": None
         }
         
-        data["votes"][vote_id] = vote_data
-        save_data(data)
+        with transaction() as tx:
+            _apply_vote_create(tx.data, vote_data)
+            _index_vote(vote_data)
+            tx.touch("votes", vote_id)
+            tx.event("vote_create", vote=vote_data)
         
         return vote_id
     except Exception as e:
@@ -674,135 +1791,208 @@ def create_vote(chat_id: int, question: str, duration_minutes: int = 5) -> str:
 
 def get_vote(vote_id: str):
     try:
-        data = load_data()
+        data = read_data()
         return data["votes"].get(vote_id)
     except:
         return None
 
 def get_active_chat_vote(chat_id: int):
     try:
-        data = load_data()
-        now = datetime.now()
-        
-        for vote_id, vote in data["votes"].items():
-            if (vote.get("chat_id") == chat_id and 
+        # Снимок первым: он же загружает данные и строит индекс при первом чтении
+        votes = read_data()["votes"]
+        vote_id = _active_votes.get(chat_id)
+        if vote_id is None:
+            return None
+        
+        # Индекс ведёт писатель; само голосование берём из снимка и перепроверяем
+        vote = votes.get(vote_id)
+        if (vote and vote.get("chat_id") == chat_id and
                 vote.get("active", False) and
-                datetime.fromisoformat(vote["ends_at"]) > now):
-                return vote
+                vote["ends_at"] > time.time()):
+            return vote
         return None
     except:
         return None
 
+def _apply_vote_cast(data, vote_id: str, user_id: int, vote_type: str) -> bool:
+    vote = data["votes"].get(vote_id)
+    
+    if not vote or not vote.get("active", False):
+        return False
+    
+    user_id_str = str(user_id)
+    choice = "yes" if vote_type == "yes" else "no"
+    ballots = vote.setdefault("ballots", {})
+    
+    previous = ballots.get(user_id_str)
+    if previous != choice:
+        if previous is not None:
+            vote[f"{previous}_count"] -= 1
+        ballots[user_id_str] = choice
+        vote[f"{choice}_count"] = vote.get(f"{choice}_count", 0) + 1
+    return True
+
 def add_user_vote(vote_id: str, user_id: int, vote_type: str) -> bool:
     try:
-        data = load_data()
-        vote = data["votes"].get(vote_id)
-        
-        if not vote or not vote.get("active", False):
-            return False
-        
-        user_id_str = str(user_id)
-        
-        if user_id_str in vote["votes_yes"]:
-            vote["votes_yes"].remove(user_id_str)
-        if user_id_str in vote["votes_no"]:
-            vote["votes_no"].remove(user_id_str)
-        
-        if vote_type == "yes":
-            vote["votes_yes"].append(user_id_str)
-        else:
-            vote["votes_no"].append(user_id_str)
-        
-        save_data(data)
+        with transaction() as tx:
+            if not _apply_vote_cast(tx.data, vote_id, user_id, vote_type):
+                return False
+            
+            # Строка голосования (счётчики) и один голос, без остальных голосов
+            tx.touch("votes", vote_id)
+            tx.touch("votes", vote_id, str(user_id))
+            tx.event("vote_cast", vote_id=vote_id, user_id=user_id, vote_type=vote_type)
         return True
     except Exception as e:
         logger.error(DATABASE_TEXTS['add_vote_error'].format(error=e))
         return False
 
-def finish_vote(vote_id: str):
+def _apply_vote_finish(data, vote_id: str, finished_at: int) -> bool:
+    vote = data["votes"].get(vote_id)
+    if not vote:
+        return False
+    vote["active"] = False
+    vote["finished_at"] = to_epoch(finished_at)
+    return True
+
+def finish_votes(vote_ids: List[str]) -> List[Dict[str, Any]]:
+    """Завершить голосования одной транзакцией, вернуть завершённые"""
     try:
-        data = load_data()
-        vote = data["votes"].get(vote_id)
-        
-        if vote:
-            vote["active"] = False
-            vote["finished_at"] = datetime.now().isoformat()
-            save_data(data)
-            return vote
-        return None
+        finished_at = int(time.time())
+        finished = []
+        
+        with transaction() as tx:
+            for vote_id in vote_ids:
+                if not _apply_vote_finish(tx.data, vote_id, finished_at):
+                    continue
+                _unindex_vote(tx.data["votes"][vote_id])
+                
+                tx.touch("votes", vote_id)
+                tx.event("vote_finish", vote_id=vote_id, finished_at=finished_at)
+                finished.append(dict(tx.data["votes"][vote_id]))
+        return finished
     except Exception as e:
         logger.error(DATABASE_TEXTS['finish_vote_error'].format(error=e))
-        return None
+        return []
+
+def finish_vote(vote_id: str):
+    finished = finish_votes([vote_id])
+    return finished[0] if finished else None
+
+def get_pending_votes() -> List[Dict[str, Any]]:
+    """Незавершённые голосования всех чатов (восстановление таймеров после перезапуска)"""
+    try:
+        return [vote for vote in read_data()["votes"].values() if vote.get("active", False)]
+    except Exception as e:
+        logger.error(DATABASE_TEXTS['pending_votes_error'].format(error=e))
+        return []
+
+def _apply_vote_cleanup(data, vote_ids: List[str]) -> bool:
+    for vote_id in vote_ids:
+        data["votes"].pop(vote_id, None)
+    return bool(vote_ids)
 
 def cleanup_old_votes():
     try:
-        data = load_data()
-        now = datetime.now()
+        cutoff = int(time.time()) - _VOTE_KEEP_SECONDS
         to_delete = []
         
-        for vote_id, vote in data["votes"].items():
-            ends_at = datetime.fromisoformat(vote["ends_at"])
-            if not vote.get("active", False) and (now - ends_at).days >= 1:
-                to_delete.append(vote_id)
-        
-        for vote_id in to_delete:
-            del data["votes"][vote_id]
+        with transaction() as tx:
+            votes = tx.data["votes"]
+            still_active = []
+            
+            # Из кучи достаём только голосования, закончившиеся больше суток назад
+            while _vote_expiry and _vote_expiry[0][0] <= cutoff:
+                ends_at, vote_id = heapq.heappop(_vote_expiry)
+                vote = votes.get(vote_id)
+                if vote is None or vote.get("ends_at") != ends_at:
+                    continue
+                if vote.get("active", False):
+                    still_active.append((ends_at, vote_id))
+                else:
+                    to_delete.append(vote_id)
+            
+            for entry in still_active:
+                heapq.heappush(_vote_expiry, entry)
+            
+            if _apply_vote_cleanup(tx.data, to_delete):
+                for vote_id in to_delete:
+                    tx.touch("votes", vote_id)
+                tx.event("vote_cleanup", vote_ids=to_delete)
         
         if to_delete:
-            save_data(data)
             logger.info(DATABASE_TEXTS['cleanup_votes'].format(count=len(to_delete)))
     except Exception as e:
         logger.error(DATABASE_TEXTS['cleanup_votes_error'].format(error=e))
 
+def _apply_vote_message(data, vote_id: str, message_id: int) -> bool:
+    vote = data["votes"].get(vote_id)
+    if not vote:
+        return False
+    vote["message_id"] = message_id
+    return True
+
 def update_vote_message_id(vote_id: str, message_id: int):
     try:
-        data = load_data()
-        vote = data["votes"].get(vote_id)
+        with transaction() as tx:
+            if not _apply_vote_message(tx.data, vote_id, message_id):
+                return False
 
-        if vote:
-            vote["message_id"] = message_id
-            save_data(data)
-            return True
-        return False
+            tx.touch("votes", vote_id)
+            tx.event("vote_message", vote_id=vote_id, message_id=message_id)
+        return True
     except:
         return False
 
-def ban_user(chat_id: int, user_id: int):
-    """Забанить пользователя в чате"""
-    try:
-        data = load_data()
-        chat_id_str = str(chat_id)
+def _apply_ban_user(data, chat_id: int, user_id: int) -> bool:
+    chat_id_str = str(chat_id)
 
-        if chat_id_str not in data["chats"]:
-            data["chats"][chat_id_str] = {"total_shleps": 0, "banned_users": []}
+    if chat_id_str not in data["chats"]:
+        data["chats"][chat_id_str] = {"total_shleps": 0, "banned_users": []}
 
-        chat_data = data["chats"][chat_id_str]
-        chat_data.setdefault("banned_users", [])
+    chat_data = data["chats"][chat_id_str]
+    chat_data.setdefault("banned_users", [])
 
-        if user_id not in chat_data["banned_users"]:
-            chat_data["banned_users"].append(user_id)
-            save_data(data)
-            logger.info(f"Пользователь {user_id} забанен в чате {chat_id}")
-            return True
+    if user_id in chat_data["banned_users"]:
         return False
+    chat_data["banned_users"].append(user_id)
+    return True
+
+def ban_user(chat_id: int, user_id: int):
+    """Забанить пользователя в чате"""
+    try:
+        with transaction() as tx:
+            if not _apply_ban_user(tx.data, chat_id, user_id):
+                return False
+            _update_moderation(str(chat_id), tx.data["chats"].get(str(chat_id)))
+
+            tx.touch("chats", str(chat_id))
+            tx.event("ban_user", chat_id=chat_id, user_id=user_id)
+        logger.info(f"Пользователь {user_id} забанен в чате {chat_id}")
+        return True
     except Exception as e:
         logger.error(f"Ошибка бана пользователя {user_id} в чате {chat_id}: {e}")
         return False
 
+def _apply_unban_user(data, chat_id: int, user_id: int) -> bool:
+    chat_data = data["chats"].get(str(chat_id))
+    if chat_data and user_id in chat_data.get("banned_users", []):
+        chat_data["banned_users"].remove(user_id)
+        return True
+    return False
+
 def unban_user(chat_id: int, user_id: int):
     """Разбанить пользователя в чате"""
     try:
-        data = load_data()
-        chat_id_str = str(chat_id)
+        with transaction() as tx:
+            if not _apply_unban_user(tx.data, chat_id, user_id):
+                return False
+            _update_moderation(str(chat_id), tx.data["chats"].get(str(chat_id)))
 
-        chat_data = data["chats"].get(chat_id_str)
-        if chat_data and "banned_users" in chat_data:
-            if user_id in chat_data["banned_users"]:
-                chat_data["banned_users"].remove(user_id)
-                save_data(data)
-                logger.info(f"Пользователь {user_id} разбанен в чате {chat_id}")
-                return True
-        return False
+            tx.touch("chats", str(chat_id))
+            tx.event("unban_user", chat_id=chat_id, user_id=user_id)
+        logger.info(f"Пользователь {user_id} разбанен в чате {chat_id}")
+        return True
     except Exception as e:
         logger.error(f"Ошибка разбана пользователя {user_id} в чате {chat_id}: {e}")
         return False
@@ -810,7 +2000,7 @@ def unban_user(chat_id: int, user_id: int):
 def get_banned_users(chat_id: int) -> list:
     """Получить список забаненных пользователей в чате"""
     try:
-        data = load_data()
+        data = read_data()
         chat_id_str = str(chat_id)
         chat_data = data["chats"].get(chat_id_str, {})
         return chat_data.get("banned_users", [])
@@ -821,7 +2011,7 @@ def get_banned_users(chat_id: int) -> list:
 def get_banned_words(chat_id: int) -> list:
     """Получить список забаненных слов в чате"""
     try:
-        data = load_data()
+        data = read_data()
         chat_id_str = str(chat_id)
         chat_data = data["chats"].get(chat_id_str, {})
         return chat_data.get("banned_words", [])
@@ -829,87 +2019,153 @@ def get_banned_words(chat_id: int) -> list:
         logger.error(f"Ошибка получения забаненных слов для чата {chat_id}: {e}")
         return []
 
-def add_banned_word(chat_id: int, word: str) -> bool:
-    """Добавить забаненное слово в чате"""
-    try:
-        data = load_data()
-        chat_id_str = str(chat_id)
+def _moderation_profile(chat_data: Optional[Dict[str, Any]], previous: Optional[ModerationProfile] = None,
+                        words_changed: bool = True) -> Optional[ModerationProfile]:
+    """
+    Профиль модерации чата (None — модерация не настроена).
+    Банворды компилируются заново только при изменении их списка.
+    """
+    global _moderation_version
+    chat_data = chat_data or {}
+    banned_users = frozenset(chat_data.get("banned_users") or ())
+    auto_shlep_users = frozenset(chat_data.get("auto_shlep_users") or ())
+    words = chat_data.get("banned_words") or []
 
-        if chat_id_str not in data["chats"]:
-            data["chats"][chat_id_str] = {"total_shleps": 0, "banned_users": [], "banned_words": []}
+    if not (banned_users or auto_shlep_users or words):
+        return None
 
-        chat_data = data["chats"][chat_id_str]
-        chat_data.setdefault("banned_words", [])
+    _moderation_version += 1
+    if words_changed or previous is None:
+        matcher = WordMatcher(words, _moderation_version) if words else None
+    else:
+        matcher = previous.words
+    return ModerationProfile(banned_users, auto_shlep_users, matcher, _moderation_version)
 
-        if word not in chat_data["banned_words"]:
-            chat_data["banned_words"].append(word.lower())
-            save_data(data)
-            logger.info(f"Слово '{word}' добавлено в банворды чата {chat_id}")
-            return True
+def _update_moderation(chat_id_str: str, chat_data: Optional[Dict[str, Any]], words_changed: bool = False) -> None:
+    """Пересобрать профиль модерации чата (вызывать под _data_lock)"""
+    profile = _moderation_profile(chat_data, _moderation_profiles.get(chat_id_str), words_changed)
+    if profile is None:
+        _moderation_profiles.pop(chat_id_str, None)
+    else:
+        _moderation_profiles[chat_id_str] = profile
+
+def get_moderation_profile(chat_id: int) -> Optional[ModerationProfile]:
+    """Профиль модерации чата (None — модерация в чате не настроена)"""
+    # Профили строятся при загрузке данных вместе с первым снимком
+    _read_snapshot()
+    return _moderation_profiles.get(str(chat_id))
+
+def _apply_banned_word_add(data, chat_id: int, word: str) -> bool:
+    chat_id_str = str(chat_id)
+
+    if chat_id_str not in data["chats"]:
+        data["chats"][chat_id_str] = {"total_shleps": 0, "banned_users": [], "banned_words": []}
+
+    chat_data = data["chats"][chat_id_str]
+    chat_data.setdefault("banned_words", [])
+
+    if word.lower() in chat_data["banned_words"]:
         return False
+    chat_data["banned_words"].append(word.lower())
+    return True
+
+def add_banned_word(chat_id: int, word: str) -> bool:
+    """Добавить забаненное слово в чате"""
+    try:
+        with transaction() as tx:
+            if not _apply_banned_word_add(tx.data, chat_id, word):
+                return False
+            _update_moderation(str(chat_id), tx.data["chats"].get(str(chat_id)), words_changed=True)
+
+            tx.touch("chats", str(chat_id))
+            tx.event("banned_word_add", chat_id=chat_id, word=word)
+        logger.info(f"Слово '{word}' добавлено в банворды чата {chat_id}")
+        return True
     except Exception as e:
         logger.error(f"Ошибка добавления банворда '{word}' в чате {chat_id}: {e}")
         return False
 
+def _apply_banned_word_remove(data, chat_id: int, word: str) -> bool:
+    chat_data = data["chats"].get(str(chat_id), {})
+    banned_words = chat_data.get("banned_words", [])
+
+    if word.lower() in banned_words:
+        banned_words.remove(word.lower())
+        return True
+    return False
+
 def remove_banned_word(chat_id: int, word: str) -> bool:
     """Удалить забаненное слово из чата"""
     try:
-        data = load_data()
-        chat_id_str = str(chat_id)
-        chat_data = data["chats"].get(chat_id_str, {})
-        banned_words = chat_data.get("banned_words", [])
+        with transaction() as tx:
+            if not _apply_banned_word_remove(tx.data, chat_id, word):
+                return False
+            _update_moderation(str(chat_id), tx.data["chats"].get(str(chat_id)), words_changed=True)
 
-        if word.lower() in banned_words:
-            banned_words.remove(word.lower())
-            save_data(data)
-            logger.info(f"Слово '{word}' удалено из банвордов чата {chat_id}")
-            return True
-        return False
+            tx.touch("chats", str(chat_id))
+            tx.event("banned_word_remove", chat_id=chat_id, word=word)
+        logger.info(f"Слово '{word}' удалено из банвордов чата {chat_id}")
+        return True
     except Exception as e:
         logger.error(f"Ошибка удаления банворда '{word}' из чата {chat_id}: {e}")
         return False
 
-def add_auto_shlep_user(chat_id: int, user_id: int) -> bool:
-    """Добавить пользователя в список авто-шлёпаемых в чате"""
-    try:
-        data = load_data()
-        chat_id_str = str(chat_id)
+def _apply_auto_shlep_add(data, chat_id: int, user_id: int) -> bool:
+    chat_id_str = str(chat_id)
 
-        if chat_id_str not in data["chats"]:
-            data["chats"][chat_id_str] = {
-                "total_shleps": 0,
-                "banned_users": [],
-                "banned_words": [],
-                "auto_shlep_users": []
-            }
+    if chat_id_str not in data["chats"]:
+        data["chats"][chat_id_str] = {
+            "total_shleps": 0,
+            "banned_users": [],
+            "banned_words": [],
+            "auto_shlep_users": []
+        }
 
-        chat_data = data["chats"][chat_id_str]
-        chat_data.setdefault("auto_shlep_users", [])
+    chat_data = data["chats"][chat_id_str]
+    chat_data.setdefault("auto_shlep_users", [])
 
-        if user_id not in chat_data["auto_shlep_users"]:
-            chat_data["auto_shlep_users"].append(user_id)
-            save_data(data)
-            logger.info(f"Пользователь {user_id} добавлен в авто-шлёп в чате {chat_id}")
-            return True
+    if user_id in chat_data["auto_shlep_users"]:
         return False
+    chat_data["auto_shlep_users"].append(user_id)
+    return True
+
+def add_auto_shlep_user(chat_id: int, user_id: int) -> bool:
+    """Добавить пользователя в список авто-шлёпаемых в чате"""
+    try:
+        with transaction() as tx:
+            if not _apply_auto_shlep_add(tx.data, chat_id, user_id):
+                return False
+            _update_moderation(str(chat_id), tx.data["chats"].get(str(chat_id)))
+
+            tx.touch("chats", str(chat_id))
+            tx.event("auto_shlep_add", chat_id=chat_id, user_id=user_id)
+        logger.info(f"Пользователь {user_id} добавлен в авто-шлёп в чате {chat_id}")
+        return True
     except Exception as e:
         logger.error(f"Ошибка добавления авто-шлёпа пользователя {user_id} в чате {chat_id}: {e}")
         return False
 
+def _apply_auto_shlep_remove(data, chat_id: int, user_id: int) -> bool:
+    chat_data = data["chats"].get(str(chat_id), {})
+    auto_shlep_users = chat_data.get("auto_shlep_users", [])
+
+    if user_id in auto_shlep_users:
+        auto_shlep_users.remove(user_id)
+        return True
+    return False
+
 def remove_auto_shlep_user(chat_id: int, user_id: int) -> bool:
     """Убрать пользователя из списка авто-шлёпаемых в чате"""
     try:
-        data = load_data()
-        chat_id_str = str(chat_id)
-        chat_data = data["chats"].get(chat_id_str, {})
-        auto_shlep_users = chat_data.get("auto_shlep_users", [])
+        with transaction() as tx:
+            if not _apply_auto_shlep_remove(tx.data, chat_id, user_id):
+                return False
+            _update_moderation(str(chat_id), tx.data["chats"].get(str(chat_id)))
 
-        if user_id in auto_shlep_users:
-            auto_shlep_users.remove(user_id)
-            save_data(data)
-            logger.info(f"Пользователь {user_id} убран из авто-шлёпа в чате {chat_id}")
-            return True
-        return False
+            tx.touch("chats", str(chat_id))
+            tx.event("auto_shlep_remove", chat_id=chat_id, user_id=user_id)
+        logger.info(f"Пользователь {user_id} убран из авто-шлёпа в чате {chat_id}")
+        return True
     except Exception as e:
         logger.error(f"Ошибка удаления авто-шлёпа пользователя {user_id} в чате {chat_id}: {e}")
         return False
@@ -917,7 +2173,7 @@ def remove_auto_shlep_user(chat_id: int, user_id: int) -> bool:
 def get_auto_shlep_users(chat_id: int) -> list:
     """Получить список авто-шлёпаемых пользователей в чате"""
     try:
-        data = load_data()
+        data = read_data()
         chat_id_str = str(chat_id)
         chat_data = data["chats"].get(chat_id_str, {})
         return chat_data.get("auto_shlep_users", [])
@@ -925,5 +2181,21 @@ def get_auto_shlep_users(chat_id: int) -> list:
         logger.error(f"Ошибка получения авто-шлёп списка для чата {chat_id}: {e}")
         return []
 
+# Обработчики событий журнала: повтор хвоста журнала при старте
+_EVENT_APPLIERS = {
+    "shlep": _apply_shlep,
+    "vote_create": _apply_vote_create,
+    "vote_cast": _apply_vote_cast,
+    "vote_finish": _apply_vote_finish,
+    "vote_cleanup": _apply_vote_cleanup,
+    "vote_message": _apply_vote_message,
+    "ban_user": _apply_ban_user,
+    "unban_user": _apply_unban_user,
+    "banned_word_add": _apply_banned_word_add,
+    "banned_word_remove": _apply_banned_word_remove,
+    "auto_shlep_add": _apply_auto_shlep_add,
+    "auto_shlep_remove": _apply_auto_shlep_remove
+}
+
 # cleanup_old_votes()  # Moved to app.py startup to avoid side-effects on import
 # logger.info(DATABASE_TEXTS['ready'])
@@ -0,0 +1,146 @@
+"""
+Асинхронный фасад хранилища для обработчиков бота
+
+Чтение идёт из опубликованного снимка прямо на цикле событий, без блокировки.
+Все изменения выполняет единственный писатель: команды встают в очередь
+и применяются по порядку пачками, после каждой пачки читателям
+публикуется новый снимок. Всё, что трогает диск (бэкапы, проверка базы,
+восстановление), уходит в ограниченный пул потоков, поэтому бэкап
+одного админа не останавливает ответы остальным чатам.
+
+    import db
+    total, count, max_damage = await db.add_shlep(user_id, username, damage, chat_id)
+    stats = await db.get_chat_stats(chat_id)
+"""
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial, wraps
+
+import database
+from config import DB_WORKERS
+
+_executor = ThreadPoolExecutor(max_workers=DB_WORKERS, thread_name_prefix="db")
+
+# Сколько команд писатель применяет за одну пачку
+_BATCH_LIMIT = 256
+
+_queue = None
+_writer_task = None
+
+def _in_memory(func):
+    """Чтение из памяти: выполняется сразу на цикле событий"""
+    @wraps(func)
+    async def wrapper(*args, **kwargs):
+        return func(*args, **kwargs)
+    return wrapper
+
+def _blocking(func):
+    """Изменения и дисковые операции: в пуле потоков"""
+    @wraps(func)
+    async def wrapper(*args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_executor, partial(func, *args, **kwargs))
+    return wrapper
+
+def _command(func):
+    """Изменение: команда единственному писателю"""
+    @wraps(func)
+    async def wrapper(*args, **kwargs):
+        future = asyncio.get_running_loop().create_future()
+        await _ensure_writer().put((func, args, kwargs, future))
+        return await future
+    return wrapper
+
+def _ensure_writer() -> asyncio.Queue:
+    global _queue, _writer_task
+    loop = asyncio.get_running_loop()
+    if _writer_task is None or _writer_task.done() or _writer_task.get_loop() is not loop:
+        _queue = asyncio.Queue()
+        _writer_task = loop.create_task(_writer(_queue), name="db-writer")
+    return _queue
+
+async def _writer(queue: asyncio.Queue) -> None:
+    """Писатель: забирает всё, что накопилось в очереди, и применяет одной пачкой"""
+    loop = asyncio.get_running_loop()
+    while True:
+        commands = [await queue.get()]
+        while len(commands) < _BATCH_LIMIT and not queue.empty():
+            commands.append(queue.get_nowait())
+        
+        calls = [(func, args, kwargs) for func, args, kwargs, _ in commands]
+        try:
+            results = await loop.run_in_executor(_executor, database.apply_batch, calls)
+        except Exception as e:
+            results = [(False, e)] * len(commands)
+        
+        for (*_, future), (ok, value) in zip(commands, results):
+            if future.done():
+                continue
+            if ok:
+                future.set_result(value)
+            else:
+                future.set_exception(value)
+
+def shutdown(wait: bool = True) -> None:
+    """Дождаться начатых операций и остановить пул"""
+    _executor.shutdown(wait=wait)
+
+# ==================== ЧТЕНИЕ ====================
+
+load_data = _in_memory(database.read_data)
+get_stats = _in_memory(database.get_stats)
+get_user_stats = _in_memory(database.get_user_stats)
+get_chat_stats = _in_memory(database.get_chat_stats)
+get_vote = _in_memory(database.get_vote)
+get_active_chat_vote = _in_memory(database.get_active_chat_vote)
+get_pending_votes = _in_memory(database.get_pending_votes)
+get_banned_users = _in_memory(database.get_banned_users)
+get_banned_words = _in_memory(database.get_banned_words)
+get_moderation_profile = _in_memory(database.get_moderation_profile)
+get_auto_shlep_users = _in_memory(database.get_auto_shlep_users)
+get_persistence_metrics = _in_memory(database.get_persistence_metrics)
+get_snapshot_version = _in_memory(database.get_snapshot_version)
+get_activity_sketches = _in_memory(database.get_activity_sketches)
+get_activity_chart = _in_memory(database.get_activity_chart)
+get_favourite_hour = _in_memory(database.get_favourite_hour)
+get_comparison_stats = _in_memory(database.get_comparison_stats)
+check_data_integrity = _in_memory(database.check_data_integrity)
+
+# ==================== РЕЙТИНГИ ====================
+
+# Рейтинги меняет писатель: читаем их под его блокировкой, но вне цикла событий
+_get_long_top_users = _blocking(database.get_top_users)
+
+async def get_top_users(limit: int = 10):
+    """Топ до TOP_SIZE — из снимка на цикле событий, длиннее — под блокировкой писателя в пуле"""
+    if limit <= database.TOP_SIZE:
+        return database.get_top_users(limit)
+    return await _get_long_top_users(limit)
+
+get_chat_top_users = _in_memory(database.get_chat_top_users)
+get_chat_top_page = _in_memory(database.get_chat_top_page)
+get_activity_summary = _in_memory(database.get_activity_summary)
+
+# ==================== ИЗМЕНЕНИЯ ====================
+
+shlep = _command(database.shlep)
+add_shlep = _command(database.add_shlep)
+create_vote = _command(database.create_vote)
+add_user_vote = _command(database.add_user_vote)
+finish_vote = _command(database.finish_vote)
+finish_votes = _command(database.finish_votes)
+update_vote_message_id = _command(database.update_vote_message_id)
+ban_user = _command(database.ban_user)
+unban_user = _command(database.unban_user)
+add_banned_word = _command(database.add_banned_word)
+remove_banned_word = _command(database.remove_banned_word)
+add_auto_shlep_user = _command(database.add_auto_shlep_user)
+remove_auto_shlep_user = _command(database.remove_auto_shlep_user)
+
+# ==================== ДИСК ====================
+
+create_safe_backup = _blocking(database.create_safe_backup)
+get_backup_list = _blocking(database.get_backup_list)
+get_database_size = _blocking(database.get_database_size)
+repair_data_structure = _blocking(database.repair_data_structure)
@@ -0,0 +1,122 @@
+"""
+Журнал событий (append-only) для хранилища JSON
+
+Каждое событие (шлёпок, голос, бан...) — одна строка JSON:
+  {"s": номер, "e": "тип события", "a": {аргументы}}
+Снимок mishok_data.json хранит номер последнего учтённого события
+в поле "journal_seq", поэтому при старте достаточно загрузить снимок
+и повторить хвост журнала.
+
+Перед снимком в дочернем процессе журнал откладывается в файл .old:
+события, пришедшие во время записи снимка, идут уже в новый файл,
+а отложенный удаляется только после успешного снимка.
+"""
+
+import json
+import os
+import shutil
+import threading
+import logging
+from typing import Any, Dict, Iterator, Tuple
+
+from texts import DATABASE_TEXTS
+
+logger = logging.getLogger(__name__)
+
+class Journal:
+    """Файл событий с дозаписью в конец"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.rotated_path = path + ".old"
+        self.seq = 0
+        self.pending = 0
+        self._file = None
+        self._lock = threading.Lock()
+
+    def _open(self):
+        if self._file is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._file = open(self.path, 'a', encoding='utf-8')
+        return self._file
+
+    def append(self, event: str, **args: Any) -> int:
+        """Дописать событие, вернуть его номер"""
+        with self._lock:
+            self.seq += 1
+            record = json.dumps({"s": self.seq, "e": event, "a": args}, ensure_ascii=False, separators=(',', ':'))
+            f = self._open()
+            f.write(record + "\n")
+            f.flush()
+            self.pending += 1
+            return self.seq
+
+    def replay(self, after_seq: int = 0) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """Прочитать события с номером больше after_seq"""
+        self.seq = max(self.seq, after_seq)
+        for path in (self.rotated_path, self.path):
+            if os.path.exists(path):
+                yield from self._replay_file(path, after_seq)
+
+    def _replay_file(self, path: str, after_seq: int) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        with open(path, 'r', encoding='utf-8') as f:
+            for line_no, line in enumerate(f, 1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # Оборванная последняя строка после аварийной остановки
+                    logger.warning(DATABASE_TEXTS['journal_bad_line'].format(line=line_no))
+                    continue
+
+                self.seq = max(self.seq, record["s"])
+                if record["s"] <= after_seq:
+                    continue
+                self.pending += 1
+                yield record["e"], record["a"]
+
+    def truncate(self) -> None:
+        """Очистить журнал после записи снимка"""
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            with open(self.path, 'w', encoding='utf-8') as f:
+                os.fsync(f.fileno())
+            if os.path.exists(self.rotated_path):
+                os.remove(self.rotated_path)
+            self.pending = 0
+
+    def rotate(self) -> None:
+        """Отложить текущие события до подтверждения снимка"""
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            if os.path.exists(self.path):
+                if os.path.exists(self.rotated_path):
+                    # Прошлый снимок не удался: события копятся в одном отложенном файле
+                    with open(self.path, 'r', encoding='utf-8') as src, \
+                            open(self.rotated_path, 'a', encoding='utf-8') as dst:
+                        shutil.copyfileobj(src, dst)
+                    os.remove(self.path)
+                else:
+                    os.replace(self.path, self.rotated_path)
+            self.pending = 0
+
+    def drop_rotated(self) -> None:
+        """Удалить отложенные события, вошедшие в записанный снимок"""
+        with self._lock:
+            if os.path.exists(self.rotated_path):
+                os.remove(self.rotated_path)
+
+    def size(self) -> int:
+        return sum(os.path.getsize(path) for path in (self.rotated_path, self.path) if os.path.exists(path))
+
+    def close(self) -> None:
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
@@ -32,6 +32,20 @@ def get_chat_vote_keyboard():
         ]
     ])
 
+def get_chat_top_keyboard(page, pages, next_cursor=None, prev_cursor=None):
+    """Кнопки листания топа чата; ◀ и ▶ несут курсор начала своей страницы"""
+    def page_button(text, target, cursor):
+        if cursor:
+            return InlineKeyboardButton(text, callback_data=f"chat_top:{target}:{cursor[0]}:{cursor[1]}")
+        return InlineKeyboardButton(text, callback_data=f"chat_top:{target}")
+    
+    buttons = []
+    if page > 1:
+        buttons.append(page_button("◀", page - 1, prev_cursor))
+    if page < pages:
+        buttons.append(page_button("▶", page + 1, next_cursor))
+    return InlineKeyboardMarkup([buttons]) if buttons else None
+
 def get_main_inline_keyboard():
     return InlineKeyboardMarkup([
         [InlineKeyboardButton("👊 Шлёпнуть сейчас!", callback_data="shlep_mishok")],
@@ -68,6 +82,7 @@ def get_admin_keyboard():
          InlineKeyboardButton("🗃️ Хранилище", callback_data="admin_storage")],
         [InlineKeyboardButton("🚫 Баны", callback_data="admin_bans"),
          InlineKeyboardButton("🚫 Банворды", callback_data="admin_banned_words")],
+        [InlineKeyboardButton("📈 Активность", callback_data="admin_activity")],
         [InlineKeyboardButton("❌ Закрыть", callback_data="admin_close")]
     ])
 
@@ -0,0 +1,281 @@
+"""
+Рейтинг игроков по числу шлёпков
+
+Игроки с одинаковым счётом лежат в одной корзине, а отсортированный
+список различных счётов позволяет идти от лучших к худшим.
+Шлёпок меняет счёт на единицу, поэтому обновление — перенос игрока
+в соседнюю корзину за O(log n), а топ из limit игроков читается за O(limit).
+
+Постраничный просмотр идёт по курсору (счёт, сколько игроков этой корзины
+уже показано): следующая и предыдущая страницы находятся за O(размер страницы).
+freeze() даёт неизменяемую копию рейтинга для снимка читателей.
+
+ScoreRanks отвечает на вопрос «сколько игроков набрали больше» за O(√n):
+счётчики игроков по счётам до RANK_TABLE_SIZE лежат блоками-кортежами
+с суммами блоков, редкие счёты выше — отсортированным кортежем. Изменение
+копирует один блок и кортеж сумм, остальные блоки общие со старым индексом.
+"""
+
+from bisect import bisect_left, bisect_right, insort
+from itertools import islice
+from typing import Dict, Hashable, Iterable, List, Mapping, Optional, Tuple
+
+from snapshot import FrozenSection
+
+Cursor = Tuple[int, int]
+
+# Счёты от 0 до RANK_TABLE_SIZE - 1 считаются блоками по RANK_BLOCK, остальные — кортежем
+RANK_TABLE_SIZE = 1 << 16
+RANK_BLOCK = 256
+_EMPTY_BLOCKS = ((0,) * RANK_BLOCK,) * (RANK_TABLE_SIZE // RANK_BLOCK)
+_EMPTY_TOTALS = (0,) * (RANK_TABLE_SIZE // RANK_BLOCK)
+
+class _Ranking:
+    """Чтение рейтинга: топ и страницы по курсору (общее для живого и замороженного)"""
+
+    __slots__ = ()
+
+    def top(self, limit: int) -> List[Tuple[Hashable, int]]:
+        """Лучшие limit игроков: (игрок, счёт) по убыванию счёта"""
+        result = []
+        for i in range(len(self._scores) - 1, -1, -1):
+            score = self._scores[i]
+            for member in self._buckets[score]:
+                if len(result) >= limit:
+                    return result
+                result.append((member, score))
+        return result
+
+    def seek(self, offset: int) -> Cursor:
+        """Курсор на место offset от вершины рейтинга"""
+        for i in range(len(self._scores) - 1, -1, -1):
+            score = self._scores[i]
+            size = len(self._buckets[score])
+            if offset < size:
+                return (score, offset)
+            offset -= size
+        return (-1, 0)
+
+    def page(self, cursor: Cursor, limit: int) -> Tuple[List[Tuple[Hashable, int]], Optional[Cursor]]:
+        """
+        Страница рейтинга начиная с курсора.
+        Возвращает (игрок, счёт) и курсор следующей страницы (None — дальше пусто).
+        """
+        score, skip = cursor
+        i = bisect_right(self._scores, score) - 1
+        if i >= 0 and self._scores[i] != score:
+            # Корзина курсора опустела — продолжаем со следующего счёта
+            skip = 0
+
+        result = []
+        while i >= 0:
+            current = self._scores[i]
+            for position, member in enumerate(islice(self._buckets[current], skip, None), skip):
+                if len(result) >= limit:
+                    return result, (current, position)
+                result.append((member, current))
+            skip = 0
+            i -= 1
+        return result, None
+
+    def before(self, cursor: Cursor, limit: int) -> Cursor:
+        """Курсор на limit игроков выше курсора (начало предыдущей страницы)"""
+        score, skip = cursor
+        i = bisect_right(self._scores, score) - 1
+        if i < 0 or self._scores[i] != score:
+            # Корзина курсора опустела — страница начиналась со следующего счёта
+            skip = 0
+        else:
+            skip = min(skip, len(self._buckets[score]))
+
+        remaining = limit
+        while i < 0 or skip < remaining:
+            remaining -= skip
+            i += 1
+            if i >= len(self._scores):
+                return self.seek(0)
+            skip = len(self._buckets[self._scores[i]])
+        return (self._scores[i], skip - remaining)
+
+class FrozenLeaderboard(_Ranking):
+    """Неизменяемая копия рейтинга для снимка: корзины — кортежи в двухслойной секции"""
+
+    __slots__ = ("_scores", "_buckets", "_len")
+
+    def __init__(self, scores: Tuple[int, ...], buckets: Mapping[int, Tuple[Hashable, ...]], length: int):
+        self._scores = scores
+        self._buckets = buckets
+        self._len = length
+
+    def __len__(self) -> int:
+        return self._len
+
+class Leaderboard(_Ranking):
+    """Рейтинг по счёту: корзины игроков с одинаковым счётом"""
+
+    def __init__(self):
+        # счёт -> игроки в порядке попадания в корзину (dict как упорядоченное множество)
+        self._buckets: Dict[int, Dict[Hashable, None]] = {}
+        # различные счёты по возрастанию
+        self._scores: List[int] = []
+        self._score_of: Dict[Hashable, int] = {}
+        self.version = 0
+        # Последняя замороженная копия, счёты, чьи корзины изменились после неё,
+        # и появились ли или пропали сами счёты
+        self._frozen: Optional[FrozenLeaderboard] = None
+        self._changed = set()
+        self._scores_changed = False
+
+    @classmethod
+    def build(cls, items: Iterable[Tuple[Hashable, int]]) -> "Leaderboard":
+        """Построить рейтинг целиком (загрузка данных)"""
+        board = cls()
+        for member, score in items:
+            board._score_of[member] = score
+            board._buckets.setdefault(score, {})[member] = None
+        board._scores = sorted(board._buckets)
+        return board
+
+    def __len__(self) -> int:
+        return len(self._score_of)
+
+    def __contains__(self, member: Hashable) -> bool:
+        return member in self._score_of
+
+    def score(self, member: Hashable, default: int = 0) -> int:
+        return self._score_of.get(member, default)
+
+    def _detach(self, member: Hashable, score: int) -> None:
+        self._changed.add(score)
+        bucket = self._buckets[score]
+        del bucket[member]
+        if not bucket:
+            del self._buckets[score]
+            del self._scores[bisect_left(self._scores, score)]
+            self._scores_changed = True
+
+    def update(self, member: Hashable, score: int) -> None:
+        """Установить счёт игрока"""
+        old = self._score_of.get(member)
+        if old == score:
+            return
+        if old is not None:
+            self._detach(member, old)
+
+        bucket = self._buckets.get(score)
+        if bucket is None:
+            bucket = self._buckets[score] = {}
+            insort(self._scores, score)
+            self._scores_changed = True
+        bucket[member] = None
+        self._changed.add(score)
+        self._score_of[member] = score
+        self.version += 1
+
+    def remove(self, member: Hashable) -> None:
+        old = self._score_of.pop(member, None)
+        if old is not None:
+            self._detach(member, old)
+            self.version += 1
+
+    def freeze(self) -> FrozenLeaderboard:
+        """
+        Неизменяемая копия для снимка. Кортежи пересобираются только
+        у корзин, изменённых после прошлой копии, остальные общие с ней;
+        кортеж счётов — только если счёты появились или пропали.
+        """
+        frozen = self._frozen
+        if frozen is not None and not self._changed:
+            return frozen
+        if frozen is None:
+            scores = tuple(self._scores)
+            buckets = FrozenSection.build(self._buckets, tuple)
+        else:
+            scores = tuple(self._scores) if self._scores_changed else frozen._scores
+            # Корзина пропавшего счёта остаётся пустой: по счётам её уже не найти
+            buckets = frozen._buckets.updated({
+                score: tuple(self._buckets.get(score, ())) for score in self._changed
+            })
+        self._changed.clear()
+        self._scores_changed = False
+        self._frozen = FrozenLeaderboard(scores, buckets, len(self._score_of))
+        return self._frozen
+
+class ScoreRanks:
+    """
+    Порядковая статистика по счёту: место, число игроков и сумма счётов.
+    Значение неизменяемое: add/remove/move возвращают новый индекс,
+    поэтому его публикуют со снимком и читают без блокировки.
+    """
+
+    __slots__ = ("_blocks", "_totals", "_overflow", "total", "sum")
+
+    def __init__(self, blocks: Tuple[Tuple[int, ...], ...] = _EMPTY_BLOCKS,
+                 totals: Tuple[int, ...] = _EMPTY_TOTALS, overflow: Tuple[int, ...] = (),
+                 total: int = 0, score_sum: int = 0):
+        self._blocks = blocks
+        self._totals = totals
+        # счёты >= RANK_TABLE_SIZE по возрастанию
+        self._overflow = overflow
+        self.total = total
+        self.sum = score_sum
+
+    @classmethod
+    def build(cls, scores: Iterable[int]) -> "ScoreRanks":
+        counts = [0] * RANK_TABLE_SIZE
+        overflow = []
+        total = score_sum = 0
+        for score in scores:
+            if score < RANK_TABLE_SIZE:
+                counts[score] += 1
+            else:
+                overflow.append(score)
+            total += 1
+            score_sum += score
+
+        blocks = tuple(tuple(counts[start:start + RANK_BLOCK]) for start in range(0, RANK_TABLE_SIZE, RANK_BLOCK))
+        return cls(blocks, tuple(map(sum, blocks)), tuple(sorted(overflow)), total, score_sum)
+
+    def _changed(self, score: int, delta: int) -> "ScoreRanks":
+        """Новый индекс: delta игроков со счётом score"""
+        blocks, totals, overflow = self._blocks, self._totals, self._overflow
+        if score < RANK_TABLE_SIZE:
+            b, i = divmod(score, RANK_BLOCK)
+            block = blocks[b]
+            blocks = blocks[:b] + (block[:i] + (block[i] + delta,) + block[i + 1:],) + blocks[b + 1:]
+            totals = totals[:b] + (totals[b] + delta,) + totals[b + 1:]
+        elif delta > 0:
+            i = bisect_right(overflow, score)
+            overflow = overflow[:i] + (score,) + overflow[i:]
+        else:
+            i = bisect_left(overflow, score)
+            overflow = overflow[:i] + overflow[i + 1:]
+        return ScoreRanks(blocks, totals, overflow, self.total + delta, self.sum + delta * score)
+
+    def add(self, score: int) -> "ScoreRanks":
+        return self._changed(score, 1)
+
+    def remove(self, score: int) -> "ScoreRanks":
+        return self._changed(score, -1)
+
+    def move(self, old: int, new: int) -> "ScoreRanks":
+        return self._changed(old, -1)._changed(new, 1)
+
+    def count(self, score: int) -> int:
+        """Сколько игроков с ровно таким счётом"""
+        if score < 0:
+            return 0
+        if score < RANK_TABLE_SIZE:
+            b, i = divmod(score, RANK_BLOCK)
+            return self._blocks[b][i]
+        return bisect_right(self._overflow, score) - bisect_left(self._overflow, score)
+
+    def count_above(self, score: int) -> int:
+        """Сколько игроков со счётом больше score"""
+        overflow = self._overflow
+        if score >= RANK_TABLE_SIZE:
+            return len(overflow) - bisect_right(overflow, score)
+        if score < 0:
+            return self.total
+        b, i = divmod(score, RANK_BLOCK)
+        return len(overflow) + sum(self._totals[b + 1:]) + sum(self._blocks[b][i + 1:])
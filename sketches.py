@@ -0,0 +1,87 @@
+"""
+Вероятностные счётчики активности с ограниченной памятью
+
+HyperLogLog — оценка числа разных игроков (DAU/WAU/MAU): регистры
+хранятся строкой по одному символу, день занимает 2^HLL_PRECISION байт
+при любом числе игроков, а неделя и месяц — объединение дней.
+
+Space-Saving — самые активные игроки: не больше k счётчиков
+{игрок: шлёпки} и погрешностей {игрок: завышение}, новый игрок
+вытесняет наименьший счётчик и наследует его значение.
+
+Значения — обычные строки и словари, поэтому хранятся в данных бота
+как есть и повторяются журналом вместе со шлёпком.
+"""
+
+import math
+from hashlib import blake2b
+from typing import Dict, Iterable, List, Tuple
+
+# 2^11 регистров: стандартная ошибка около 2.3%
+HLL_PRECISION = 11
+_REGISTERS = 1 << HLL_PRECISION
+_HASH_BITS = 64 - HLL_PRECISION
+_ALPHABET = "0123456789abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ_-"
+_VALUE = {char: value for value, char in enumerate(_ALPHABET)}
+
+TopK = Dict[str, int]
+
+def hll_new() -> str:
+    return _ALPHABET[0] * _REGISTERS
+
+def _hash(item: str) -> int:
+    return int.from_bytes(blake2b(item.encode('utf-8'), digest_size=8).digest(), 'big')
+
+def hll_add(registers: str, item: str) -> str:
+    """Учесть элемент; возвращает те же регистры, если оценка не меняется"""
+    x = _hash(item)
+    index = x >> _HASH_BITS
+    rank = _HASH_BITS - (x & ((1 << _HASH_BITS) - 1)).bit_length() + 1
+    if rank <= _VALUE[registers[index]]:
+        return registers
+    return registers[:index] + _ALPHABET[rank] + registers[index + 1:]
+
+def hll_merge(all_registers: Iterable[str]) -> str:
+    """Объединение множеств: поразрядный максимум регистров"""
+    merged = None
+    for registers in all_registers:
+        merged = registers if merged is None else _merge_pair(merged, registers)
+    return merged if merged is not None else hll_new()
+
+def _merge_pair(a: str, b: str) -> str:
+    if a == b:
+        return a
+    return "".join(x if _VALUE[x] >= _VALUE[y] else y for x, y in zip(a, b))
+
+def hll_count(registers: str) -> int:
+    """Оценка числа разных элементов"""
+    m = _REGISTERS
+    values = [_VALUE[char] for char in registers]
+    zeros = values.count(0)
+    if zeros == m:
+        return 0
+    alpha = 0.7213 / (1 + 1.079 / m)
+    estimate = alpha * m * m / sum(2.0 ** -value for value in values)
+    if estimate <= 2.5 * m and zeros:
+        # Мало элементов: линейный подсчёт по пустым регистрам точнее
+        estimate = m * math.log(m / zeros)
+    return round(estimate)
+
+def topk_add(counters: TopK, errors: TopK, item: str, k: int) -> None:
+    """Space-Saving: учесть одно появление элемента (меняет словари на месте)"""
+    count = counters.get(item)
+    if count is not None:
+        counters[item] = count + 1
+        return
+    if len(counters) < k:
+        counters[item] = 1
+        return
+    victim = min(counters, key=counters.__getitem__)
+    smallest = counters.pop(victim)
+    errors.pop(victim, None)
+    counters[item] = smallest + 1
+    errors[item] = smallest
+
+def topk_items(counters: TopK, limit: int) -> List[Tuple[str, int]]:
+    """Лидеры по убыванию счёта: (элемент, оценка сверху)"""
+    return sorted(counters.items(), key=lambda item: item[1], reverse=True)[:limit]
@@ -0,0 +1,241 @@
+"""
+Неизменяемые снимки данных для чтения без блокировки
+
+Писатель меняет данные в памяти на месте, а после каждой пачки изменений
+публикует новый снимок (RCU): читатели берут текущий снимок одной ссылкой
+и никогда не видят полупримененную транзакцию.
+
+Чтобы не копировать всех пользователей на каждую пачку, построчные
+секции (users, chats, votes, sketches, участники чата и голоса) хранятся в два слоя:
+общая неизменяемая основа и небольшой верхний слой изменённых строк.
+Когда верхний слой разрастается, слои сливаются в новую основу.
+"""
+
+from itertools import repeat
+from math import isqrt
+from types import MappingProxyType
+from typing import Any, Dict, Iterable, Iterator, NamedTuple, Optional, Tuple
+from collections.abc import Mapping
+
+from storage import ROW_SECTIONS, MEMBER_SECTIONS, SERIES_SECTIONS, SERIES_LEVELS
+
+# Удалённая строка в верхнем слое
+_DELETED = object()
+_MISSING = object()
+_CONTAINERS = (dict, list)
+
+# Верхний слой копируется на каждой публикации, основа — при слиянии:
+# порог около sqrt(2n) уравновешивает эти расходы
+_LAYER_MIN = 32
+
+def _nested(items: Iterable[Any]) -> bool:
+    return any(map(isinstance, items, repeat(_CONTAINERS)))
+
+def freeze(value: Any) -> Any:
+    """Копия значения, не связанная с изменяемыми данными писателя"""
+    # Плоские словари и списки (счётчики, ряды) копируются целиком без обхода в Python
+    if isinstance(value, dict):
+        if not _nested(value.values()):
+            return value.copy()
+        return {key: freeze(item) if isinstance(item, _CONTAINERS) else item for key, item in value.items()}
+    if isinstance(value, list):
+        if not _nested(value):
+            return value.copy()
+        return [freeze(item) if isinstance(item, _CONTAINERS) else item for item in value]
+    return value
+
+class FrozenSection(Mapping):
+    """Секция снимка: основа + верхний слой изменённых строк"""
+
+    __slots__ = ("_base", "_top", "_len")
+
+    def __init__(self, base: Dict[str, Any], top: Optional[Dict[str, Any]] = None, length: Optional[int] = None):
+        self._base = base
+        self._top = top or {}
+        self._len = len(base) if length is None else length
+
+    @classmethod
+    def build(cls, rows: Dict[str, Any], freeze_row=freeze) -> "FrozenSection":
+        return cls({key: freeze_row(row) for key, row in rows.items()})
+
+    def __getitem__(self, key: str) -> Any:
+        value = self._top.get(key, _MISSING)
+        if value is _MISSING:
+            return self._base[key]
+        if value is _DELETED:
+            raise KeyError(key)
+        return value
+
+    def get(self, key: str, default: Any = None) -> Any:
+        value = self._top.get(key, _MISSING)
+        if value is _MISSING:
+            return self._base.get(key, default)
+        return default if value is _DELETED else value
+
+    def __contains__(self, key: object) -> bool:
+        value = self._top.get(key, _MISSING)
+        if value is _MISSING:
+            return key in self._base
+        return value is not _DELETED
+
+    def __len__(self) -> int:
+        return self._len
+
+    def __iter__(self) -> Iterator[str]:
+        for key, _ in self.items():
+            yield key
+
+    def items(self) -> Iterator[Tuple[str, Any]]:
+        top = self._top
+        for key, value in top.items():
+            if value is not _DELETED:
+                yield key, value
+        for key, value in self._base.items():
+            if key not in top:
+                yield key, value
+
+    def values(self) -> Iterator[Any]:
+        for _, value in self.items():
+            yield value
+
+    def updated(self, changes: Dict[str, Any]) -> "FrozenSection":
+        """Новая секция с заменёнными строками (_DELETED — удалить)"""
+        length = self._len
+        for key, value in changes.items():
+            length += (value is not _DELETED) - (key in self)
+
+        top = {**self._top, **changes}
+        if len(top) <= max(_LAYER_MIN, isqrt(2 * len(self._base))):
+            return FrozenSection(self._base, top, length)
+
+        base = dict(self._base)
+        for key, value in top.items():
+            if value is _DELETED:
+                base.pop(key, None)
+            else:
+                base[key] = value
+        return FrozenSection(base)
+
+class Snapshot(NamedTuple):
+    version: int
+    data: Mapping
+    # Готовый топ игроков: (имя, шлёпки)
+    top: Tuple = ()
+    # Неизменяемый индекс счётов (leaderboard.ScoreRanks) и игроки вне его
+    ranks: Any = None
+    unranked: int = 0
+    # Замороженные рейтинги чатов (leaderboard.FrozenLeaderboard) по chat_id
+    chat_boards: Mapping = MappingProxyType({})
+    # Сводка для админки: игроки по дню последнего шлёпка и по уровням (ноль — нет игроков)
+    activity_days: Mapping = MappingProxyType({})
+    levels: Mapping = MappingProxyType({})
+
+def _freeze_row(section: str, row: Dict[str, Any], members: Optional[FrozenSection] = None) -> Dict[str, Any]:
+    """Строка секции; участники чата и голоса — отдельная двухслойная секция"""
+    if section not in MEMBER_SECTIONS:
+        return freeze(row)
+    field = MEMBER_SECTIONS[section][0]
+    frozen = {key: freeze(value) for key, value in row.items() if key != field}
+    frozen[field] = members if members is not None else FrozenSection.build(row.get(field, {}))
+    return frozen
+
+def _freeze_series(series: Any, previous: Any = None, buckets: Optional[Dict[str, set]] = None) -> Any:
+    """
+    Ряд для снимка: уровни "h", "d", "m" — двухслойные секции, профиль "hod" — копия.
+    С previous и buckets копируются только изменённые корзины.
+    """
+    if not isinstance(series, dict) or not all(isinstance(series.get(level), dict) for level in SERIES_LEVELS):
+        return freeze(series)
+    if buckets is None or not isinstance(previous, dict) or not isinstance(previous.get("h"), FrozenSection):
+        frozen = {level: FrozenSection.build(series[level]) for level in SERIES_LEVELS}
+        frozen["hod"] = freeze(series.get("hod"))
+        return frozen
+
+    frozen = dict(previous)
+    for level, keys in buckets.items():
+        if level == "hod":
+            frozen["hod"] = freeze(series.get("hod"))
+        elif level in SERIES_LEVELS:
+            live = series[level]
+            frozen[level] = previous[level].updated({
+                key: live[key] if key in live else _DELETED for key in keys
+            })
+    return frozen
+
+def build(data: Dict[str, Any], version: int = 1) -> Snapshot:
+    """Полный снимок данных (загрузка, восстановление структуры)"""
+    frozen = {}
+    for section, value in data.items():
+        if section in ROW_SECTIONS and isinstance(value, dict):
+            frozen[section] = FrozenSection.build(value, lambda row, section=section: _freeze_row(section, row))
+        elif section in SERIES_SECTIONS:
+            frozen[section] = _freeze_series(value)
+        else:
+            frozen[section] = freeze(value)
+    return Snapshot(version, MappingProxyType(frozen))
+
+def publish(previous: Snapshot, data: Dict[str, Any], touched: Iterable[Tuple]) -> Snapshot:
+    """
+    Следующий снимок: скопировать только затронутые строки.
+    touched — кортежи (секция, ключ[, участник]) из транзакций.
+    """
+    sections = {}
+    members = {}
+    for section, key, *member in touched:
+        if section in SERIES_SECTIONS and key is not None:
+            # Корзины ряда: уровень -> ключи корзин
+            buckets = sections.setdefault(section, {})
+            if buckets is not None:
+                buckets.setdefault(key, set()).add(member[0])
+            continue
+        if member:
+            members.setdefault((section, key), set()).add(member[0])
+        if section in ROW_SECTIONS and key is not None:
+            keys = sections.setdefault(section, set())
+            if keys is not None:
+                keys.add(key)
+        else:
+            # Секция целиком
+            sections[section] = None
+
+    frozen = dict(previous.data)
+    for section, keys in sections.items():
+        value = data.get(section, _MISSING)
+        if value is _MISSING:
+            frozen.pop(section, None)
+            continue
+
+        old = frozen.get(section)
+        if section in SERIES_SECTIONS:
+            frozen[section] = _freeze_series(value, old, keys)
+            continue
+        if section not in ROW_SECTIONS or not isinstance(value, dict):
+            frozen[section] = freeze(value)
+            continue
+        if keys is None or not isinstance(old, FrozenSection):
+            frozen[section] = FrozenSection.build(value, lambda row, section=section: _freeze_row(section, row))
+            continue
+
+        changes = {}
+        for key in keys:
+            row = value.get(key)
+            if row is None:
+                changes[key] = _DELETED
+            elif section not in MEMBER_SECTIONS:
+                changes[key] = freeze(row)
+            else:
+                field = MEMBER_SECTIONS[section][0]
+                old_row = old.get(key)
+                old_members = old_row.get(field) if old_row else None
+                live_members = row.get(field, {})
+                if isinstance(old_members, FrozenSection):
+                    old_members = old_members.updated({
+                        uid: freeze(live_members[uid]) if uid in live_members else _DELETED
+                        for uid in members.get((section, key), ())
+                    })
+                else:
+                    old_members = None
+                changes[key] = _freeze_row(section, row, old_members)
+        frozen[section] = old.updated(changes)
+
+    return previous._replace(version=previous.version + 1, data=MappingProxyType(frozen))
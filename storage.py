@@ -0,0 +1,370 @@
+"""
+Движки хранения данных бота Мишок Лысый
+json   — весь набор данных одним файлом mishok_data.json
+sqlite — построчное хранение в SQLite (WAL), запись только изменённых строк
+
+Изменения передаются набором dirty из кортежей:
+  (секция, None)          — секция целиком (global_stats, timestamps, records...)
+  (секция, ключ)          — одна строка users/chats/votes/sketches
+  ("chats", чат, игрок)   — одна строка участника чата
+  ("activity", уровень, корзина) — одна корзина временного ряда
+"""
+
+import json
+import os
+import shutil
+import sqlite3
+import threading
+import logging
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+from config import DATA_FILE, SQLITE_FILE, STORAGE_ENGINE
+from texts import DATABASE_TEXTS
+
+logger = logging.getLogger(__name__)
+
+# Секции, которые хранятся построчно (одна строка = один пользователь/чат/голосование/день)
+ROW_SECTIONS = ("users", "chats", "votes", "sketches")
+
+# Вложенные строки, которые пишутся отдельно от своей строки, чтобы изменение
+# одного участника чата или одного голоса не переписывало всю строку:
+# секция -> (поле строки, таблица, колонка родителя)
+MEMBER_SECTIONS = {
+    "chats": ("users", "chat_users", "chat_id"),
+    "votes": ("ballots", "vote_ballots", "vote_id"),
+}
+
+# Временные ряды (timeseries), которые хранятся по корзине в строке:
+# шлёпок меняет один час и одну ячейку почасового профиля, а не весь ряд
+SERIES_SECTIONS = ("activity",)
+SERIES_LEVELS = ("h", "d", "m")
+
+Dirty = Optional[Iterable[Tuple]]
+
+def _dumps(value: Any) -> str:
+    return json.dumps(value, ensure_ascii=False, separators=(',', ':'))
+
+class JsonStorage:
+    """Хранение всего набора данных одним JSON-файлом"""
+
+    name = "json"
+    extension = ".json"
+    write_through = False
+
+    def __init__(self, path: str = DATA_FILE):
+        self.path = path
+
+    def exists(self) -> bool:
+        return os.path.exists(self.path)
+
+    def load(self) -> Optional[Dict[str, Any]]:
+        """Прочитать данные с диска (None, если файла нет)"""
+        if not self.exists():
+            return None
+        with open(self.path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def save(self, data: Dict[str, Any], dirty: Dirty = None) -> int:
+        """Записать данные целиком через временный файл, вернуть размер в байтах"""
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+
+        temp_file = self.path + ".tmp"
+        with open(temp_file, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, separators=(',', ':'))
+
+        os.replace(temp_file, self.path)
+        return os.path.getsize(self.path)
+
+    def backup(self, backup_file: str) -> None:
+        shutil.copy2(self.path, backup_file)
+
+    def size(self) -> int:
+        return os.path.getsize(self.path) if self.exists() else 0
+
+    def describe(self) -> Dict[str, Any]:
+        """Краткая сводка по данным на диске"""
+        data = self.load() or {}
+        return {
+            "users": len(data.get("users", {})),
+            "chats": len(data.get("chats", {})),
+            "total_shleps": data.get("global_stats", {}).get("total_shleps", 0)
+        }
+
+    def close(self) -> None:
+        pass
+
+class SqliteStorage:
+    """Построчное хранение в SQLite с журналом WAL"""
+
+    name = "sqlite"
+    extension = ".sqlite3"
+    write_through = True
+
+    def __init__(self, path: str = SQLITE_FILE):
+        self.path = path
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+            for section in ROW_SECTIONS:
+                conn.execute(f"CREATE TABLE IF NOT EXISTS {section} (id TEXT PRIMARY KEY, data TEXT NOT NULL)")
+            # Участники чатов и голоса хранятся отдельно от своих строк
+            for _, table, parent in MEMBER_SECTIONS.values():
+                conn.execute(
+                    f"CREATE TABLE IF NOT EXISTS {table} ("
+                    f"{parent} TEXT NOT NULL, user_id TEXT NOT NULL, data TEXT NOT NULL, "
+                    f"PRIMARY KEY ({parent}, user_id))"
+                )
+            for section in SERIES_SECTIONS:
+                conn.execute(
+                    f"CREATE TABLE IF NOT EXISTS {section} ("
+                    f"level TEXT NOT NULL, bucket TEXT NOT NULL, count INTEGER NOT NULL, "
+                    f"PRIMARY KEY (level, bucket))"
+                )
+            self._conn = conn
+        return self._conn
+
+    def exists(self) -> bool:
+        if not os.path.exists(self.path):
+            return False
+        with self._lock:
+            row = self._connect().execute("SELECT 1 FROM meta LIMIT 1").fetchone()
+        return row is not None
+
+    def load(self) -> Optional[Dict[str, Any]]:
+        """Собрать словарь данных из таблиц (None, если база пуста)"""
+        if not self.exists():
+            return None
+
+        with self._lock:
+            conn = self._connect()
+            data = {key: json.loads(value) for key, value in conn.execute("SELECT key, value FROM meta")}
+            for section in ROW_SECTIONS:
+                data[section] = {
+                    row_id: json.loads(value)
+                    for row_id, value in conn.execute(f"SELECT id, data FROM {section}")
+                }
+            for section, (field, table, parent) in MEMBER_SECTIONS.items():
+                rows = data[section]
+                for key, user_id, value in conn.execute(f"SELECT {parent}, user_id, data FROM {table}"):
+                    row = rows.setdefault(key, {"total_shleps": 0}) if section == "chats" else rows.get(key)
+                    if row is not None:
+                        row.setdefault(field, {})[user_id] = json.loads(value)
+            for section in SERIES_SECTIONS:
+                self._load_series(conn, data, section)
+        return data
+
+    def _load_series(self, conn: sqlite3.Connection, data: Dict[str, Any], section: str) -> None:
+        """
+        Собрать ряд из корзин. Ряд старых баз лежит целиком в meta:
+        корзины таблицы новее и ложатся поверх него до первой полной записи ряда.
+        """
+        rows = conn.execute(f"SELECT level, bucket, count FROM {section}").fetchall()
+        series = data.get(section)
+        if not rows:
+            return
+        if not isinstance(series, dict):
+            series = {}
+        for level in SERIES_LEVELS:
+            if not isinstance(series.get(level), dict):
+                series[level] = {}
+        if not isinstance(series.get("hod"), list) or len(series["hod"]) != 24:
+            series["hod"] = [0] * 24
+        for level, bucket, count in rows:
+            if level == "hod":
+                series["hod"][int(bucket)] = count
+            elif level in SERIES_LEVELS:
+                series[level][bucket] = count
+        data[section] = series
+
+    def _write_series(self, conn: sqlite3.Connection, section: str, series: Any) -> int:
+        """Переписать ряд целиком (новый ряд, свёртка часов в дни)"""
+        conn.execute(f"DELETE FROM {section}")
+        conn.execute("DELETE FROM meta WHERE key = ?", (section,))
+        if not isinstance(series, dict):
+            return 0
+        rows = [
+            (level, bucket, count)
+            for level in SERIES_LEVELS
+            for bucket, count in (series.get(level) or {}).items()
+        ]
+        rows += [("hod", str(hour), count) for hour, count in enumerate(series.get("hod") or []) if count]
+        conn.executemany(f"INSERT INTO {section} (level, bucket, count) VALUES (?, ?, ?)", rows)
+        return sum(len(level) + len(bucket) + 8 for level, bucket, _ in rows)
+
+    def _write_bucket(self, conn: sqlite3.Connection, section: str, series: Any, level: str, bucket: Any) -> int:
+        if not isinstance(series, dict):
+            return 0
+        if level == "hod":
+            count = series["hod"][bucket]
+        else:
+            count = series.get(level, {}).get(bucket)
+        bucket = str(bucket)
+        if count is None:
+            conn.execute(f"DELETE FROM {section} WHERE level = ? AND bucket = ?", (level, bucket))
+            return 0
+        conn.execute(
+            f"INSERT OR REPLACE INTO {section} (level, bucket, count) VALUES (?, ?, ?)",
+            (level, bucket, count)
+        )
+        return len(level) + len(bucket) + 8
+
+    def _write_parent(self, conn: sqlite3.Connection, section: str, key: str, row: Optional[Dict[str, Any]]) -> int:
+        """Записать строку чата или голосования без вложенных участников"""
+        field, table, parent = MEMBER_SECTIONS[section]
+        if row is None:
+            conn.execute(f"DELETE FROM {section} WHERE id = ?", (key,))
+            conn.execute(f"DELETE FROM {table} WHERE {parent} = ?", (key,))
+            return 0
+        value = _dumps({name: item for name, item in row.items() if name != field})
+        conn.execute(f"INSERT OR REPLACE INTO {section} (id, data) VALUES (?, ?)", (key, value))
+        return len(value)
+
+    def _write_member(self, conn: sqlite3.Connection, section: str, key: str, user_id: str, row: Any) -> int:
+        _, table, parent = MEMBER_SECTIONS[section]
+        if row is None:
+            conn.execute(f"DELETE FROM {table} WHERE {parent} = ? AND user_id = ?", (key, user_id))
+            return 0
+        value = _dumps(row)
+        conn.execute(
+            f"INSERT OR REPLACE INTO {table} ({parent}, user_id, data) VALUES (?, ?, ?)",
+            (key, user_id, value)
+        )
+        return len(value)
+
+    def save(self, data: Dict[str, Any], dirty: Dirty = None) -> int:
+        """
+        Записать изменения одной транзакцией.
+        dirty — набор (секция, ключ); None означает полную перезапись.
+        Возвращает примерное количество записанных байт.
+        """
+        written = 0
+        with self._lock:
+            conn = self._connect()
+            conn.execute("BEGIN")
+            try:
+                if dirty is None:
+                    conn.execute("DELETE FROM meta")
+                    for _, table, _ in MEMBER_SECTIONS.values():
+                        conn.execute(f"DELETE FROM {table}")
+                    for section in ROW_SECTIONS:
+                        conn.execute(f"DELETE FROM {section}")
+                    for section in SERIES_SECTIONS:
+                        conn.execute(f"DELETE FROM {section}")
+                    dirty = [(key, None) for key in data if key not in ROW_SECTIONS]
+                    dirty += [(section, row_id) for section in ROW_SECTIONS for row_id in data.get(section, {})]
+                    dirty += [
+                        (section, row_id, user_id)
+                        for section, (field, _, _) in MEMBER_SECTIONS.items()
+                        for row_id, row in data.get(section, {}).items()
+                        for user_id in row.get(field, {})
+                    ]
+
+                for section, key, *member in dirty:
+                    if section in SERIES_SECTIONS:
+                        if key is None:
+                            written += self._write_series(conn, section, data.get(section))
+                        else:
+                            written += self._write_bucket(conn, section, data.get(section), key, member[0])
+                        continue
+                    if section in MEMBER_SECTIONS:
+                        row = data.get(section, {}).get(key)
+                        if member:
+                            field = MEMBER_SECTIONS[section][0]
+                            value = row.get(field, {}).get(member[0]) if row else None
+                            written += self._write_member(conn, section, key, member[0], value)
+                        else:
+                            written += self._write_parent(conn, section, key, row)
+                        continue
+                    if section in ROW_SECTIONS:
+                        row = data.get(section, {}).get(key)
+                        if row is None:
+                            conn.execute(f"DELETE FROM {section} WHERE id = ?", (key,))
+                            continue
+                        value = _dumps(row)
+                        conn.execute(f"INSERT OR REPLACE INTO {section} (id, data) VALUES (?, ?)", (key, value))
+                    else:
+                        if section not in data:
+                            conn.execute("DELETE FROM meta WHERE key = ?", (section,))
+                            continue
+                        value = _dumps(data[section])
+                        conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (section, value))
+                    written += len(value)
+
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        return written
+
+    def backup(self, backup_file: str) -> None:
+        with self._lock:
+            target = sqlite3.connect(backup_file)
+            try:
+                self._connect().backup(target)
+            finally:
+                target.close()
+
+    def size(self) -> int:
+        total = 0
+        for path in (self.path, self.path + "-wal"):
+            if os.path.exists(path):
+                total += os.path.getsize(path)
+        return total
+
+    def describe(self) -> Dict[str, Any]:
+        """Краткая сводка по данным на диске без чтения всей базы"""
+        with self._lock:
+            conn = self._connect()
+            users = conn.execute("SELECT COUNT(*) FROM users").fetchone()[0]
+            chats = conn.execute("SELECT COUNT(*) FROM chats").fetchone()[0]
+            row = conn.execute("SELECT value FROM meta WHERE key = 'global_stats'").fetchone()
+        global_stats = json.loads(row[0]) if row else {}
+        return {
+            "users": users,
+            "chats": chats,
+            "total_shleps": global_stats.get("total_shleps", 0)
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+_ENGINES = {
+    JsonStorage.name: JsonStorage,
+    SqliteStorage.name: SqliteStorage
+}
+
+def get_storage(engine: str = STORAGE_ENGINE):
+    """Создать движок хранения по имени из конфига"""
+    storage_class = _ENGINES.get(engine)
+    if storage_class is None:
+        logger.warning(DATABASE_TEXTS['unknown_engine'].format(engine=engine))
+        storage_class = JsonStorage
+    return storage_class()
+
+def import_json(json_path: str = DATA_FILE, target: Optional[SqliteStorage] = None) -> Dict[str, Any]:
+    """Однократный перенос данных из mishok_data.json в SQLite"""
+    with open(json_path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+
+    data.setdefault("votes", {})
+    target = target or SqliteStorage()
+    target.save(data)
+
+    result = {
+        "users": len(data.get("users", {})),
+        "chats": len(data.get("chats", {})),
+        "votes": len(data.get("votes", {})),
+        "total_shleps": data.get("global_stats", {}).get("total_shleps", 0)
+    }
+    logger.info(DATABASE_TEXTS['sqlite_imported'].format(file=json_path, **result))
+    return result
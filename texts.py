@@ -359,7 +359,7 @@ COMMAND_TEXTS = {
 
 👥 КОМАНДЫ ДЛЯ ЧАТОВ:
  /chat_stats — Статистика активных игроков чата
- /chat_top — Топ-10 игроков в этом чате
+ /chat_top — Топ-10 игроков в этом чате (/chat_top 2 — следующая страница)
  /vote — Начать голосование в чате
  /vote_end — Завершить голосование (создатель или админ)
 
@@ -430,7 +430,8 @@ COMMAND_TEXTS = {
         'avg_shleps': "📈 Среднее на игрока: {avg}",
         'rank': "🏆 Твой ранг: {rank}",
         'percentile': "📊 Лучше чем: {percent}% игроков",
-        'last_shlep': "⏰ Последний шlёпок: {date}"
+        'last_shlep': "⏰ Последний шlёпок: {date}",
+        'favourite_hour': "🕐 Любимое время: {start:02d}:00–{end:02d}:00 ({count} шлёпков)"
     },
     
     'chat_stats': {
@@ -439,7 +440,9 @@ COMMAND_TEXTS = {
         'users': "👥 Участников: {count}",
         'shleps': "👊 Всего шlёпков: {count}",
         'record_damage': "🏆 Рекорд урона: {damage} единиц",
-        'record_user': "👑 Рекордсмен: {user}"
+        'record_user': "👑 Рекордсмен: {user}",
+        'activity_header': "📅 Активность за неделю:",
+        'activity_day': "{day} {bar} {count}"
     },
     
     'chat_top': {
@@ -447,7 +450,8 @@ COMMAND_TEXTS = {
         'header': "🏆 ТОП ШЛЁПАТЕЛЕЙ ЧАТА:\n\n",
         'item': "{medal}{rank}. {user}\n",
         'details': "   📊 {count} | Ур. {level}\n",
-        'damage': "   ⚡ Урон: {min}-{max}\n\n"
+        'damage': "   ⚡ Урон: {min}-{max}\n\n",
+        'page': "📄 Страница {page} из {pages}"
     },
     
     'welcome_group': """👴 Мишок Лысый в чате!\n\n
@@ -556,6 +560,9 @@ ADMIN_TEXTS = {
         'users': "👥 Пользователей: {count}",
         'shleps': "👊 Шлёпков: {count}",
         'integrity': "🔍 Целостность: {errors} ошибок, {warnings} предупреждений",
+        'vote_edits': "🗳️ Правки голосований: {sent} отправлено, {suppressed} склеено, {retries} ограничений",
+        'bot_rights': "🛡️ Права бота: {hits} из кэша, {misses} запросов, {updates} обновлений",
+        'deletions': "🗑️ Удаление: {requested} сообщений за {calls} запросов, {errors} ошибок",
         'all_good': "\n🎉 ВСЕ СИСТЕМЫ РАБОТАЮТ НОРМАЛЬНО",
         'attention': "\n⚠️ ТРЕБУЕТСЯ ВНИМАНИЕ АДМИНИСТРАТОРА"
     },
@@ -572,6 +579,16 @@ ADMIN_TEXTS = {
         'level_item': "Уровень {level}: {bar} {percent:.1f}% ({count} чел.)"
     },
     
+    'activity_report': {
+        'header': "📈 АКТИВНОСТЬ ИГРОКОВ\n\n",
+        'active': "👤 За сегодня: ~{dau}\n📅 За 7 дней: ~{wau}\n🗓️ За 30 дней: ~{mau}",
+        'top_header': "\n\n🏆 ЛИДЕРЫ ДНЯ:",
+        'chat_top_header': "\n\n💬 ЛИДЕРЫ ДНЯ В ЧАТЕ:",
+        'top_item': "{place}. {user} — до {count} шлёпков",
+        'top_empty': "Сегодня ещё никто не шлёпал",
+        'note': "\n\nℹ️ Оценки по вероятностным счётчикам, погрешность около 2%"
+    },
+    
     'cleanup_result': """✅ ОЧИСТКА ЗАВЕРШЕНА
 
 🗑️ Удалено файлов: {count}
@@ -606,6 +623,11 @@ ADMIN_TEXTS = {
         'db_not_exists': "🗃️ База данных: ❌ Не найдена",
         'disk': "\n💾 Свободное место на диске: {gb:.1f} GB",
         'disk_error': "\n💾 Информация о диске: доступно",
+        'persistence': "\n\n💽 Сохранение: {engine}, {status}\n⏱️ Интервал: {interval:.1f} с ({rate:.1f} изм./с)\n📝 Не сохранено изменений: {pending}\n🕒 Последнее: {duration:.1f} мс, {kb:.1f} KB\n📦 Всего записано: {total_kb:.1f} KB за {flushes} раз",
+        'persistence_running': "в фоне",
+        'persistence_stopped': "фон не запущен",
+        'persistence_fork': "\n🍴 Снимок в дочернем процессе: пауза {pause:.1f} мс{running}",
+        'persistence_fork_running': ", пишется сейчас",
         'error': "❌ Ошибка получения статистики: {error}"
     },
     
@@ -642,6 +664,9 @@ DATA_TOOLS_TEXTS = {
     'optimizing_users': "   Оптимизирую пользователей...",
     'optimizing_timestamps': "   Оптимизирую timestamps...",
     'limiting_records': "   Ограничиваю records до 5...",
+    'converting_dates': "   Перевожу даты в секунды эпохи...",
+    'converting_ballots': "   Перевожу голоса в словарь со счётчиками...",
+    'splitting_sketches': "   Выношу регистры HyperLogLog в отдельные строки...",
     'updating_counter': "   Обновляю счётчик пользователей...",
     
     'saving': "\n💾 Сохранение оптимизированного файла...",
@@ -693,6 +718,14 @@ DATA_TOOLS_TEXTS = {
     'file_backup': "   💾 Бэкап: {backup}",
     'migration_error': "⚠️ Ошибка переноса {file}: {error}",
     'no_old_data': "📭 Старые данные не найдены, будет создан новый файл",
+
+    'sqlite_title': "🗄️ ПЕРЕНОС ДАННЫХ В SQLITE",
+    'sqlite_imported': """✅ Данные перенесены в {file}
+   👥 Пользователей: {users}
+   💬 Чатов: {chats}
+   🗳️ Голосований: {votes}
+   👊 Шлёпков: {total_shleps}""",
+    'sqlite_hint': "💡 Установите STORAGE_ENGINE=sqlite в .env, чтобы бот использовал SQLite",
     
     'backup_success': "\n✅ Бэкап создан: {path}",
     'backup_failed': "\n❌ Ошибка: {error}",
@@ -702,6 +735,7 @@ DATA_TOOLS_TEXTS = {
   --fix      для исправления структуры
   --check    для проверки данных
   --backup   для создания бэкапа
+  --import-sqlite  для переноса данных в SQLite
 
 Или используйте 'python data_tools.py --help' для справки""",
     
@@ -710,7 +744,8 @@ DATA_TOOLS_TEXTS = {
   python data_tools.py --migrate    # Перенести данные
   python data_tools.py --fix        # Исправить структуру
   python data_tools.py --check      # Проверить данные
-  python data_tools.py --backup     # Создать бэкап"""
+  python data_tools.py --backup     # Создать бэкап
+  python data_tools.py --import-sqlite  # Перенести JSON в SQLite"""
 }
 
 APP_TEXTS = {
@@ -783,6 +818,7 @@ DATABASE_TEXTS = {
     'shleps_count': "   Шlёпков: {count}",
     'converting': "Конвертируем старую структуру в новую...",
     'structure_repaired': "Структура данных восстановлена",
+    'chat_records_backfilled': "Рекорды урона заполнены для чатов: {count}",
     'repair_error': "Ошибка восстановления структуры данных: {error}",
     'data_saved': "Данные сохранены на диск: {file}",
     'save_error': "Ошибка сохранения данных на диск: {error}",
@@ -806,12 +842,34 @@ DATABASE_TEXTS = {
     'user_stats_error': "Ошибка в get_user_stats: {error}",
     'chat_stats_error': "Ошибка в get_chat_stats: {error}",
     'chat_top_error': "Ошибка в get_chat_top_users: {error}",
+    'comparison_stats_error': "Ошибка сравнения статистики: {error}",
+    'activity_summary_error': "Ошибка сводки по игрокам: {error}",
+    'activity_sketches_error': "Ошибка счётчиков активности: {error}",
+    'activity_chart_error': "Ошибка графика активности: {error}",
+    'timestamps_migrated': "Счётчики по дням перенесены во временной ряд: {days} дней",
+    'epoch_migrated': "Даты переведены в секунды эпохи: {count} полей",
+    'ballots_migrated': "Голоса переведены в словарь со счётчиками: {count} голосований",
+    'sketches_migrated': "Регистры HyperLogLog вынесены в отдельные строки: {count} дней",
     'create_vote_error': "Ошибка создания голосования: {error}",
     'add_vote_error': "Ошибка добавления голоса: {error}",
     'finish_vote_error': "Ошибка завершения голосования: {error}",
+    'pending_votes_error': "Ошибка чтения незавершённых голосований: {error}",
     'cleanup_votes': "Очищено {count} старых голосований",
     'cleanup_votes_error': "Ошибка очистки голосований: {error}",
     'integrity_error': "Ошибка в check_data_integrity: {error}",
+    'storage_engine': "Движок хранения данных: {engine} ({file})",
+    'unknown_engine': "Неизвестный движок хранения '{engine}', используется json",
+    'sqlite_imported': "Данные из {file} перенесены в SQLite: {users} пользователей, {chats} чатов, {votes} голосований, {total_shleps} шлёпков",
+    'sqlite_import_error': "Ошибка переноса данных в SQLite: {error}",
+    'flush_lock_timeout': "Не удалось дождаться блокировки данных для сохранения",
+    'journal_replayed': "Из журнала восстановлено событий: {count}",
+    'journal_replay_error': "Ошибка повтора события журнала {event}: {error}",
+    'journal_bad_line': "Пропущена повреждённая строка журнала №{line}",
+    'background_flush': "Фоновое сохранение: {count} изменений за {seconds:.3f} с, {bytes} байт",
+    'background_flush_error': "Ошибка фонового сохранения: {error}",
+    'flusher_started': "Фоновое сохранение запущено (интервал {low:g}-{high:g} с)",
+    'bgsave_done': "Снимок в дочернем процессе записан за {seconds:.3f} с (пауза {pause:.1f} мс), {bytes} байт",
+    'bgsave_failed': "Снимок в дочернем процессе не записан, будет повторён",
     'ready': "База данных с упрощёнными голосованиями готова к работе"
 }
 
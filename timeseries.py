@@ -0,0 +1,112 @@
+"""
+Компактные временные ряды шлёпков
+
+Ряд — словарь из трёх уровней и почасового профиля:
+  "h"   — по часам за последние HOURLY_DAYS дней   {"YYYY-MM-DDTHH": n}
+  "d"   — по дням за последние DAILY_DAYS дней     {"YYYY-MM-DD": n}
+  "m"   — по месяцам для всего, что старше         {"YYYY-MM": n}
+  "hod" — шлёпки по часу суток за всё время        [n0, ..., n23]
+
+С началом нового часа устаревшие часы сворачиваются в дни, а дни — в месяцы,
+поэтому ряд не растёт больше HOURLY_DAYS * 24 + DAILY_DAYS ключей плюс месяцы
+(для игроков и чатов — ROW_HOURLY_DAYS и ROW_DAILY_DAYS).
+Ряды — обычные словари: хранятся в данных бота и повторяются журналом.
+Моменты шлёпков приходят целыми секундами эпохи; ключ часа считается
+один раз на час и дальше берётся из кеша.
+"""
+
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+HOURLY_DAYS = 7
+DAILY_DAYS = 90
+
+# Ряды игроков и чатов копируются в снимок с каждой их строкой, поэтому короче:
+# часы за сутки и дни за месяц (график недели и любимое время этого хватает)
+ROW_HOURLY_DAYS = 1
+ROW_DAILY_DAYS = 31
+
+Series = Dict[str, Any]
+
+# Час последнего шлёпка: (начало, конец, "YYYY-MM-DDTHH", час суток)
+_clock: Tuple[int, int, str, int] = (0, 0, "", 0)
+
+def new_series() -> Series:
+    return {"h": {}, "d": {}, "m": {}, "hod": [0] * 24}
+
+def is_series(value: Any) -> bool:
+    """Похоже ли значение на ряд (а не на повреждённую запись)"""
+    return (isinstance(value, dict) and isinstance(value.get("h"), dict)
+            and isinstance(value.get("d"), dict) and isinstance(value.get("m"), dict)
+            and isinstance(value.get("hod"), list) and len(value["hod"]) == 24)
+
+def hour_key(moment: int) -> Tuple[str, int]:
+    """Ключ часа "YYYY-MM-DDTHH" и час суток для момента (секунды эпохи)"""
+    global _clock
+    start, end, key, hour = _clock
+    if start <= moment < end:
+        return key, hour
+    local = datetime.fromtimestamp(moment).replace(minute=0, second=0, microsecond=0)
+    start = int(local.timestamp())
+    key, hour = local.isoformat()[:13], local.hour
+    _clock = (start, start + 3600, key, hour)
+    return key, hour
+
+def day_key(moment: int) -> str:
+    """Ключ дня "YYYY-MM-DD" для момента (секунды эпохи)"""
+    return hour_key(moment)[0][:10]
+
+def add(series: Series, now: int, count: int = 1,
+        hourly_days: int = HOURLY_DAYS, daily_days: int = DAILY_DAYS) -> None:
+    """Учесть шлёпки в момент now (секунды эпохи)"""
+    hourly = series["h"]
+    hour, hour_of_day = hour_key(now)
+    if hour not in hourly:
+        _downsample(series, datetime.fromtimestamp(now), hourly_days, daily_days)
+        hourly[hour] = 0
+    hourly[hour] += count
+    series["hod"][hour_of_day] += count
+
+def add_row(series: Series, now: int) -> None:
+    """Шлёпок в ряд игрока или чата"""
+    add(series, now, 1, ROW_HOURLY_DAYS, ROW_DAILY_DAYS)
+
+def _downsample(series: Series, moment: datetime, hourly_days: int, daily_days: int) -> None:
+    """Свернуть устаревшие часы в дни, а дни — в месяцы"""
+    hourly, daily, monthly = series["h"], series["d"], series["m"]
+
+    hour_cutoff = (moment - timedelta(days=hourly_days)).isoformat()[:13]
+    for key in [key for key in hourly if key < hour_cutoff]:
+        daily[key[:10]] = daily.get(key[:10], 0) + hourly.pop(key)
+
+    day_cutoff = (moment - timedelta(days=daily_days)).isoformat()[:10]
+    for key in [key for key in daily if key < day_cutoff]:
+        monthly[key[:7]] = monthly.get(key[:7], 0) + daily.pop(key)
+
+def from_days(counts: Dict[str, int], today: Optional[date] = None) -> Series:
+    """Ряд из старого словаря {"YYYY-MM-DD": n} (часы и профиль неизвестны)"""
+    series = new_series()
+    day_cutoff = ((today or date.today()) - timedelta(days=DAILY_DAYS)).isoformat()
+    for day, count in counts.items():
+        if not isinstance(count, int):
+            continue
+        if day < day_cutoff:
+            series["m"][day[:7]] = series["m"].get(day[:7], 0) + count
+        else:
+            series["d"][day] = series["d"].get(day, 0) + count
+    return series
+
+def daily_counts(series: Series, days: Iterable[str]) -> List[Tuple[str, int]]:
+    """Шлёпки по дням (дни, ушедшие в месяцы, считаются нулём)"""
+    totals = dict(series.get("d", {}))
+    for hour, count in series.get("h", {}).items():
+        totals[hour[:10]] = totals.get(hour[:10], 0) + count
+    return [(day, totals.get(day, 0)) for day in days]
+
+def favourite_hour(series: Optional[Series]) -> Optional[Tuple[int, int]]:
+    """Час суток с наибольшим числом шлёпков: (час, шлёпки)"""
+    profile = (series or {}).get("hod") or []
+    if not any(profile):
+        return None
+    hour = max(range(len(profile)), key=profile.__getitem__)
+    return hour, profile[hour]
@@ -1,8 +1,12 @@
 import asyncio
 import logging
-from typing import Any, Dict
+import time
 from datetime import datetime
-from database import load_data
+from typing import Any, Awaitable, Callable, Dict, Hashable, List
+
+from telegram.error import RetryAfter
+
+from config import VOTE_EDIT_WINDOW, BOT_RIGHTS_TTL, DELETE_BATCH_WINDOW
 
 logger = logging.getLogger(__name__)
 
@@ -33,6 +37,13 @@ class SimpleCache:
                 del self._cache[key]
             return True
     
+    async def delete_many(self, *keys: str) -> bool:
+        """Удалить несколько значений за один захват блокировки"""
+        async with self._lock:
+            for key in keys:
+                self._cache.pop(key, None)
+            return True
+    
     async def clear(self) -> bool:
         """Очистить весь кэш"""
         async with self._lock:
@@ -42,69 +53,245 @@ class SimpleCache:
 # Глобальный экземпляр кэша
 cache = SimpleCache()
 
-# ==================== СТАТИСТИКА ====================
+# ==================== ПРАВКИ СООБЩЕНИЙ ====================
 
-def get_comparison_stats(user_id: int) -> Dict[str, Any]:
-    """Сравнивает статистику пользователя с другими игроками"""
-    try:
-        data = load_data()
-        all_users = data.get("users", {})
-        
-        if not all_users:
-            return {
-                "total_users": 0,
-                "avg_shleps": 0,
-                "rank": 1,
-                "percentile": 100
-            }
+class EditCoalescer:
+    """
+    Склейка правок одного сообщения: первая правка уходит сразу, следующие
+    в течение окна схлопываются в одну правку последнего состояния.
+    Правка с уже показанным состоянием не отправляется.
+    """
+    
+    def __init__(self, window: float):
+        self.window = window
+        # ключ сообщения -> отправленное и ожидающее состояние, время следующей правки, задача
+        self._slots: Dict[Hashable, Dict[str, Any]] = {}
+        self.stats = {"requested": 0, "sent": 0, "coalesced": 0, "unchanged": 0, "retry_after": 0, "errors": 0}
+    
+    async def submit(self, key: Hashable, state: Hashable, edit: Callable[[Hashable], Awaitable[Hashable]]) -> None:
+        """
+        Запросить правку сообщения key до состояния state.
+        edit(показанное) строит текст из текущих данных, правит сообщение,
+        если состояние изменилось, и возвращает состояние, которое теперь показано.
+        """
+        self.stats["requested"] += 1
+        slot = self._slots.get(key)
+        if slot is None:
+            slot = self._slots[key] = {"sent": None, "pending": None, "ready_at": 0.0, "task": None}
         
-        user_data = all_users.get(str(user_id))
-        user_shleps = user_data.get("total_shleps", 0) if user_data else 0
+        if slot["pending"] is not None:
+            self.stats["coalesced"] += 1
+        slot["pending"] = (state, edit)
         
-        all_shleps = []
-        for uid, udata in all_users.items():
-            if "total_shleps" in udata:
-                all_shleps.append(udata["total_shleps"])
+        if slot["task"] is None:
+            slot["task"] = asyncio.create_task(self._flush(slot))
+    
+    def forget(self, key: Hashable) -> None:
+        """Сообщение больше не правится (голосование завершено): отменить ожидающую правку"""
+        slot = self._slots.pop(key, None)
+        if slot and slot["task"] is not None:
+            slot["task"].cancel()
+    
+    async def _flush(self, slot: Dict[str, Any]) -> None:
+        loop = asyncio.get_running_loop()
+        try:
+            while slot["pending"] is not None:
+                delay = slot["ready_at"] - loop.time()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                
+                state, edit = slot["pending"]
+                slot["pending"] = None
+                if state == slot["sent"]:
+                    self.stats["unchanged"] += 1
+                    continue
+                
+                try:
+                    shown = await edit(slot["sent"])
+                    if shown == slot["sent"]:
+                        self.stats["unchanged"] += 1
+                        continue
+                    slot["sent"] = shown
+                    self.stats["sent"] += 1
+                    slot["ready_at"] = loop.time() + self.window
+                except RetryAfter as e:
+                    # Ограничение Telegram: повторим последнее состояние после паузы
+                    self.stats["retry_after"] += 1
+                    logger.warning(f"Flood limit при правке сообщения: ждём {e.retry_after} сек")
+                    slot["ready_at"] = loop.time() + e.retry_after
+                    if slot["pending"] is None:
+                        slot["pending"] = (state, edit)
+                except Exception as e:
+                    if "Message is not modified" in str(e):
+                        self.stats["unchanged"] += 1
+                    else:
+                        self.stats["errors"] += 1
+                        logger.error(f"Ошибка правки сообщения: {e}")
+        finally:
+            slot["task"] = None
+    
+    @property
+    def suppressed(self) -> int:
+        """Сколько запрошенных правок не ушло в Telegram"""
+        return self.stats["coalesced"] + self.stats["unchanged"]
+
+# Правки сообщений голосований
+vote_edits = EditCoalescer(VOTE_EDIT_WINDOW)
+
+# ==================== ПРАВА БОТА ====================
+
+def can_delete_messages(member: Any) -> bool:
+    """Может ли участник (бот) удалять чужие сообщения"""
+    if member.status == "creator":
+        return True
+    return bool(getattr(member, "can_delete_messages", False))
+
+class BotRights:
+    """
+    Права бота в чатах с TTL: одна проверка get_chat_member на чат,
+    дальше ответ из памяти. Изменение прав приходит апдейтом my_chat_member
+    и сразу заменяет запись, TTL страхует от пропущенных апдейтов.
+    """
+    
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        # chat_id -> (истекает, может удалять)
+        self._rights: Dict[int, tuple] = {}
+        # Запросы в полёте: одновременные промахи по чату ждут один ответ
+        self._pending: Dict[int, asyncio.Future] = {}
+        self.stats = {"hits": 0, "misses": 0, "updates": 0}
+    
+    async def can_delete(self, bot: Any, chat_id: int) -> bool:
+        """Может ли бот удалять сообщения в чате"""
+        entry = self._rights.get(chat_id)
+        if entry is not None and entry[0] > time.monotonic():
+            self.stats["hits"] += 1
+            return entry[1]
         
-        if not all_shleps:
-            return {
-                "total_users": len(all_users),
-                "avg_shleps": 0,
-                "rank": 1,
-                "percentile": 100
-            }
+        pending = self._pending.get(chat_id)
+        if pending is not None:
+            self.stats["hits"] += 1
+            try:
+                return await asyncio.shield(pending)
+            except asyncio.CancelledError:
+                if not pending.cancelled():
+                    raise
+                # Запрос, которого ждали, отменён вместе со своей задачей: спросим сами
+                return await self.can_delete(bot, chat_id)
         
-        total_users = len(all_shleps)
-        avg_shleps = sum(all_shleps) / total_users
+        self.stats["misses"] += 1
+        future = self._pending[chat_id] = asyncio.get_running_loop().create_future()
+        try:
+            member = await bot.get_chat_member(chat_id, bot.id)
+            allowed = can_delete_messages(member)
+            self._rights[chat_id] = (time.monotonic() + self.ttl, allowed)
+            future.set_result(allowed)
+            return allowed
+        except Exception as e:
+            future.set_exception(e)
+            # Ожидающих может не быть: помечаем ошибку полученной
+            future.exception()
+            raise
+        finally:
+            if self._pending.get(chat_id) is future:
+                del self._pending[chat_id]
+            if not future.done():
+                # Задачу отменили посреди запроса: ожидающие не должны зависнуть
+                future.cancel()
+    
+    def update(self, chat_id: int, member: Any) -> None:
+        """Новые права бота из апдейта my_chat_member"""
+        self.stats["updates"] += 1
+        self._rights[chat_id] = (time.monotonic() + self.ttl, can_delete_messages(member))
+    
+    def forget(self, chat_id: int) -> None:
+        """Права в чате под вопросом (удаление не удалось): спросить заново"""
+        self._rights.pop(chat_id, None)
+
+# Права бота на удаление сообщений
+bot_rights = BotRights(BOT_RIGHTS_TTL)
+
+# ==================== УДАЛЕНИЕ СООБЩЕНИЙ ====================
+
+# Telegram удаляет не больше 100 сообщений одним delete_messages
+DELETE_BATCH_LIMIT = 100
+
+class MessageDeleter:
+    """
+    Пакетное удаление сообщений: номера сообщений чата копятся в течение окна
+    и уходят одним delete_messages (полная пачка — сразу). Если пачка не
+    удалилась, сообщения удаляются по одному.
+    """
+    
+    def __init__(self, window: float, limit: int = DELETE_BATCH_LIMIT):
+        self.window = window
+        self.limit = limit
+        # chat_id -> номера сообщений, ждущих удаления, и таймер пачки
+        self._queues: Dict[int, List[int]] = {}
+        self._timers: Dict[int, asyncio.Task] = {}
+        self.stats = {"requested": 0, "batches": 0, "singles": 0, "fallbacks": 0, "errors": 0}
+    
+    async def submit(self, bot: Any, chat_id: int, message_id: int) -> None:
+        """Поставить сообщение в очередь на удаление"""
+        self.stats["requested"] += 1
+        queue = self._queues.setdefault(chat_id, [])
+        queue.append(message_id)
         
-        sorted_shleps = sorted(all_shleps, reverse=True)
+        if len(queue) >= self.limit:
+            del self._queues[chat_id]
+            await self._delete(bot, chat_id, queue)
+        elif chat_id not in self._timers:
+            self._timers[chat_id] = asyncio.create_task(self._flush_later(bot, chat_id))
+    
+    async def _flush_later(self, bot: Any, chat_id: int) -> None:
+        try:
+            await asyncio.sleep(self.window)
+            queue = self._queues.pop(chat_id, None)
+        finally:
+            self._timers.pop(chat_id, None)
+        if queue:
+            await self._delete(bot, chat_id, queue)
+    
+    async def _delete(self, bot: Any, chat_id: int, message_ids: List[int]) -> None:
+        if len(message_ids) > 1:
+            try:
+                await bot.delete_messages(chat_id, message_ids)
+                self.stats["batches"] += 1
+                logger.info(f"Удалено пачкой {len(message_ids)} сообщений в чате {chat_id}")
+                return
+            except Exception as e:
+                self.stats["fallbacks"] += 1
+                logger.warning(f"Пакетное удаление в чате {chat_id} не удалось, удаляем по одному: {e}")
         
+        for message_id in message_ids:
+            try:
+                await bot.delete_message(chat_id, message_id)
+                self.stats["singles"] += 1
+            except Exception as e:
+                self.stats["errors"] += 1
+                bot_rights.forget(chat_id)
+                logger.error(f"Не удалось удалить сообщение {message_id} в чате {chat_id}: {e}")
+    
+    @property
+    def api_calls(self) -> int:
+        """Сколько запросов к Telegram ушло на удаление"""
+        return self.stats["batches"] + self.stats["fallbacks"] + self.stats["singles"] + self.stats["errors"]
+
+# Удаление сообщений забаненных пользователей и сообщений с банвордами
+message_deleter = MessageDeleter(DELETE_BATCH_WINDOW)
+
+# ==================== ВРЕМЯ ====================
+
+def to_epoch(value: Any) -> int:
+    """Момент как целые секунды эпохи (0 — не было)"""
+    if isinstance(value, (int, float)):
+        return int(value)
+    if isinstance(value, str) and value:
         try:
-            rank = sorted_shleps.index(user_shleps) + 1
+            return int(datetime.fromisoformat(value).timestamp())
         except ValueError:
-            rank = total_users + 1
-        
-        if total_users > 1:
-            behind = total_users - rank
-            percentile = (behind / (total_users - 1)) * 100
-        else:
-            percentile = 100
-        
-        return {
-            "total_users": total_users,
-            "avg_shleps": round(avg_shleps, 1),
-            "rank": rank,
-            "percentile": round(percentile, 1)
-        }
-    
-    except Exception as e:
-        logger.error(f"Ошибка сравнения статистики: {e}")
-        return {
-            "total_users": 0,
-            "avg_shleps": 0,
-            "rank": 1,
-            "percentile": 100
-        }
+            return 0
+    return 0
 
 # ==================== ФОРМАТИРОВАНИЕ ====================
 
@@ -0,0 +1,74 @@
+"""
+Поиск банвордов в сообщении за один проход
+
+Слова чата собираются в префиксное дерево, а дерево — в одно регулярное
+выражение: у каждого узла альтернативы начинаются с разных символов, поэтому
+движок re идёт по дереву без перебора слов. Проверка сообщения стоит
+O(длина текста), а не O(слов × длина текста), как у цикла с `in`.
+
+Нужно только знать, есть ли в тексте хотя бы одно слово, поэтому продолжения
+более короткого слова («шлёп» и «шлёпок») в дерево не попадают.
+"""
+
+import re
+from typing import Dict, Iterable, Optional
+
+# Конец слова в узле дерева
+_END = ""
+
+def _build_trie(words: Iterable[str]) -> Dict[str, dict]:
+    root: Dict[str, dict] = {}
+    for word in sorted(set(words), key=len):
+        node = root
+        for char in word:
+            if _END in node:
+                break
+            node = node.setdefault(char, {})
+        else:
+            # Слово короче прежних продолжений: они больше не нужны
+            node.clear()
+            node[_END] = {}
+    return root
+
+def _pattern(node: Dict[str, dict]) -> str:
+    if _END in node:
+        return ""
+
+    branches = []
+    singles = []
+    for char in sorted(node):
+        tail = _pattern(node[char])
+        if tail:
+            branches.append(re.escape(char) + tail)
+        else:
+            singles.append(re.escape(char))
+
+    if singles:
+        branches.append(singles[0] if len(singles) == 1 else "[" + "".join(singles) + "]")
+    return branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+
+class WordMatcher:
+    """Скомпилированный набор банвордов чата (слова приводятся к нижнему регистру)"""
+
+    __slots__ = ("words", "version", "_regex")
+
+    def __init__(self, words: Iterable[str], version: int = 0):
+        self.words = tuple(word.lower() for word in words)
+        self.version = version
+        trie = _build_trie(self.words)
+        try:
+            pattern = _pattern(trie)
+        except RecursionError:
+            # Слово длиннее предела рекурсии: простое перечисление слов
+            pattern = "|".join(map(re.escape, sorted(set(self.words), key=len)))
+        self._regex = re.compile(pattern) if trie else None
+
+    def __len__(self) -> int:
+        return len(self.words)
+
+    def search(self, text: str) -> Optional[str]:
+        """Первый найденный банворд в тексте (текст уже в нижнем регистре)"""
+        if self._regex is None:
+            return None
+        match = self._regex.search(text)
+        return match.group() if match else None